@@ -17,6 +17,14 @@ from datetime import timezone
 from werkzeug import exceptions
 from ..query.access_card_edit_logs import access_card_edit_logs
 from ..utils.array_to_csv_flask_response import array_to_csv_flask_response
+from ..utils.stream_csv_flask_response import stream_csv_flask_response
+from ..cache import access_card_index
+from ..query.access_allowlists import refresh_access_allowlists
+from ..unit_of_work import after_commit
+from ..bulk_import import import_access_cards_csv, \
+    refresh_imported_caches
+from ..utils.csv_upload_stream import csv_upload_stream
+from ..utils.conditional_get import conditional_get
 
 access_cards = Blueprint('access_cards', __name__)
 
@@ -37,7 +45,6 @@ def log_access_card_change(
         emerge_access_level=emerge_access_level
     )
     db.session.add(access_card_log)
-    db.session.commit()
 
 
 # create a new access card
@@ -79,7 +86,7 @@ def create_access_card():
         if (status):
             access_card.status = status
         db.session.add(access_card)
-        db.session.commit()
+        db.session.flush()
 
         # get full data
         db.session.refresh(access_card)
@@ -146,7 +153,9 @@ def update_access_card(access_card_id):
             access_card.status = status
         access_card.last_updated_by_user_id = current_user.id
         access_card.last_updated_at = datetime.now(timezone.utc)
-        db.session.commit()
+        db.session.flush()
+        after_commit(access_card_index.refresh_access_card, access_card.id)
+        after_commit(refresh_access_allowlists)
 
         # return the latest data in database
         db.session.refresh(access_card)
@@ -211,7 +220,7 @@ def archive_access_card(access_card_id):
 
         # archive access card
         access_card.status = AccessCardStatusEnum.ARCHIVED
-        db.session.commit()
+        after_commit(access_card_index.refresh_access_card, access_card.id)
 
         # clear access card assignments to user if applicable
         user_access_card = UserAccessCard.query.filter_by(
@@ -219,7 +228,7 @@ def archive_access_card(access_card_id):
         ).first()
         if (user_access_card):
             user_access_card.delete()
-            db.session.commit()
+        after_commit(refresh_access_allowlists)
 
         # log access card change
         log_access_card_change(
@@ -238,9 +247,84 @@ def archive_access_card(access_card_id):
         abort(500, 'an unknown error occurred')
 
 
+# import access cards from a CSV file, each optionally assigned to an
+# existing user. Rows are saved in batches, rows with errors are skipped and
+# listed in the response.
+@app.route("/api/accessCards/import", methods=["POST"])
+@jwt_required()
+def import_access_cards():
+    role_required([UserRoleEnum.ADMIN])
+
+    try:
+        results = import_access_cards_csv(
+            csv_upload_stream(),
+            current_user.id
+        )
+
+        return jsonify(results)
+    except ValueError as err:
+        abort(422, err)
+    except Exception:
+        abort(500, 'an unknown error occurred')
+    finally:
+        # the batches are committed as they're imported, the ones before a
+        # failure are saved too
+        refresh_imported_caches()
+
+
+# API-formatted response for an access card in a list
+def access_card_list_res(access_card):
+    card_obj = {
+        'id': access_card.id,
+        'cardNumber': access_card.card_number,
+        'facilityCode': access_card.facility_code,
+        'cardType': access_card.card_type,
+        'status': access_card.status,
+        'createdAt': access_card.created_at.isoformat(),
+        'lastUpdatedAt': access_card.last_updated_at.isoformat(),
+        'lastUpdatedByUserId': access_card.last_updated_by_user_id,
+        'lastUpdatedByFirstName': access_card.last_updated_by_first_name,
+        'lastUpdatedByLastName': access_card.last_updated_by_last_name,
+    }
+
+    # only send assignment values if present
+    if access_card.to_first_name:
+        card_obj['assignedToFirstName'] = access_card.to_first_name
+        card_obj['assignedToLastName'] = access_card.to_last_name
+        card_obj['assignedToUserId'] = access_card.assigned_to_user_id
+        card_obj['assignedByFirstName'] = access_card.by_first_name
+        card_obj['assignedByLastName'] = access_card.by_last_name
+        card_obj['assignedByUserId'] = access_card.assigned_by_user_id
+
+    return card_obj
+
+
+# csv columns for access_card_list_res, assignment values are optional so
+# a streamed export can't rely on the first row having every column
+access_card_csv_columns = [
+    'id',
+    'cardNumber',
+    'facilityCode',
+    'cardType',
+    'status',
+    'createdAt',
+    'lastUpdatedAt',
+    'lastUpdatedByUserId',
+    'lastUpdatedByFirstName',
+    'lastUpdatedByLastName',
+    'assignedToFirstName',
+    'assignedToLastName',
+    'assignedToUserId',
+    'assignedByFirstName',
+    'assignedByLastName',
+    'assignedByUserId'
+]
+
+
 # return a list of access cards
 @app.route("/api/accessCards", methods=["GET"])
 @jwt_required()
+@conditional_get('access_card', 'user_access_card', 'user')
 def read_access_cards():
     role_required([UserRoleEnum.ADMIN, UserRoleEnum.EDITOR])
 
@@ -350,6 +434,16 @@ def read_access_cards():
             isouter=True
         )
 
+    # stream every matching access card as csv, ignoring pagination
+    if content_type == 'text/csv' \
+            and request.args.get('stream') in ['1', 'true']:
+        rows = query.order_by(order_by) \
+            .yield_per(app.config['STREAM_CHUNK_SIZE'])
+        return stream_csv_flask_response(
+            (access_card_list_res(access_card) for access_card in rows),
+            fieldnames=access_card_csv_columns
+        )
+
     results = query \
         .order_by(order_by) \
         .paginate(
@@ -359,31 +453,9 @@ def read_access_cards():
             error_out=False
         )
 
-    access_cards = []
-    for access_card in results:
-        card_obj = {
-            'id': access_card.id,
-            'cardNumber': access_card.card_number,
-            'facilityCode': access_card.facility_code,
-            'cardType': access_card.card_type,
-            'status': access_card.status,
-            'createdAt': access_card.created_at.isoformat(),
-            'lastUpdatedAt': access_card.last_updated_at.isoformat(),
-            'lastUpdatedByUserId': access_card.last_updated_by_user_id,
-            'lastUpdatedByFirstName': access_card.last_updated_by_first_name,
-            'lastUpdatedByLastName': access_card.last_updated_by_last_name,
-        }
-
-        # only send assignment values if present
-        if access_card.to_first_name:
-            card_obj['assignedToFirstName'] = access_card.to_first_name
-            card_obj['assignedToLastName'] = access_card.to_last_name
-            card_obj['assignedToUserId'] = access_card.assigned_to_user_id
-            card_obj['assignedByFirstName'] = access_card.by_first_name
-            card_obj['assignedByLastName'] = access_card.by_last_name
-            card_obj['assignedByUserId'] = access_card.assigned_by_user_id
-
-        access_cards.append(card_obj)
+    access_cards = [
+        access_card_list_res(access_card) for access_card in results
+    ]
 
     if content_type == 'text/csv':
         return array_to_csv_flask_response(access_cards)
@@ -394,28 +466,27 @@ def read_access_cards():
 # related reporting
 @app.route("/api/accessCards/<access_card_id>", methods=["GET"])
 @jwt_required()
+@conditional_get('access_card', 'user_access_card', 'user', 'access_card_log')
 def read_access_card_view(access_card_id):
     if (not access_card_id):
         abort(422, 'missing access card id e.g. /api/accessCards/CARD-ID')
 
     try:
-        # find
-        access_card = AccessCard.query \
-            .filter_by(id=access_card_id) \
+        # find, along with the assigned user if assigned
+        access_card_result = db.session.query(AccessCard, User) \
+            .outerjoin(
+                UserAccessCard,
+                UserAccessCard.access_card_id == AccessCard.id
+            ) \
+            .outerjoin(User, User.id == UserAccessCard.assigned_to_user_id) \
+            .filter(AccessCard.id == access_card_id) \
             .first()
 
-        if not access_card:
+        if not access_card_result:
             abort(404, 'unable to find an access card with that id')
+        access_card, user = access_card_result
 
-        # get assigned user if assigned
         assigned_user = {}
-        user = User.query \
-            .join(
-                UserAccessCard,
-                User.id == UserAccessCard.assigned_to_user_id
-            ) \
-            .filter_by(access_card_id=access_card_id) \
-            .first()
         if user:
             assigned_user = {
                 'id': user.id,
@@ -508,7 +579,8 @@ def assign_access_card(access_card_id):
             assigned_by_user_id=current_user.id
         )
         db.session.add(user_access_card)
-        db.session.commit()
+        after_commit(access_card_index.refresh_access_card, access_card.id)
+        after_commit(refresh_access_allowlists)
 
         # log access card change
         log_access_card_change(
@@ -574,12 +646,12 @@ def unassign_access_card(access_card_id):
 
         # unassign card from user
         db.session.delete(user_access_card)
-        db.session.commit()
 
         # make card inactive (if active)
         if (access_card.status == AccessCardStatusEnum.ACTIVE):
             access_card.status = AccessCardStatusEnum.INACTIVE
-            db.session.commit()
+        after_commit(access_card_index.refresh_access_card, access_card.id)
+        after_commit(refresh_access_allowlists)
 
         # log access card change
         log_access_card_change(
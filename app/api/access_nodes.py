@@ -1,5 +1,5 @@
-from ..models import AccessNode, Device, UserAccessCard, AccessCard, \
-    AccessNodeLog
+from ..models import AccessNode, Device, AccessCard, UserAccessCard, \
+    AccessNodeLog, uuid_str
 from ..model_enums import DeviceTypeEnum, UserRoleEnum, \
     AccessNodeStatusEnum, AccessNodeScanActionEnum
 from ..app import db
@@ -12,9 +12,22 @@ from flask import abort
 from flask_jwt_extended import jwt_required
 from flask_jwt_extended import current_user
 from sqlalchemy import exc
+from sqlalchemy import insert
+from datetime import datetime
+from datetime import timezone
 from werkzeug import exceptions
 from ..query.device_access_logs import device_access_logs
 from ..utils.array_to_csv_flask_response import array_to_csv_flask_response
+from ..utils.stream_csv_flask_response import stream_csv_flask_response
+from ..utils.conditional_get import conditional_get
+from ..cache import access_card_index
+from ..background.access_node_log_writer import write_access_node_log
+from ..query.device_usage import mark_device_usage_stale
+from ..query.device_sessions import mark_device_sessions_stale
+from ..query.access_allowlists import access_allowlist_snapshot, \
+    access_allowlist_delta, access_allowlist_version
+from ..unit_of_work import after_commit
+from ..metrics import scans as scan_counter
 
 
 access_nodes = Blueprint('access_nodes', __name__)
@@ -54,10 +67,11 @@ def create_access_node():
             device_id=device_id
         )
         db.session.add(access_node)
-        db.session.commit()
+        db.session.flush()
 
         # get full data
         db.session.refresh(access_node)
+        after_commit(access_card_index.refresh_access_node, access_node.id)
 
         return jsonify(
             id=access_node.id,
@@ -127,7 +141,8 @@ def update_access_node(access_node_id):
             access_node.device_id = device_id
         if status:
             access_node.status = status
-        db.session.commit()
+        db.session.flush()
+        after_commit(access_card_index.refresh_access_node, access_node.id)
 
         # return the latest data in database
         db.session.refresh(access_node)
@@ -162,7 +177,7 @@ def archive_access_node(access_node_id):
 
         # archive access node
         access_node.status = AccessNodeStatusEnum.ARCHIVED
-        db.session.commit()
+        after_commit(access_card_index.refresh_access_node, access_node.id)
 
         return jsonify(message='access node archived')
     except exceptions.NotFound as err:
@@ -171,9 +186,23 @@ def archive_access_node(access_node_id):
         abort(500, 'an unknown error occurred')
 
 
+# API-formatted response for an access node in a list
+def access_node_list_res(access_node):
+    return {
+        'id': access_node.id,
+        'name': access_node.name,
+        'type': access_node.type,
+        'status': access_node.status,
+        'macAddress': access_node.mac_address,
+        'createdAt': access_node.created_at.isoformat(),
+        'deviceId': access_node.device_id,
+    }
+
+
 # return a list of access nodes
 @app.route("/api/accessNodes", methods=["GET"])
 @jwt_required()
+@conditional_get('access_node')
 def read_access_nodes():
     role_required([UserRoleEnum.ADMIN, UserRoleEnum.EDITOR])
 
@@ -224,6 +253,15 @@ def read_access_nodes():
     if request.args.get('orderDir') == 'desc':
         order_by = order_by.desc()
 
+    # stream every matching access node as csv, ignoring pagination
+    if content_type == 'text/csv' \
+            and request.args.get('stream') in ['1', 'true']:
+        rows = query.order_by(order_by) \
+            .yield_per(app.config['STREAM_CHUNK_SIZE'])
+        return stream_csv_flask_response(
+            access_node_list_res(access_node) for access_node in rows
+        )
+
     # page
     page = 1
     if (request.args.get('page')):
@@ -245,17 +283,9 @@ def read_access_nodes():
             error_out=False
         )
 
-    access_nodes = []
-    for access_node in results:
-        access_nodes.append({
-            'id': access_node.id,
-            'name': access_node.name,
-            'type': access_node.type,
-            'status': access_node.status,
-            'macAddress': access_node.mac_address,
-            'createdAt': access_node.created_at.isoformat(),
-            'deviceId': access_node.device_id,
-        })
+    access_nodes = [
+        access_node_list_res(access_node) for access_node in results
+    ]
 
     if content_type == 'text/csv':
         return array_to_csv_flask_response(access_nodes)
@@ -266,20 +296,22 @@ def read_access_nodes():
 # useful for a UI detail page and related reporting
 @app.route("/api/accessNodes/<access_node_id>", methods=["GET"])
 @jwt_required()
+@conditional_get('access_node', 'device', 'user', 'access_node_log')
 def read_access_node_view(access_node_id):
     if (not access_node_id):
         abort(422, 'missing access node id e.g. /api/accessNodes/NODE-ID')
 
     try:
-        # find
-        access_node = AccessNode.query.filter_by(id=access_node_id).first()
+        # find, along with the device assigned to the access node
+        access_node_result = db.session.query(AccessNode, Device) \
+            .outerjoin(Device, Device.id == AccessNode.device_id) \
+            .filter(AccessNode.id == access_node_id) \
+            .first()
 
-        if not access_node:
+        if not access_node_result:
             abort(404, 'unable to find a device with that id')
+        access_node, device = access_node_result
 
-        # device assigned to access node
-        device = Device.query \
-            .filter_by(id=access_node.device_id).first()
         device_res = {}
         if device:
             device_res = {
@@ -323,6 +355,7 @@ def scan_access_node(access_node_id):
     role_required([UserRoleEnum.ADMIN])
 
     access_card_number = request.json.get("accessCardNumber", None)
+    facility_code = request.json.get("facilityCode", None)
     action = request.json.get("action", None).strip()
 
     if (not access_node_id or not access_card_number or not action):
@@ -334,42 +367,48 @@ def scan_access_node(access_node_id):
         abort(422, 'invalid action')
 
     try:
-        # get access node
-        access_node = AccessNode.query.filter_by(id=access_node_id).first()
+        access_card_number = int(access_card_number)
+        if facility_code is not None:
+            facility_code = int(facility_code)
+    except (TypeError, ValueError):
+        abort(422, 'accessCardNumber and facilityCode must be numbers')
+
+    try:
+        # get access node (from in-memory index)
+        access_node = access_card_index.lookup_access_node(access_node_id)
         if not access_node:
             abort(404, 'unable to find an access node with that id')
 
-        # get user access card assignment
-        user_access_card = db.session.query(
-            UserAccessCard.assigned_to_user_id,
-            UserAccessCard.access_card_id
-        ) \
-            .join(
-                AccessCard,
-                AccessCard.id == UserAccessCard.access_card_id
-            ) \
-            .filter_by(card_number=access_card_number) \
-            .first()
+        # get user access card assignment (from in-memory index)
+        user_access_card = access_card_index.lookup_access_card(
+            access_card_number,
+            facility_code
+        )
         if not user_access_card:
+            scan_counter.inc(
+                access_node_id=access_node.id,
+                action=action,
+                result='unknown_card'
+            )
             abort(404, 'unable to find a user with that access card id')
 
         # TODO: consider informing the actual node here via MQTT message
 
-        # write to access log
-        access_log = AccessNodeLog(
-            user_id=user_access_card.assigned_to_user_id,
+        # write to access log (group-committed by the background writer)
+        access_log = write_access_node_log(
+            user_id=user_access_card.user_id,
             access_card_id=user_access_card.access_card_id,
             access_node_id=access_node.id,
             device_id=access_node.device_id,
-            action=action,
+            action=AccessNodeScanActionEnum(action),
             success=True,
             created_by_user_id=current_user.id
         )
-        db.session.add(access_log)
-        db.session.commit()
-
-        # get full data
-        db.session.refresh(access_log)
+        scan_counter.inc(
+            access_node_id=access_node.id,
+            action=action,
+            result='success'
+        )
 
         return jsonify(
             id=access_log.id,
@@ -386,3 +425,222 @@ def scan_access_node(access_node_id):
         abort(404, err)
     except Exception:
         abort(500, 'an unknown error occurred')
+
+
+# parse a node-side scan timestamp (ISO 8601) into naive UTC like created_at
+def parse_scanned_at(scanned_at):
+    if not scanned_at:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+    scanned_at = str(scanned_at)
+    # fromisoformat only accepts a trailing Z from python 3.11 on
+    if scanned_at.endswith(('Z', 'z')):
+        scanned_at = scanned_at[:-1] + '+00:00'
+    scanned_at = datetime.fromisoformat(scanned_at)
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return scanned_at
+
+
+# upload scans buffered by an access node while it was offline, all logs are
+# written in one transaction and a result is returned for each scan in order
+@app.route("/api/accessNodes/<access_node_id>/scans", methods=["POST"])
+@jwt_required()
+def scan_access_node_batch(access_node_id):
+    role_required([UserRoleEnum.ADMIN])
+
+    scans = request.json.get("scans", None)
+
+    if (not access_node_id or not isinstance(scans, list) or not scans):
+        abort(422, 'missing accessNodeId or scans')
+
+    if len(scans) > app.config['MAX_SCANS_PER_BATCH']:
+        abort(
+            422,
+            'too many scans, the max is %s per request'
+            % app.config['MAX_SCANS_PER_BATCH']
+        )
+
+    valid_actions = [e.value for e in AccessNodeScanActionEnum]
+
+    try:
+        # get access node
+        access_node = AccessNode.query.filter_by(id=access_node_id).first()
+        if not access_node:
+            abort(404, 'unable to find an access node with that id')
+
+        # validate each scan before looking anything up
+        results = []
+        parsed_scans = []
+        for index, scan in enumerate(scans):
+            results.append({'index': index})
+            try:
+                card_number = int(scan.get('accessCardNumber'))
+                facility_code = scan.get('facilityCode', None)
+                if facility_code is not None:
+                    facility_code = int(facility_code)
+                action = str(scan.get('action', '')).strip()
+                if action not in valid_actions:
+                    raise ValueError('invalid action')
+                scanned_at = parse_scanned_at(scan.get('scannedAt', None))
+            except (AttributeError, TypeError, ValueError) as err:
+                results[index]['error'] = 'invalid scan: %s' % err
+                scan_counter.inc(
+                    access_node_id=access_node.id,
+                    action='',
+                    result='invalid'
+                )
+                continue
+            parsed_scans.append(
+                (index, card_number, facility_code, action, scanned_at)
+            )
+
+        # look up every card assignment in one query
+        card_numbers = {scan[1] for scan in parsed_scans}
+        assignments = {}
+        if card_numbers:
+            rows = db.session.query(
+                UserAccessCard.assigned_to_user_id,
+                UserAccessCard.access_card_id,
+                AccessCard.card_number,
+                AccessCard.facility_code
+            ) \
+                .join(
+                    AccessCard,
+                    AccessCard.id == UserAccessCard.access_card_id
+                ) \
+                .filter(AccessCard.card_number.in_(card_numbers)) \
+                .order_by(UserAccessCard.created_at) \
+                .all()
+            for row in rows:
+                assignments.setdefault(row.card_number, row)
+
+        # write all access logs in a single transaction
+        access_logs = []
+        for index, card_number, facility_code, action, scanned_at \
+                in parsed_scans:
+            assignment = assignments.get(card_number)
+            if not assignment or (
+                facility_code is not None
+                and assignment.facility_code != facility_code
+            ):
+                results[index]['error'] = \
+                    'unable to find a user with that access card id'
+                scan_counter.inc(
+                    access_node_id=access_node.id,
+                    action=action,
+                    result='unknown_card'
+                )
+                continue
+
+            access_log = {
+                'id': uuid_str(),
+                'user_id': assignment.assigned_to_user_id,
+                'access_card_id': assignment.access_card_id,
+                'access_node_id': access_node.id,
+                'device_id': access_node.device_id,
+                'action': AccessNodeScanActionEnum(action),
+                'success': True,
+                'created_by_user_id': current_user.id,
+                'created_at': scanned_at,
+            }
+            access_logs.append(access_log)
+            scan_counter.inc(
+                access_node_id=access_node.id,
+                action=action,
+                result='success'
+            )
+            results[index].update({
+                'id': access_log['id'],
+                'userId': access_log['user_id'],
+                'accessCardId': access_log['access_card_id'],
+                'accessNodeId': access_log['access_node_id'],
+                'deviceId': access_log['device_id'],
+                'action': access_log['action'],
+                'success': access_log['success'],
+                'createdByUserId': access_log['created_by_user_id'],
+                'createdAt': access_log['created_at'].isoformat(),
+            })
+
+        if access_logs:
+            db.session.execute(insert(AccessNodeLog), access_logs)
+
+            # usage rollups and sessions only refresh recent logs by default
+            oldest = min(log['created_at'] for log in access_logs)
+            after_commit(mark_device_usage_stale, oldest.date())
+            after_commit(mark_device_sessions_stale, oldest)
+
+        return jsonify(scans=results)
+    except exceptions.NotFound as err:
+        abort(404, err)
+    except Exception:
+        abort(500, 'an unknown error occurred')
+
+
+# the full card allowlist for the device connected to an access node, nodes
+# use this to authorize scans locally and keep the returned version to ask
+# for changes since then
+@app.route("/api/accessNodes/<access_node_id>/allowlist", methods=["GET"])
+@jwt_required()
+def read_access_node_allowlist(access_node_id):
+    role_required([UserRoleEnum.ADMIN])
+
+    try:
+        access_node = access_card_index.lookup_access_node(access_node_id)
+        if not access_node:
+            abort(404, 'unable to find an access node with that id')
+
+        if not access_node.device_id:
+            return jsonify(
+                version=access_allowlist_version(),
+                deviceId=None,
+                cards=[]
+            )
+
+        return jsonify(access_allowlist_snapshot(access_node.device_id))
+    except exceptions.NotFound as err:
+        abort(404, err)
+    except Exception:
+        abort(500, 'an unknown error occurred')
+
+
+# cards added to or removed from an access node allowlist since a version,
+# if the returned deviceId differs from the one the node synced the node
+# should fetch the full allowlist again
+@app.route("/api/accessNodes/<access_node_id>/allowlist/delta",
+           methods=["GET"])
+@jwt_required()
+def read_access_node_allowlist_delta(access_node_id):
+    role_required([UserRoleEnum.ADMIN])
+
+    since = request.args.get('since')
+    if since is None:
+        abort(422, 'missing since version')
+
+    try:
+        since = int(since)
+    except ValueError:
+        abort(422, 'since must be a version number')
+
+    try:
+        access_node = access_card_index.lookup_access_node(access_node_id)
+        if not access_node:
+            abort(404, 'unable to find an access node with that id')
+
+        if not access_node.device_id:
+            return jsonify(
+                version=access_allowlist_version(),
+                since=since,
+                deviceId=None,
+                added=[],
+                removed=[]
+            )
+
+        return jsonify(
+            access_allowlist_delta(access_node.device_id, since)
+        )
+    except ValueError as err:
+        abort(422, err)
+    except exceptions.NotFound as err:
+        abort(404, err)
+    except Exception:
+        abort(500, 'an unknown error occurred')
@@ -0,0 +1,92 @@
+import os
+from ..model_enums import UserRoleEnum
+from ..app import app
+from ..role_required import role_required
+from flask import jsonify
+from flask import Blueprint
+from flask import request
+from flask import abort
+from flask import Response
+from flask import send_file
+from flask_jwt_extended import jwt_required
+from ..instrumentation import instrumentation_enabled, endpoint_stats
+from ..slow_queries import slow_queries_enabled, slow_query_threshold_ms, \
+    recent_slow_queries
+from ..profiling import list_profiles, profile_path, profile_report
+
+admin = Blueprint('admin', __name__)
+
+
+# per endpoint request timing since the server started, empty unless the
+# server runs with TESLA_INSTRUMENTATION=1
+@app.route("/api/admin/requestStats", methods=["GET"])
+@jwt_required()
+def read_request_stats():
+    role_required([UserRoleEnum.ADMIN])
+
+    return jsonify(
+        enabled=instrumentation_enabled(),
+        endpoints=endpoint_stats()
+    )
+
+
+# the latest statements slower than TESLA_SLOW_QUERY_MS, newest first, with
+# their parameters, endpoint and query plan. Filter with ?minMs=, ?endpoint=
+# (part of the url rule or url, e.g. eMergeAccessLevel) and ?limit=
+@app.route("/api/admin/slowQueries", methods=["GET"])
+@jwt_required()
+def read_slow_queries():
+    role_required([UserRoleEnum.ADMIN])
+
+    try:
+        limit = int(request.args.get('limit') or 50)
+        min_ms = request.args.get('minMs')
+        min_ms = float(min_ms) if min_ms else None
+    except ValueError:
+        abort(422, 'limit and minMs must be numbers')
+
+    return jsonify(
+        enabled=slow_queries_enabled(),
+        thresholdMs=slow_query_threshold_ms(),
+        slowQueries=recent_slow_queries(
+            limit=limit,
+            min_ms=min_ms,
+            endpoint=request.args.get('endpoint')
+        )
+    )
+
+
+# requests profiled on demand (`X-Profile: 1` or ?profile=1 from an admin)
+# or by sampling, newest first
+@app.route("/api/admin/profiles", methods=["GET"])
+@jwt_required()
+def read_profiles():
+    role_required([UserRoleEnum.ADMIN])
+
+    return jsonify(
+        sampleRate=app.config['PROFILE_SAMPLE_RATE'],
+        samplePath=app.config['PROFILE_SAMPLE_PATH'],
+        profiles=list_profiles()
+    )
+
+
+# download a profile as a .pstats file (open with `python -m pstats` or
+# snakeviz), or ?format=text for the top functions by cumulative time
+@app.route("/api/admin/profiles/<profile_id>", methods=["GET"])
+@jwt_required()
+def read_profile(profile_id):
+    role_required([UserRoleEnum.ADMIN])
+
+    path = profile_path(profile_id)
+    if path is None or not os.path.exists(path):
+        abort(404, 'unable to find a profile with that id')
+
+    if request.args.get('format') == 'text':
+        return Response(profile_report(profile_id), mimetype='text/plain')
+
+    return send_file(
+        path,
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name='%s.pstats' % profile_id
+    )
@@ -16,6 +16,9 @@ from flask_jwt_extended import jwt_required
 from flask_jwt_extended import current_user
 import jwt
 from .users import write_user_update_log
+from ..cache.token_blocklist_cache import add_revoked_token
+from ..background.password_hasher import PasswordHasherBusy
+from ..unit_of_work import after_commit
 
 auth = Blueprint('auth', __name__)
 
@@ -59,14 +62,17 @@ instead in admin."
     # END TEMPORARY
 
     # Need captcha, email verification, etc.
-    new_user = User(
-            username=username,
-            password=password,
-            first_name=first_name,
-            last_name=last_name
-        )
+    try:
+        new_user = User(
+                username=username,
+                password=password,
+                first_name=first_name,
+                last_name=last_name
+            )
+    except PasswordHasherBusy:
+        abort(503, 'too many logins at the moment, try again shortly')
     db.session.add(new_user)
-    db.session.commit()
+    db.session.flush()
 
     # get full data
     db.session.refresh(new_user)
@@ -80,7 +86,6 @@ instead in admin."
         action=UserAccessActionEnum.REGISTER,
     )
     db.session.add(log)
-    db.session.commit()
 
     return jsonify(message="registration successful")
 
@@ -91,7 +96,13 @@ def login():
     password = request.json.get("password", None)
 
     user = User.query.filter_by(username=username).one_or_none()
-    if not user or not user.check_password(password):
+    if not user or not password:
+        return jsonify(message="wrong username or password"), 401
+    try:
+        valid_password = user.check_password(password)
+    except PasswordHasherBusy:
+        abort(503, 'too many logins at the moment, try again shortly')
+    if not valid_password:
         return jsonify(message="wrong username or password"), 401
 
     # generate token
@@ -103,7 +114,6 @@ def login():
     db.session.query(User).\
         filter(User.username == username).\
         update({'last_logged_in_at': now})
-    db.session.commit()
 
     # log access
     log = UserAccessLog(
@@ -111,7 +121,6 @@ def login():
         action=UserAccessActionEnum.LOGIN,
     )
     db.session.add(log)
-    db.session.commit()
 
     return jsonify(accessToken=access_token, refreshToken=refresh_token)
 
@@ -138,7 +147,8 @@ def modify_token():
     ttype = token["type"]
     now = datetime.now(timezone.utc)
     db.session.add(TokenBlocklist(jti=jti, type=ttype, created_at=now))
-    db.session.commit()
+    # cached once the logout is saved, a failed commit leaves it valid
+    after_commit(add_revoked_token, jti, token["exp"])
 
     # refresh token in POST body
     refreshTokenJwt = request.json.get("refreshToken", None)
@@ -154,7 +164,11 @@ def modify_token():
             type=refreshTokenType,
             created_at=now)
         )
-        db.session.commit()
+        after_commit(
+            add_revoked_token,
+            refreshTokenJti,
+            refreshTokenDecoded['exp']
+        )
 
     # log access
     log = UserAccessLog(
@@ -162,7 +176,6 @@ def modify_token():
         action=UserAccessActionEnum.LOGOUT,
     )
     db.session.add(log)
-    db.session.commit()
 
     return jsonify(message="goodbye")
 
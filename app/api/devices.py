@@ -19,6 +19,11 @@ from sqlalchemy import exc
 from werkzeug import exceptions
 from ..query.device_access_logs import device_access_logs
 from ..utils.array_to_csv_flask_response import array_to_csv_flask_response
+from ..utils.stream_csv_flask_response import stream_csv_flask_response
+from ..utils.conditional_get import conditional_get
+from ..cache import access_card_index
+from ..query.access_allowlists import refresh_access_allowlists
+from ..unit_of_work import after_commit
 
 devices = Blueprint('devices', __name__)
 
@@ -52,7 +57,7 @@ def create_device():
         if (status):
             device.status = status
         db.session.add(device)
-        db.session.commit()
+        db.session.flush()
 
         # get full data
         db.session.refresh(device)
@@ -108,7 +113,7 @@ def update_device(device_id):
             device.name = name
         if status:
             device.status = status
-        db.session.commit()
+        db.session.flush()
 
         # return the latest data in database
         db.session.refresh(device)
@@ -142,7 +147,6 @@ def archive_device(device_id):
 
         # archive device
         device.status = DeviceStatusEnum.ARCHIVED
-        db.session.commit()
 
         # clear device from assigned node
         node = AccessNode.query.filter(
@@ -150,13 +154,13 @@ def archive_device(device_id):
         ).first()
         if node:
             node.device_id = None
-            db.session.commit()
+            after_commit(access_card_index.refresh_access_node, node.id)
 
         # clear user assignments to device
         UserDevice.query.filter(
             UserDevice.device_id == device.id
         ).delete()
-        db.session.commit()
+        after_commit(refresh_access_allowlists)
 
         return jsonify(message='device archived')
     except exceptions.NotFound:
@@ -165,9 +169,21 @@ def archive_device(device_id):
         abort(500, 'an unknown error occurred')
 
 
+# API-formatted response for a device in a list
+def device_list_res(device):
+    return {
+        'id': device.id,
+        'name': device.name,
+        'type': device.type,
+        'status': device.status,
+        'createdAt': device.created_at.isoformat()
+    }
+
+
 # return a list of devices
 @app.route("/api/devices", methods=["GET"])
 @jwt_required()
+@conditional_get('device', 'user_device')
 def read_devices():
     role_required([UserRoleEnum.ADMIN, UserRoleEnum.EDITOR])
 
@@ -217,6 +233,15 @@ def read_devices():
     if request.args.get('orderDir') == 'desc':
         order_by = order_by.desc()
 
+    # stream every matching device as csv, ignoring pagination
+    if content_type == 'text/csv' \
+            and request.args.get('stream') in ['1', 'true']:
+        rows = query.order_by(order_by) \
+            .yield_per(app.config['STREAM_CHUNK_SIZE'])
+        return stream_csv_flask_response(
+            device_list_res(device) for device in rows
+        )
+
     # page
     page = 1
     if (request.args.get('page')):
@@ -238,15 +263,7 @@ def read_devices():
             error_out=False
         )
 
-    devices = []
-    for device in results:
-        devices.append({
-            'id': device.id,
-            'name': device.name,
-            'type': device.type,
-            'status': device.status,
-            'createdAt': device.created_at.isoformat()
-        })
+    devices = [device_list_res(device) for device in results]
 
     if content_type == 'text/csv':
         return array_to_csv_flask_response(devices)
@@ -257,19 +274,28 @@ def read_devices():
 # useful for a UI detail page and related reporting
 @app.route("/api/devices/<device_id>", methods=["GET"])
 @jwt_required()
+@conditional_get(
+    'device',
+    'access_node',
+    'user',
+    'user_device',
+    'access_node_log'
+)
 def read_device_view(device_id):
     if (not device_id):
         abort(422, 'missing device id e.g. /api/devices/DEVICE-ID')
 
     try:
-        # find
-        device = Device.query.filter_by(id=device_id).first()
+        # find, along with the access node the device is assigned to
+        device_result = db.session.query(Device, AccessNode) \
+            .outerjoin(AccessNode, AccessNode.device_id == Device.id) \
+            .filter(Device.id == device_id) \
+            .first()
 
-        if not device:
+        if not device_result:
             abort(404, 'unable to find a device with that id')
+        device, access_node = device_result
 
-        # access node with device assigned
-        access_node = AccessNode.query.filter_by(device_id=device_id).first()
         access_node_res = {}
         if access_node:
             access_node_res = {
@@ -380,7 +406,6 @@ def assign_device(device_id):
 
         )
         db.session.add(user_device)
-        db.session.commit()
 
         # log device change
         device_assignment_log = DeviceAssignmentLog(
@@ -389,7 +414,7 @@ def assign_device(device_id):
             assigned_by_user_id=user_device.assigned_by_user_id,
         )
         db.session.add(device_assignment_log)
-        db.session.commit()
+        after_commit(refresh_access_allowlists)
 
         return jsonify(message='device assigned')
     except exceptions.Conflict as err:
@@ -446,7 +471,6 @@ def unassign_device(device_id):
 
         # unassign card from user
         db.session.delete(user_device)
-        db.session.commit()
 
         # log device change
         device_assignment_log = DeviceAssignmentLog(
@@ -455,7 +479,7 @@ def unassign_device(device_id):
             assigned_by_user_id=user_device.assigned_by_user_id
         )
         db.session.add(device_assignment_log)
-        db.session.commit()
+        after_commit(refresh_access_allowlists)
 
         return jsonify(message='device unassigned')
     except exceptions.Conflict as err:
@@ -1,4 +1,17 @@
+import time
+from datetime import datetime
+from datetime import timezone
 from flask import Blueprint
+from flask import current_app
+from sqlalchemy import delete
+from sqlalchemy import false
+from sqlalchemy import text
+from ..app import db
+from ..models import TokenBlocklist
+from ..metrics import job_last_success
+from ..scheduled_tasks.scheduled_tasks import scheduler_status
+from ..background.access_node_log_writer import get_access_node_log_writer
+from ..background.password_hasher import get_password_hasher
 
 health = Blueprint('health', __name__)
 
@@ -9,3 +22,143 @@ def index():
         'message': 'alive'
     }
     return data
+
+
+def _iso(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+# Run a statement on its own connection and roll it back, returns the time
+# taken in milliseconds. The connection doesn't go through db.session, so a
+# probe never ends up in the request's unit of work.
+def _probe(statement):
+    started = time.perf_counter()
+    with db.engine.connect() as connection:
+        connection.execute(statement)
+        connection.rollback()
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+# time a trivial read, and a write that matches no rows. The write still
+# takes the database's write lock (SQLite) or a table lock (PostgreSQL), so
+# it's slow or fails when another connection holds the database locked.
+def _database_check(problems):
+    config = current_app.config
+    check = {'dialect': db.engine.dialect.name}
+    probes = [
+        ('read', text('SELECT 1'), config['HEALTH_READ_THRESHOLD_MS']),
+        (
+            'write',
+            delete(TokenBlocklist).where(false()),
+            config['HEALTH_WRITE_THRESHOLD_MS']
+        ),
+    ]
+    for name, statement, threshold in probes:
+        try:
+            milliseconds = _probe(statement)
+        except Exception as err:
+            check[name + 'Ms'] = None
+            check[name + 'Error'] = str(err).splitlines()[0]
+            problems.append(('down', 'database %s probe failed' % name))
+            continue
+        check[name + 'Ms'] = milliseconds
+        if milliseconds > threshold:
+            problems.append((
+                'degraded',
+                'database %s took %sms, the threshold is %sms'
+                % (name, milliseconds, threshold)
+            ))
+    return check
+
+
+def _scheduler_check(problems):
+    status = scheduler_status()
+    if not status['running']:
+        problems.append(('degraded', 'scheduler is not running'))
+
+    # jobs only record their runs in this process, until the first run the
+    # scheduler start counts as the last one
+    last_success = job_last_success('remove_old_tokens')
+    since = last_success or status['started_at']
+    max_age = current_app.config['HEALTH_TOKEN_CLEANUP_MAX_AGE_HOURS']
+    if since is not None and time.time() - since > max_age * 3600:
+        problems.append((
+            'degraded',
+            'remove_old_tokens has not succeeded in %g hours' % max_age
+        ))
+
+    return {
+        'running': status['running'],
+        'startedAt': _iso(status['started_at']),
+        'jobs': [
+            {
+                'name': job['name'],
+                'nextRunAt': job['next_run_time'].isoformat()
+                if job['next_run_time'] else None,
+            }
+            for job in status['jobs']
+        ],
+        'removeOldTokensLastSuccessAt': _iso(last_success),
+    }
+
+
+def _queue_check(problems):
+    config = current_app.config
+    access_node_log = get_access_node_log_writer().queue_depth()
+    if access_node_log > config['HEALTH_QUEUE_THRESHOLD']:
+        problems.append((
+            'degraded',
+            '%s access node logs waiting to be written' % access_node_log
+        ))
+
+    # a burst of logins fills the queue of every node alike, taking them out
+    # of the load balancer would only move the logins to fewer nodes. Only a
+    # warning unless HEALTH_FAIL_ON_PASSWORD_HASH_QUEUE is set.
+    password_hash = get_password_hasher().queue_depth()
+    password_hash_full = config['PASSWORD_HASH_WORKERS'] > 0 \
+        and password_hash >= config['PASSWORD_HASH_MAX_QUEUE']
+    if password_hash_full:
+        problems.append((
+            'degraded' if config['HEALTH_FAIL_ON_PASSWORD_HASH_QUEUE']
+            else 'warning',
+            'password hash queue is full, logins are being turned away'
+        ))
+
+    return {
+        'accessNodeLog': access_node_log,
+        'passwordHash': password_hash,
+        'passwordHashFull': password_hash_full,
+    }
+
+
+# Readiness check for load balancers: probes the database and reports the
+# scheduler and background queues. 200 with status ok, or 503 with status
+# degraded (a threshold was exceeded) or down (the database probe failed)
+# and the reasons in problems. Warnings, e.g. a full password hash queue,
+# are listed in warnings and keep the 200. Thresholds are the HEALTH_*
+# settings.
+@health.route('/api/health/ready')
+def ready():
+    problems = []
+    data = {
+        'database': _database_check(problems),
+        'scheduler': _scheduler_check(problems),
+        'queues': _queue_check(problems),
+    }
+
+    levels = [level for level, message in problems if level != 'warning']
+    if 'down' in levels:
+        data['status'] = 'down'
+    elif levels:
+        data['status'] = 'degraded'
+    else:
+        data['status'] = 'ok'
+    data['problems'] = [
+        message for level, message in problems if level != 'warning'
+    ]
+    data['warnings'] = [
+        message for level, message in problems if level == 'warning'
+    ]
+    return data, 200 if data['status'] == 'ok' else 503
@@ -0,0 +1,25 @@
+import hmac
+from flask import Blueprint
+from flask import Response
+from flask import abort
+from flask import current_app
+from flask import request
+from ..metrics import render_metrics
+
+metrics = Blueprint('metrics', __name__)
+
+
+# Prometheus text exposition format, not behind jwt auth so scrapers don't
+# need a user, set TESLA_METRICS_TOKEN to require a bearer token instead
+@metrics.route('/api/metrics')
+def index():
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        expected = 'Bearer %s' % token
+        given = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(given.encode(), expected.encode()):
+            abort(401, 'missing or invalid metrics token')
+    return Response(
+        render_metrics(),
+        mimetype='text/plain; version=0.0.4'
+    )
@@ -6,15 +6,32 @@ from flask import Blueprint
 from flask import request
 from flask import abort
 from flask_jwt_extended import jwt_required
-from ..query.device_access_logs import device_access_logs
-from ..query.access_card_edit_logs import access_card_edit_logs
-from ..query.user_edit_logs import user_edit_logs
-from ..query.user_access_logs import user_access_logs
+from ..query.device_access_logs import device_access_logs_page
+from ..query.device_access_logs import device_access_logs_stream
+from ..query.access_card_edit_logs import access_card_edit_logs_page
+from ..query.access_card_edit_logs import access_card_edit_logs_stream
+from ..query.user_edit_logs import user_edit_logs_page
+from ..query.user_edit_logs import user_edit_logs_stream
+from ..query.user_access_logs import user_access_logs_page
+from ..query.user_access_logs import user_access_logs_stream
+from ..query.device_usage import device_usage_summary
+from ..query.device_sessions import device_sessions_page
+from ..query.device_sessions import device_sessions_stream
 from ..utils.array_to_csv_flask_response import array_to_csv_flask_response
+from ..utils.stream_csv_flask_response import stream_csv_flask_response
 
 reports = Blueprint('reports', __name__)
 
 
+# pagination values returned next to a report page, pass nextCursor as the
+# cursor parameter to get the following page
+def page_info_response(results):
+    page_info = {'nextCursor': results['nextCursor']}
+    if results['total'] is not None:
+        page_info['total'] = results['total']
+    return page_info
+
+
 @app.route("/api/reports/deviceAccess", methods=["GET"])
 @jwt_required()
 def device_access():
@@ -29,6 +46,9 @@ def device_access():
     action = request.args.get('action')
     start_date = request.args.get('startDate')
     end_date = request.args.get('endDate')
+    cursor = request.args.get('cursor')
+    count = request.args.get('count')
+    stream = request.args.get('stream')
     content_type = request.headers.get('Content-Type')
 
     try:
@@ -52,12 +72,23 @@ def device_access():
             params['start_date'] = start_date
         if end_date:
             params['end_date'] = end_date
+        if cursor:
+            params['cursor'] = cursor
+        if count in ['1', 'true']:
+            params['include_count'] = True
+
+        # stream every matching row, ignoring pagination
+        if content_type == 'text/csv' and stream in ['1', 'true']:
+            return stream_csv_flask_response(device_access_logs_stream(params))
 
-        access_logs = device_access_logs(params)
+        results = device_access_logs_page(params)
 
         if content_type == 'text/csv':
-            return array_to_csv_flask_response(access_logs)
-        return jsonify(deviceAccessLogs=access_logs)
+            return array_to_csv_flask_response(results['items'])
+        return jsonify(
+            deviceAccessLogs=results['items'],
+            **page_info_response(results)
+        )
     except ValueError as err:
         abort(422, err)
     except AttributeError as err:
@@ -80,6 +111,9 @@ def access_card_edits():
     emerge_access_level = request.args.get('eMergeAccessLevel')
     start_date = request.args.get('startDate')
     end_date = request.args.get('endDate')
+    cursor = request.args.get('cursor')
+    count = request.args.get('count')
+    stream = request.args.get('stream')
     content_type = request.headers.get('Content-Type')
 
     try:
@@ -105,12 +139,25 @@ def access_card_edits():
             params['start_date'] = start_date
         if end_date:
             params['end_date'] = end_date
+        if cursor:
+            params['cursor'] = cursor
+        if count in ['1', 'true']:
+            params['include_count'] = True
 
-        logs = access_card_edit_logs(params)
+        # stream every matching row, ignoring pagination
+        if content_type == 'text/csv' and stream in ['1', 'true']:
+            return stream_csv_flask_response(
+                access_card_edit_logs_stream(params)
+            )
+
+        results = access_card_edit_logs_page(params)
 
         if content_type == 'text/csv':
-            return array_to_csv_flask_response(logs)
-        return jsonify(accessCardEditLogs=logs)
+            return array_to_csv_flask_response(results['items'])
+        return jsonify(
+            accessCardEditLogs=results['items'],
+            **page_info_response(results)
+        )
     except ValueError as err:
         abort(422, err)
     except AttributeError as err:
@@ -133,6 +180,9 @@ def user_edits():
     updated_by_user_id = request.args.get('updatedByUserId')
     start_date = request.args.get('startDate')
     end_date = request.args.get('endDate')
+    cursor = request.args.get('cursor')
+    count = request.args.get('count')
+    stream = request.args.get('stream')
     content_type = request.headers.get('Content-Type')
 
     try:
@@ -156,12 +206,23 @@ def user_edits():
             params['start_date'] = start_date
         if end_date:
             params['end_date'] = end_date
+        if cursor:
+            params['cursor'] = cursor
+        if count in ['1', 'true']:
+            params['include_count'] = True
+
+        # stream every matching row, ignoring pagination
+        if content_type == 'text/csv' and stream in ['1', 'true']:
+            return stream_csv_flask_response(user_edit_logs_stream(params))
 
-        logs = user_edit_logs(params)
+        results = user_edit_logs_page(params)
 
         if content_type == 'text/csv':
-            return array_to_csv_flask_response(logs)
-        return jsonify(userEditLogs=logs)
+            return array_to_csv_flask_response(results['items'])
+        return jsonify(
+            userEditLogs=results['items'],
+            **page_info_response(results)
+        )
     except ValueError as err:
         abort(422, err)
     except AttributeError as err:
@@ -181,6 +242,9 @@ def user_access():
     action = request.args.get('action')
     start_date = request.args.get('startDate')
     end_date = request.args.get('endDate')
+    cursor = request.args.get('cursor')
+    count = request.args.get('count')
+    stream = request.args.get('stream')
     content_type = request.headers.get('Content-Type')
 
     try:
@@ -198,15 +262,135 @@ def user_access():
             params['start_date'] = start_date
         if end_date:
             params['end_date'] = end_date
+        if cursor:
+            params['cursor'] = cursor
+        if count in ['1', 'true']:
+            params['include_count'] = True
 
-        logs = user_access_logs(params)
+        # stream every matching row, ignoring pagination
+        if content_type == 'text/csv' and stream in ['1', 'true']:
+            return stream_csv_flask_response(user_access_logs_stream(params))
+
+        results = user_access_logs_page(params)
 
         if content_type == 'text/csv':
-            return array_to_csv_flask_response(logs)
-        return jsonify(userAccessLogs=logs)
+            return array_to_csv_flask_response(results['items'])
+        return jsonify(
+            userAccessLogs=results['items'],
+            **page_info_response(results)
+        )
     except ValueError as err:
         abort(422, err)
     except AttributeError as err:
         abort(422, err)
     except Exception:
         abort(500, 'an unknown error occurred')
+
+
+# sessions, scans and unique users per device per day, week, month or for
+# the whole range, answered from the daily usage rollups
+@app.route("/api/reports/deviceUsageSummary", methods=["GET"])
+@jwt_required()
+def device_usage_summary_report():
+    role_required([UserRoleEnum.ADMIN, UserRoleEnum.EDITOR])
+
+    device_id = request.args.get('deviceId')
+    user_id = request.args.get('userId')
+    access_node_id = request.args.get('accessNodeId')
+    group_by = request.args.get('groupBy')
+    start_date = request.args.get('startDate')
+    end_date = request.args.get('endDate')
+    content_type = request.headers.get('Content-Type')
+
+    try:
+        params = {}
+
+        if device_id:
+            params['device_id'] = device_id
+        if user_id:
+            params['user_id'] = user_id
+        if access_node_id:
+            params['access_node_id'] = access_node_id
+        if group_by:
+            params['group_by'] = group_by
+        if start_date:
+            params['start_date'] = start_date
+        if end_date:
+            params['end_date'] = end_date
+
+        results = device_usage_summary(params)
+
+        if content_type == 'text/csv':
+            return array_to_csv_flask_response(results['items'])
+        return jsonify(
+            deviceUsageSummary=results['items'],
+            refreshedAt=results['refreshedAt']
+        )
+    except ValueError as err:
+        abort(422, err)
+    except Exception:
+        abort(500, 'an unknown error occurred')
+
+
+# machine sessions from a login scan to the following logout scan, count=1
+# adds the session count and total duration across all pages
+@app.route("/api/reports/deviceSessions", methods=["GET"])
+@jwt_required()
+def device_sessions_report():
+    role_required([UserRoleEnum.ADMIN, UserRoleEnum.EDITOR])
+
+    page = request.args.get('page')
+    per_page = request.args.get('perPage')
+    user_id = request.args.get('userId')
+    device_id = request.args.get('deviceId')
+    access_node_id = request.args.get('accessNodeId')
+    start_date = request.args.get('startDate')
+    end_date = request.args.get('endDate')
+    cursor = request.args.get('cursor')
+    count = request.args.get('count')
+    stream = request.args.get('stream')
+    content_type = request.headers.get('Content-Type')
+
+    try:
+        params = {}
+
+        if page:
+            params['page'] = int(page)
+        if per_page:
+            params['per_page'] = int(per_page)
+        if user_id:
+            params['user_id'] = user_id
+        if device_id:
+            params['device_id'] = device_id
+        if access_node_id:
+            params['access_node_id'] = access_node_id
+        if start_date:
+            params['start_date'] = start_date
+        if end_date:
+            params['end_date'] = end_date
+        if cursor:
+            params['cursor'] = cursor
+        if count in ['1', 'true']:
+            params['include_count'] = True
+
+        # stream every matching row, ignoring pagination
+        if content_type == 'text/csv' and stream in ['1', 'true']:
+            return stream_csv_flask_response(device_sessions_stream(params))
+
+        results = device_sessions_page(params)
+
+        if content_type == 'text/csv':
+            return array_to_csv_flask_response(results['items'])
+        page_info = page_info_response(results)
+        if results['totalDurationSeconds'] is not None:
+            page_info['totalDurationSeconds'] = \
+                results['totalDurationSeconds']
+        return jsonify(
+            deviceSessions=results['items'],
+            refreshedAt=results['refreshedAt'],
+            **page_info
+        )
+    except ValueError as err:
+        abort(422, err)
+    except Exception:
+        abort(500, 'an unknown error occurred')
@@ -18,7 +18,16 @@ from werkzeug import exceptions
 from sqlalchemy.orm import aliased
 from ..query.device_access_logs import device_access_logs
 from ..utils.array_to_csv_flask_response import array_to_csv_flask_response
+from ..utils.stream_csv_flask_response import stream_csv_flask_response
 from .access_cards import log_access_card_change
+from ..cache import access_card_index
+from ..cache.user_identity_cache import invalidate_user_identity
+from ..query.access_allowlists import refresh_access_allowlists
+from ..unit_of_work import after_commit
+from ..bulk_import import import_users_csv, refresh_imported_caches
+from ..utils.csv_upload_stream import csv_upload_stream
+from ..utils.conditional_get import conditional_get
+from ..background.password_hasher import PasswordHasherBusy
 
 users = Blueprint('users', __name__)
 
@@ -33,7 +42,6 @@ def write_user_update_log(user):
         updated_by_user_id=user.last_updated_by_user_id
     )
     db.session.add(userEditLog)
-    db.session.commit()
 
 
 # set one or more access cards assigned to a user to inactive status
@@ -47,7 +55,6 @@ def set_user_access_card_to_inactive(user_id):
     for card in cards:
         # card = AccessCard.query.filter_by(id=result.id).first()
         card.status = AccessCardStatusEnum.INACTIVE
-        db.session.commit()
         log_access_card_change(
             card.id,
             current_user.id,
@@ -111,7 +118,7 @@ def create_user():
         if (status):
             user.status = status
         db.session.add(user)
-        db.session.commit()
+        db.session.flush()
 
         # get full data
         db.session.refresh(user)
@@ -133,6 +140,8 @@ def create_user():
         )
     except exc.IntegrityError:
         abort(409, 'a user with that username already exists')
+    except PasswordHasherBusy:
+        abort(503, 'too many logins at the moment, try again shortly')
     except Exception:
         abort(500, 'an unknown error occurred')
 
@@ -194,11 +203,14 @@ def update_user(user_id):
             user.emerge_access_level = emerge_access_level
         if (status):
             user.status = status
-        db.session.commit()
+        db.session.flush()
 
         # if not active status, update card(s) status to inactive
         if user.status != UserStatusEnum.ACTIVE:
             set_user_access_card_to_inactive(user.id)
+        after_commit(access_card_index.refresh_user, user.id)
+        after_commit(refresh_access_allowlists)
+        after_commit(invalidate_user_identity, user.id)
 
         db.session.refresh(user)
 
@@ -219,6 +231,8 @@ def update_user(user_id):
         )
     except exceptions.NotFound:
         abort(404, 'unable to find a user with that id')
+    except PasswordHasherBusy:
+        abort(503, 'too many logins at the moment, try again shortly')
     except Exception:
         abort(500, 'an unknown error occurred')
 
@@ -241,7 +255,6 @@ def archive_user(user_id):
 
         # archive user
         user.status = UserStatusEnum.ARCHIVED
-        db.session.commit()
 
         # write to user update log
         write_user_update_log(user)
@@ -253,13 +266,14 @@ def archive_user(user_id):
         UserAccessCard.query.filter(
             UserAccessCard.assigned_to_user_id == user.id
         ).delete()
-        db.session.commit()
 
         # remove device assignments
         UserDevice.query.filter(
             UserDevice.assigned_to_user_id == user.id
         ).delete()
-        db.session.commit()
+        after_commit(access_card_index.refresh_user, user.id)
+        after_commit(refresh_access_allowlists)
+        after_commit(invalidate_user_identity, user.id)
 
         return jsonify(message='user archived')
     except exceptions.NotFound:
@@ -268,9 +282,48 @@ def archive_user(user_id):
         abort(500, 'an unknown error occurred')
 
 
+# import users from a CSV file, each with an optional access card to create
+# or assign. Rows are saved in batches, rows with errors are skipped and
+# listed in the response.
+@app.route("/api/users/import", methods=["POST"])
+@jwt_required()
+def import_users():
+    role_required([UserRoleEnum.ADMIN])
+
+    try:
+        results = import_users_csv(csv_upload_stream(), current_user.id)
+
+        return jsonify(results)
+    except ValueError as err:
+        abort(422, err)
+    except Exception:
+        abort(500, 'an unknown error occurred')
+    finally:
+        # the batches are committed as they're imported, the ones before a
+        # failure are saved too
+        refresh_imported_caches()
+
+
+# API-formatted response for a user in a list
+def user_list_res(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'firstName': user.first_name,
+        'lastName': user.last_name,
+        'eMergeAccessLevel': user.emerge_access_level,
+        'role': user.role,
+        'status': user.status,
+        'createdAt': user.created_at.isoformat(),
+        'lastUpdatedAt': user.last_updated_at.isoformat(),
+        'lastUpdatedByUserId': user.last_updated_by_user_id
+    }
+
+
 # return a list of users
 @app.route("/api/users", methods=["GET"])
 @jwt_required()
+@conditional_get('user')
 def read_users():
     role_required([UserRoleEnum.ADMIN, UserRoleEnum.EDITOR])
 
@@ -326,6 +379,13 @@ def read_users():
     if request.args.get('orderDir') == 'desc':
         order_by = order_by.desc()
 
+    # stream every matching user as csv, ignoring pagination
+    if content_type == 'text/csv' \
+            and request.args.get('stream') in ['1', 'true']:
+        rows = query.order_by(order_by) \
+            .yield_per(app.config['STREAM_CHUNK_SIZE'])
+        return stream_csv_flask_response(user_list_res(user) for user in rows)
+
     # page
     page = 1
     if (request.args.get('page')):
@@ -347,20 +407,7 @@ def read_users():
             error_out=False
         )
 
-    users = []
-    for user in results:
-        users.append({
-            'id': user.id,
-            'username': user.username,
-            'firstName': user.first_name,
-            'lastName': user.last_name,
-            'eMergeAccessLevel': user.emerge_access_level,
-            'role': user.role,
-            'status': user.status,
-            'createdAt': user.created_at.isoformat(),
-            'lastUpdatedAt': user.last_updated_at.isoformat(),
-            'lastUpdatedByUserId': user.last_updated_by_user_id
-        })
+    users = [user_list_res(user) for user in results]
 
     if content_type == 'text/csv':
         return array_to_csv_flask_response(users)
@@ -371,6 +418,14 @@ def read_users():
 # useful for a UI detail page and related reporting
 @app.route("/api/users/<user_id>", methods=["GET"])
 @jwt_required()
+@conditional_get(
+    'user',
+    'user_device',
+    'device',
+    'access_card',
+    'user_access_card',
+    'access_node_log'
+)
 def read_user_view(user_id):
     role_required([UserRoleEnum.ADMIN, UserRoleEnum.EDITOR])
 
@@ -378,11 +433,21 @@ def read_user_view(user_id):
         abort(422, 'missing user id e.g. /api/users/USER-ID')
 
     try:
-        # find
-        user = User.query.filter_by(id=user_id).first()
+        # find, along with the assigned devices (one row per device)
+        user_device_results = db.session.query(
+            User,
+            Device.id.label('device_id'),
+            Device.name.label('device_name')
+        ) \
+            .outerjoin(UserDevice, User.id == UserDevice.assigned_to_user_id) \
+            .outerjoin(Device, Device.id == UserDevice.device_id) \
+            .filter(User.id == user_id) \
+            .order_by(Device.name) \
+            .all()
 
-        if not user:
+        if not user_device_results:
             abort(404, 'unable to find a user with that id')
+        user = user_device_results[0].User
 
         lastUpdatedByUser = aliased(User)
         access_card_results = db.session.query(
@@ -428,18 +493,13 @@ def read_user_view(user_id):
                 })
 
         # assigned devices
-        user_devices = db.session.query(
-            Device.id,
-            Device.name
-        ) \
-            .join(UserDevice, Device.id == UserDevice.device_id) \
-            .filter_by(assigned_to_user_id=user_id) \
-            .order_by(Device.name)
         users_devices_res = []
-        for user_device in user_devices:
+        for user_device in user_device_results:
+            if user_device.device_id is None:
+                continue
             device = {
-                'id': user_device.id,
-                'name': user_device.name
+                'id': user_device.device_id,
+                'name': user_device.device_name
             }
             users_devices_res.append(device)
 
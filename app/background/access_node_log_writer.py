@@ -0,0 +1,195 @@
+# background writer that group-commits AccessNodeLog rows
+#
+# Every scan used to cost its own INSERT + COMMIT (an fsync) + SELECT to read
+# back the generated values. Scans now hand their row to this writer, which
+# inserts everything queued within ACCESS_NODE_LOG_MAX_LATENCY seconds (or
+# ACCESS_NODE_LOG_BATCH_SIZE rows, whichever comes first) in one transaction.
+# The id and created_at are generated up front so no read back is needed.
+#
+# With ACCESS_NODE_LOG_WAIT_FOR_COMMIT on (the default) a scan still only
+# returns once its row is committed, it just shares the commit with other
+# scans. Turning it off returns immediately and relies on the flush at
+# shutdown.
+
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+from datetime import timezone
+from sqlalchemy import insert
+from ..database import db
+from ..models import AccessNodeLog, uuid_str
+
+
+class _PendingLog:
+    def __init__(self, values):
+        self.values = values
+        self.done = threading.Event()
+        self.error = None
+
+
+class AccessNodeLogWriter:
+    def __init__(self, app, batch_size=100, max_latency=0.01):
+        self.app = app
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run,
+                name='access-node-log-writer',
+                daemon=True
+            )
+            self._thread.start()
+
+    # number of rows waiting to be committed
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    # queue a log row, returns the pending item
+    def enqueue(self, values):
+        pending = _PendingLog(values)
+        if self._stopping:
+            # writer is shutting down, write synchronously instead
+            self._commit([pending])
+        else:
+            self.start()
+            self._queue.put(pending)
+        return pending
+
+    # queue a log row and optionally wait until it has been committed,
+    # returns a transient AccessNodeLog with the generated values
+    def write(self, wait=True, timeout=None, **values):
+        values.setdefault('id', uuid_str())
+        values.setdefault(
+            'created_at',
+            datetime.now(timezone.utc).replace(tzinfo=None)
+        )
+        pending = self.enqueue(values)
+        if wait:
+            if not pending.done.wait(timeout):
+                raise TimeoutError('access node log was not committed in time')
+            if pending.error is not None:
+                raise pending.error
+        return AccessNodeLog(**values)
+
+    # block until everything queued so far has been committed
+    def flush(self, timeout=None):
+        marker = self.enqueue(None)
+        marker.done.wait(timeout)
+
+    # flush and stop the writer thread (called at interpreter exit)
+    def stop(self, timeout=10):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._drain()
+                return
+
+            # gather more rows until the batch is full or the oldest row has
+            # waited max_latency seconds
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._commit(batch)
+            if stop:
+                self._drain()
+                return
+
+    # commit whatever is still queued, used on shutdown
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                batch.append(item)
+        if batch:
+            self._commit(batch)
+
+    def _commit(self, batch):
+        rows = [pending for pending in batch if pending.values is not None]
+        with self.app.app_context():
+            try:
+                if rows:
+                    db.session.execute(
+                        insert(AccessNodeLog),
+                        [pending.values for pending in rows]
+                    )
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # retry one by one so a single bad row doesn't lose the batch
+                for pending in rows:
+                    try:
+                        db.session.execute(
+                            insert(AccessNodeLog),
+                            [pending.values]
+                        )
+                        db.session.commit()
+                    except Exception as err:
+                        db.session.rollback()
+                        pending.error = err
+            finally:
+                db.session.remove()
+        for pending in batch:
+            pending.done.set()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_access_node_log_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                from ..app import app
+                _writer = AccessNodeLogWriter(
+                    app,
+                    batch_size=app.config['ACCESS_NODE_LOG_BATCH_SIZE'],
+                    max_latency=app.config['ACCESS_NODE_LOG_MAX_LATENCY']
+                )
+                atexit.register(_writer.stop)
+    return _writer
+
+
+# write a single access node log row through the shared writer
+def write_access_node_log(**values):
+    from ..app import app
+    return get_access_node_log_writer().write(
+        wait=app.config['ACCESS_NODE_LOG_WAIT_FOR_COMMIT'],
+        **values
+    )
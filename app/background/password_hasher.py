@@ -0,0 +1,188 @@
+# password hashing in a pool of worker processes
+#
+# Hashing a password (pbkdf2 or scrypt) takes a CPU core for a noticeable
+# time and holds the GIL while it does, so a burst of logins at the start of
+# a class used to take up the waitress threads and hold up scans. Hashes and
+# checks now run in PASSWORD_HASH_WORKERS separate processes. At most
+# PASSWORD_HASH_MAX_QUEUE of them are waiting or running at a time, once the
+# queue is full new logins fail fast with PasswordHasherBusy (a 503) rather
+# than piling up behind each other. Bulk hashing, e.g. an import, waits for
+# its turn instead and takes at most PASSWORD_HASH_BULK_QUEUE of the slots,
+# the rest are kept for logins.
+#
+# Forking a process that already runs the scheduler and writer threads isn't
+# safe. The workers are forked from a forkserver process that only imported
+# werkzeug.security (started with spawn where there's no forkserver, e.g. on
+# Windows). Either way a worker imports the parent's __main__ module again,
+# so app/serve.py only imports the app inside serve() and app/app.py doesn't
+# load its caches or start the scheduled tasks in a child process.
+# PASSWORD_HASH_WORKERS=0 hashes on the calling thread instead.
+
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from ..instrumentation import timed
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    def __init__(self, workers=2, max_queue=32, timeout=10,
+                 method='pbkdf2', salt_length=16, bulk_queue=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        # enough to keep the workers busy, always less than max_queue
+        self.bulk_queue = max(1, min(bulk_queue or workers, max_queue - 1))
+        self.timeout = timeout
+        self.method = method
+        self.salt_length = salt_length
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(max_queue, 1))
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_queue)
+        self._queued = 0
+        self._rejected = 0
+
+    # number of hashes and checks waiting for or running in a worker
+    def queue_depth(self):
+        return self._queued
+
+    # number of hashes and checks turned away because the queue was full
+    def rejected_count(self):
+        return self._rejected
+
+    def hash(self, password):
+        return self._run(
+            generate_password_hash,
+            password,
+            self.method,
+            self.salt_length
+        )
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    # hash several passwords at once, e.g. for a bulk import. Waits for one
+    # of the bulk_queue slots instead of failing, logins keep the others
+    def hash_all(self, passwords):
+        if not self.workers:
+            return [self.hash(password) for password in passwords]
+        futures = [
+            self._submit(
+                True,
+                generate_password_hash,
+                password,
+                self.method,
+                self.salt_length,
+                bulk=True
+            )
+            for password in passwords
+        ]
+        return [self._result(future) for future in futures]
+
+    def stop(self):
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        return self._result(self._submit(False, function, *args))
+
+    def _submit(self, wait, function, *args, bulk=False):
+        if bulk:
+            self._bulk_slots.acquire()
+        if not self._slots.acquire(blocking=wait):
+            if bulk:
+                self._bulk_slots.release()
+            with self._lock:
+                self._rejected += 1
+            raise PasswordHasherBusy('too many password hashes queued')
+        with self._lock:
+            self._queued += 1
+        try:
+            future = self._get_executor().submit(function, *args)
+        except Exception:
+            self._release(bulk)
+            raise
+        future.add_done_callback(lambda future: self._release(bulk))
+        return future
+
+    def _release(self, bulk):
+        with self._lock:
+            self._queued -= 1
+        self._slots.release()
+        if bulk:
+            self._bulk_slots.release()
+
+    def _result(self, future):
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            raise PasswordHasherBusy('password hash timed out')
+        except BrokenProcessPool:
+            # a worker died, start a new pool for the next call
+            self.stop()
+            raise
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=_worker_context()
+                )
+            return self._executor
+
+
+def _worker_context():
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['werkzeug.security'])
+    return context
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                from ..app import app
+                _hasher = PasswordHasher(
+                    workers=app.config['PASSWORD_HASH_WORKERS'],
+                    max_queue=app.config['PASSWORD_HASH_MAX_QUEUE'],
+                    timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+                    method=app.config['PASSWORD_HASH_METHOD'],
+                    salt_length=app.config['PASSWORD_HASH_SALT_LENGTH'],
+                    bulk_queue=app.config['PASSWORD_HASH_BULK_QUEUE']
+                )
+                atexit.register(_hasher.stop)
+    return _hasher
+
+
+def hash_password(password):
+    with timed('password'):
+        return get_password_hasher().hash(password)
+
+
+def check_password(pwhash, password):
+    with timed('password'):
+        return get_password_hasher().check(pwhash, password)
+
+
+def hash_passwords(passwords):
+    return get_password_hasher().hash_all(passwords)
@@ -0,0 +1,485 @@
+# bulk CSV import of users, access cards and card assignments
+#
+# Used by POST /api/users/import, POST /api/accessCards/import and the
+# `flask bulk-import` command. The CSV is read row by row and written in
+# batches of IMPORT_BATCH_SIZE rows, each batch is validated with a few
+# queries and inserted in one transaction. Rows that fail validation are
+# skipped and reported with their line number, the rest of the file is
+# still imported, as are rows that aren't valid UTF-8 or CSV. Columns are
+# named like the JSON properties of the create endpoints.
+#
+# Batches are committed as they're imported, so a failure part way through
+# keeps the earlier batches. Endpoints call refresh_imported_caches() once the
+# import is over, whether or not it finished.
+
+import codecs
+import csv
+import traceback
+from sqlalchemy import insert
+from .app import app
+from .background.password_hasher import hash_passwords
+from .cache import access_card_index
+from .database import db
+from .models import User, UserEditLog, AccessCard, UserAccessCard, \
+    AccessCardLog, uuid_str
+from .model_enums import UserRoleEnum, UserStatusEnum, \
+    UserEmergeAccessLevelEnum, AccessCardStatusEnum
+from .query.access_allowlists import refresh_access_allowlists
+
+# the model defaults, except imported users are members rather than admins
+default_role = UserRoleEnum.USER
+default_facility_code = 46
+default_card_type = 46
+
+# stored instead of a hash for users imported without a password, no
+# password ever matches it so they can't log in until one is set
+unusable_password = '!'
+
+
+# lines of a file opened in binary mode decoded as UTF-8. A line that isn't
+# valid UTF-8 is decoded with replacement characters and its number added to
+# invalid_lines
+def _decode_lines(file, invalid_lines):
+    for number, line in enumerate(file, 1):
+        if number == 1 and line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8):]
+        try:
+            yield line.decode('utf-8')
+        except UnicodeDecodeError:
+            invalid_lines.add(number)
+            yield line.decode('utf-8', 'replace')
+
+
+# rows of a CSV file opened in binary mode, with the line number each row
+# ends on and surrounding whitespace removed from values. Rows that aren't
+# valid UTF-8 or CSV are counted and added to the result's errors instead.
+def _read_csv_rows(file, required_columns, result):
+    invalid_lines = set()
+    reader = csv.DictReader(_decode_lines(file, invalid_lines))
+    try:
+        columns = reader.fieldnames or []
+    except csv.Error as err:
+        raise ValueError('unable to read the header: %s' % err)
+    if invalid_lines:
+        raise ValueError('the header is not valid UTF-8')
+    for column in required_columns:
+        if column not in columns:
+            raise ValueError('missing %s column' % column)
+
+    # the line number of the csv.reader, DictReader's isn't updated when a
+    # row raises csv.Error
+    line = reader.reader.line_num
+    while True:
+        first_line = line + 1
+        error = None
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as err:
+            error = 'unable to read the row: %s' % err
+        line = reader.reader.line_num
+        if error is None and \
+                invalid_lines.intersection(range(first_line, line + 1)):
+            error = 'the row is not valid UTF-8'
+        if error:
+            result['rowCount'] += 1
+            result['errors'].append({'row': line, 'error': error})
+            continue
+        yield line, {
+            key: (value or '').strip()
+            for key, value in row.items()
+            if key is not None
+        }
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _enum_value(enum, value, default, name):
+    if not value:
+        return default
+    try:
+        return enum(value)
+    except ValueError:
+        raise ValueError('invalid %s' % name)
+
+
+def _int_value(value, default, name):
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('%s must be a number' % name)
+
+
+def _new_result():
+    return {
+        'rowCount': 0,
+        'created': {
+            'users': 0,
+            'accessCards': 0,
+            'assignments': 0,
+        },
+        'errors': [],
+    }
+
+
+# card values of a row, or None when the row has no card number
+def _parse_card(row, status=None):
+    card_number = _int_value(row.get('cardNumber'), None, 'cardNumber')
+    if card_number is None:
+        return None
+    return {
+        'card_number': card_number,
+        'facility_code': _int_value(
+            row.get('facilityCode'), default_facility_code, 'facilityCode'
+        ),
+        'card_type': _int_value(
+            row.get('cardType'), default_card_type, 'cardType'
+        ),
+        'status': _enum_value(
+            AccessCardStatusEnum,
+            status,
+            AccessCardStatusEnum.ACTIVE,
+            'status'
+        ),
+    }
+
+
+# existing access cards by number, with whether they're assigned
+def _existing_cards(card_numbers):
+    if not card_numbers:
+        return {}
+    rows = db.session.query(
+        AccessCard.id,
+        AccessCard.card_number,
+        AccessCard.status,
+        UserAccessCard.id.label('assignment_id')
+    ) \
+        .outerjoin(
+            UserAccessCard,
+            UserAccessCard.access_card_id == AccessCard.id
+        ) \
+        .filter(AccessCard.card_number.in_(card_numbers))
+    cards = {}
+    for row in rows:
+        cards.setdefault(row.card_number, row)
+    return cards
+
+
+# collects the rows of one batch so they're inserted with one statement per
+# table
+class _Batch:
+    def __init__(self, imported_by_user_id):
+        self.imported_by_user_id = imported_by_user_id
+        self.users = []
+        self.user_edit_logs = []
+        self.access_cards = []
+        self.assignments = []
+        self.access_card_logs = []
+
+    def add_user(self, user):
+        user['id'] = uuid_str()
+        user['last_updated_by_user_id'] = self.imported_by_user_id
+        self.users.append(user)
+        self.user_edit_logs.append({
+            'id': uuid_str(),
+            'user_id': user['id'],
+            'role': user['role'],
+            'status': user['status'],
+            'emerge_access_level': user['emerge_access_level'],
+            'updated_by_user_id': self.imported_by_user_id,
+        })
+        return user['id']
+
+    def add_access_card(self, card):
+        card['id'] = uuid_str()
+        card['last_updated_by_user_id'] = self.imported_by_user_id
+        self.access_cards.append(card)
+        self._log_card(card['id'], None, card['status'], None)
+        return card['id']
+
+    def add_assignment(self, access_card_id, status, user_id,
+                       emerge_access_level):
+        self.assignments.append({
+            'id': uuid_str(),
+            'assigned_to_user_id': user_id,
+            'access_card_id': access_card_id,
+            'assigned_by_user_id': self.imported_by_user_id,
+        })
+        self._log_card(access_card_id, user_id, status, emerge_access_level)
+
+    def _log_card(self, access_card_id, user_id, status, emerge_access_level):
+        self.access_card_logs.append({
+            'id': uuid_str(),
+            'access_card_id': access_card_id,
+            'assigned_by_user_id': self.imported_by_user_id,
+            'assigned_to_user_id': user_id,
+            'status': status,
+            'emerge_access_level': emerge_access_level,
+        })
+
+    # insert everything in one transaction, returns the error if it failed
+    def save(self):
+        try:
+            for model, rows in [
+                (User, self.users),
+                (UserEditLog, self.user_edit_logs),
+                (AccessCard, self.access_cards),
+                (UserAccessCard, self.assignments),
+                (AccessCardLog, self.access_card_logs),
+            ]:
+                if rows:
+                    db.session.execute(insert(model), rows)
+            db.session.commit()
+        except Exception as err:
+            db.session.rollback()
+            return err
+        return None
+
+
+def _batch_failed(lines, result, action, err):
+    for line in lines:
+        result['errors'].append({
+            'row': line,
+            'error': 'unable to %s the batch this row is in: %s'
+            % (action, err.__class__.__name__)
+        })
+
+
+def _save_batch(batch, lines, counts, result):
+    err = batch.save()
+    if err is None:
+        for key, count in counts.items():
+            result['created'][key] += count
+        return
+    _batch_failed(lines, result, 'save', err)
+
+
+# import users, with an optional access card to create or assign to each
+def _import_user_batch(rows, imported_by_user_id, result):
+    parsed = []
+    for line, row in rows:
+        try:
+            if not row.get('username'):
+                raise ValueError('missing username')
+            user = {
+                'username': row['username'],
+                'first_name': row.get('firstName') or None,
+                'last_name': row.get('lastName') or None,
+                'role': _enum_value(
+                    UserRoleEnum, row.get('role'), default_role, 'role'
+                ),
+                'emerge_access_level': _enum_value(
+                    UserEmergeAccessLevelEnum,
+                    row.get('eMergeAccessLevel'),
+                    UserEmergeAccessLevelEnum.FULL_DAY_ACCESS,
+                    'eMergeAccessLevel'
+                ),
+                'status': _enum_value(
+                    UserStatusEnum,
+                    row.get('status'),
+                    UserStatusEnum.ACTIVE,
+                    'status'
+                ),
+            }
+            card = _parse_card(row)
+            if card and user['status'] != UserStatusEnum.ACTIVE:
+                raise ValueError(
+                    'access cards can only be assigned to active users'
+                )
+        except ValueError as err:
+            result['errors'].append({'row': line, 'error': str(err)})
+            continue
+        parsed.append((line, user, card, row.get('password')))
+
+    usernames = {user['username'] for _, user, _, _ in parsed}
+    existing_usernames = set()
+    if usernames:
+        existing_usernames = {
+            row.username for row in db.session.query(User.username)
+            .filter(User.username.in_(usernames))
+        }
+    existing_cards = _existing_cards(
+        {card['card_number'] for _, _, card, _ in parsed if card}
+    )
+
+    batch = _Batch(imported_by_user_id)
+    counts = {'users': 0, 'accessCards': 0, 'assignments': 0}
+    lines = []
+    seen_cards = set()
+    passwords = []
+    for line, user, card, password in parsed:
+        error = None
+        if user['username'] in existing_usernames:
+            error = 'a user with that username already exists'
+        elif card and card['card_number'] in seen_cards:
+            error = 'the access card is already in this file'
+        elif card and card['card_number'] in existing_cards:
+            existing = existing_cards[card['card_number']]
+            if existing.assignment_id:
+                error = 'the access card is already assigned'
+            elif existing.status != AccessCardStatusEnum.ACTIVE:
+                error = 'the access card is not active'
+        if error:
+            result['errors'].append({'row': line, 'error': error})
+            continue
+
+        existing_usernames.add(user['username'])
+        user['_password'] = unusable_password
+        if password:
+            passwords.append((user, password))
+        user_id = batch.add_user(user)
+        counts['users'] += 1
+
+        if card:
+            seen_cards.add(card['card_number'])
+            existing = existing_cards.get(card['card_number'])
+            if existing:
+                access_card_id = existing.id
+            else:
+                access_card_id = batch.add_access_card(card)
+                counts['accessCards'] += 1
+            batch.add_assignment(
+                access_card_id,
+                AccessCardStatusEnum.ACTIVE,
+                user_id,
+                user['emerge_access_level']
+            )
+            counts['assignments'] += 1
+        lines.append(line)
+
+    # end the read transaction, no connection is held while the hasher's
+    # workers run. The batch is saved in a transaction of its own.
+    db.session.commit()
+    # hashed together so the batch's passwords use all the hasher's workers
+    try:
+        hashes = hash_passwords([password for _, password in passwords])
+    except Exception as err:
+        _batch_failed(lines, result, 'hash the passwords of', err)
+        return
+    for (user, _), pwhash in zip(passwords, hashes):
+        user['_password'] = pwhash
+
+    _save_batch(batch, lines, counts, result)
+
+
+# import access cards, each optionally assigned to an existing user
+def _import_access_card_batch(rows, imported_by_user_id, result):
+    parsed = []
+    for line, row in rows:
+        try:
+            if not row.get('cardNumber'):
+                raise ValueError('missing cardNumber')
+            card = _parse_card(row, row.get('status'))
+        except ValueError as err:
+            result['errors'].append({'row': line, 'error': str(err)})
+            continue
+        parsed.append((line, card, row.get('username')))
+
+    existing_cards = _existing_cards(
+        {card['card_number'] for _, card, _ in parsed}
+    )
+    usernames = {username for _, _, username in parsed if username}
+    users = {}
+    if usernames:
+        users = {
+            user.username: user for user in db.session.query(
+                User.id,
+                User.username,
+                User.status,
+                User.emerge_access_level
+            ).filter(User.username.in_(usernames))
+        }
+
+    batch = _Batch(imported_by_user_id)
+    counts = {'users': 0, 'accessCards': 0, 'assignments': 0}
+    lines = []
+    seen_cards = set()
+    for line, card, username in parsed:
+        user = users.get(username)
+        error = None
+        if card['card_number'] in existing_cards \
+                or card['card_number'] in seen_cards:
+            error = 'an access card with that number already exists'
+        elif username and not user:
+            error = 'unable to find a user with that username'
+        elif user and user.status != UserStatusEnum.ACTIVE:
+            error = 'access cards can only be assigned to active users'
+        elif user and card['status'] != AccessCardStatusEnum.ACTIVE:
+            error = 'only active access cards can be assigned'
+        if error:
+            result['errors'].append({'row': line, 'error': error})
+            continue
+
+        seen_cards.add(card['card_number'])
+        access_card_id = batch.add_access_card(card)
+        counts['accessCards'] += 1
+        if user:
+            batch.add_assignment(
+                access_card_id,
+                card['status'],
+                user.id,
+                user.emerge_access_level
+            )
+            counts['assignments'] += 1
+        lines.append(line)
+
+    _save_batch(batch, lines, counts, result)
+
+
+def _import(import_batch, file, required_columns, imported_by_user_id,
+            batch_size):
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    result = _new_result()
+    rows = _read_csv_rows(file, required_columns, result)
+    for batch in _batches(rows, batch_size):
+        result['rowCount'] += len(batch)
+        import_batch(batch, imported_by_user_id, result)
+    # rows that can't be read are reported as they're read, and a batch
+    # reports validation errors before the ones found on save
+    result['errors'].sort(key=lambda error: error['row'])
+    return result
+
+
+# reload the access card index and the access allowlists after an import,
+# a failing refresh only means they're behind until their next refresh
+def refresh_imported_caches():
+    for refresh in [
+        access_card_index.load_access_card_index,
+        refresh_access_allowlists
+    ]:
+        try:
+            refresh()
+        except Exception:
+            traceback.print_exc()
+
+
+def import_users_csv(file, imported_by_user_id, batch_size=None):
+    return _import(
+        _import_user_batch,
+        file,
+        ['username'],
+        imported_by_user_id,
+        batch_size
+    )
+
+
+def import_access_cards_csv(file, imported_by_user_id, batch_size=None):
+    return _import(
+        _import_access_card_batch,
+        file,
+        ['cardNumber'],
+        imported_by_user_id,
+        batch_size
+    )
@@ -0,0 +1,209 @@
+# process-local index of access card assignments and access nodes used by the
+# scan endpoint so a card scan can be resolved without a database round trip
+#
+# The index is loaded at startup and kept current by the write endpoints
+# that change cards, users, card assignments or access nodes. Each of those
+# queues one of the refresh_* functions below to run once the request is
+# committed, see app/unit_of_work.py. Changes made elsewhere, by another API
+# process, `flask bulk-import` or directly in the database, are picked up by
+# the scheduled full reload every ACCESS_CARD_INDEX_RELOAD_SECONDS.
+
+import threading
+from collections import namedtuple
+from sqlalchemy import exc
+from ..database import db
+from ..models import AccessCard, UserAccessCard, User, AccessNode
+
+AccessCardIndexEntry = namedtuple('AccessCardIndexEntry', [
+    'user_id',
+    'access_card_id',
+    'card_number',
+    'facility_code',
+    'card_status',
+    'user_status',
+    'emerge_access_level',
+])
+
+AccessNodeIndexEntry = namedtuple('AccessNodeIndexEntry', [
+    'id',
+    'device_id',
+    'status',
+])
+
+_lock = threading.RLock()
+_loaded = False
+# bumped by every refresh_* call, a full reload that was overtaken by one
+# leaves the index as it is rather than undo it, the next reload catches up
+_generation = 0
+# (card_number, facility_code) -> AccessCardIndexEntry
+_cards = {}
+# card_number -> (card_number, facility_code), for scans without a facility
+# code (card numbers are unique per access card)
+_card_numbers = {}
+# access_card_id -> (card_number, facility_code)
+_card_ids = {}
+# access_node_id -> AccessNodeIndexEntry
+_nodes = {}
+
+
+def _card_query():
+    return db.session.query(
+        UserAccessCard.assigned_to_user_id,
+        AccessCard.id,
+        AccessCard.card_number,
+        AccessCard.facility_code,
+        AccessCard.status.label('card_status'),
+        User.status.label('user_status'),
+        User.emerge_access_level
+    ) \
+        .join(
+            UserAccessCard,
+            UserAccessCard.access_card_id == AccessCard.id
+        ) \
+        .join(User, User.id == UserAccessCard.assigned_to_user_id) \
+        .order_by(UserAccessCard.created_at)
+
+
+def _node_query():
+    return db.session.query(
+        AccessNode.id,
+        AccessNode.device_id,
+        AccessNode.status
+    )
+
+
+def _entry_from_row(row):
+    return AccessCardIndexEntry(
+        user_id=row.assigned_to_user_id,
+        access_card_id=row.id,
+        card_number=row.card_number,
+        facility_code=row.facility_code,
+        card_status=row.card_status,
+        user_status=row.user_status,
+        emerge_access_level=row.emerge_access_level
+    )
+
+
+def _remove_card(access_card_id):
+    key = _card_ids.pop(access_card_id, None)
+    if key is None:
+        return
+    _cards.pop(key, None)
+    if _card_numbers.get(key[0]) == key:
+        _card_numbers.pop(key[0], None)
+
+
+def _add_card(entry):
+    key = (entry.card_number, entry.facility_code)
+    # a card assigned to more than one user resolves to the first assignment,
+    # matching the previous .first() lookup
+    if entry.access_card_id in _card_ids:
+        return
+    _cards[key] = entry
+    _card_numbers[entry.card_number] = key
+    _card_ids[entry.access_card_id] = key
+
+
+# (re)build the full index from the database
+def load_access_card_index():
+    global _loaded
+    generation = _generation
+    try:
+        card_rows = _card_query().all()
+        node_rows = _node_query().all()
+    except (exc.OperationalError, exc.ProgrammingError):
+        # tables don't exist yet e.g. before `flask db upgrade`, try again on
+        # first lookup
+        db.session.rollback()
+        return False
+
+    with _lock:
+        if _loaded and generation != _generation:
+            return False
+        _cards.clear()
+        _card_numbers.clear()
+        _card_ids.clear()
+        _nodes.clear()
+        for row in card_rows:
+            _add_card(_entry_from_row(row))
+        for row in node_rows:
+            _nodes[row.id] = AccessNodeIndexEntry(
+                id=row.id,
+                device_id=row.device_id,
+                status=row.status
+            )
+        _loaded = True
+    return True
+
+
+def _ensure_loaded():
+    if not _loaded:
+        load_access_card_index()
+
+
+# find the assignment for a scanned card, facility code is optional
+def lookup_access_card(card_number, facility_code=None):
+    _ensure_loaded()
+    with _lock:
+        if facility_code is None:
+            key = _card_numbers.get(card_number)
+            if key is None:
+                return None
+            return _cards.get(key)
+        return _cards.get((card_number, facility_code))
+
+
+def lookup_access_node(access_node_id):
+    _ensure_loaded()
+    with _lock:
+        return _nodes.get(access_node_id)
+
+
+def _changed():
+    global _generation
+    _generation += 1
+
+
+# reload a single access card after it or its assignment changed
+def refresh_access_card(access_card_id):
+    if not _loaded:
+        return
+    rows = _card_query().filter(AccessCard.id == access_card_id).all()
+    with _lock:
+        _changed()
+        _remove_card(access_card_id)
+        for row in rows:
+            _add_card(_entry_from_row(row))
+
+
+# reload every access card assigned to a user after the user changed
+def refresh_user(user_id):
+    if not _loaded:
+        return
+    with _lock:
+        card_ids = {
+            entry.access_card_id for entry in _cards.values()
+            if entry.user_id == user_id
+        }
+    rows = _card_query() \
+        .filter(UserAccessCard.assigned_to_user_id == user_id) \
+        .all()
+    card_ids.update(row.id for row in rows)
+    for access_card_id in card_ids:
+        refresh_access_card(access_card_id)
+
+
+# reload a single access node after it changed
+def refresh_access_node(access_node_id):
+    if not _loaded:
+        return
+    row = _node_query().filter(AccessNode.id == access_node_id).first()
+    with _lock:
+        _changed()
+        _nodes.pop(access_node_id, None)
+        if row:
+            _nodes[row.id] = AccessNodeIndexEntry(
+                id=row.id,
+                device_id=row.device_id,
+                status=row.status
+            )
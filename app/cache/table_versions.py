@@ -0,0 +1,141 @@
+# change counter per table, used for ETags on GET endpoints
+#
+# Every commit that inserted, updated or deleted rows bumps the versions of
+# the tables it wrote to. Session events pick the tables up from the ORM
+# flush and from bulk insert()/update()/delete() statements, so endpoints,
+# the scan log writer and scheduled tasks don't have to remember to bump
+# anything. A rolled back transaction bumps nothing.
+#
+# The versions are kept in the table_version table and bumped in the same
+# transaction as the change, just before it commits, so every API server and
+# the `flask bulk-import` command see each other's changes and a 304 is
+# never answered for a copy that's out of date. Rows are upserted in table
+# name order so two transactions can't deadlock on them. Changes made with
+# SQL outside the app (psql, sqlite3) don't bump anything, clients can keep
+# getting 304s for those until the table changes through the app again.
+
+import threading
+from datetime import datetime
+from datetime import timezone
+from sqlalchemy import event
+from sqlalchemy import exc
+from sqlalchemy import inspect
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+from ..database import db
+from ..models import TableVersion
+
+_lock = threading.Lock()
+_tracking = False
+_table_exists = False
+
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+def _after_flush(session, flush_context):
+    tables = _changed_tables(session)
+    for instance in list(session.new) + list(session.dirty) \
+            + list(session.deleted):
+        table = getattr(instance, '__table__', None)
+        if table is not None:
+            tables.add(table.name)
+
+
+def _do_orm_execute(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update
+            or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None and hasattr(table, 'name'):
+        _changed_tables(orm_execute_state.session).add(table.name)
+
+
+def _before_commit(session):
+    # flush first, the pending objects tell which tables change
+    session.flush()
+    tables = session.info.pop('changed_tables', None)
+    if tables and _has_version_table(session.connection()):
+        bump_table_versions(session.connection(), tables)
+
+
+# `flask db upgrade` imports the app too, its startup commits can't bump
+# anything before the table_version migration ran
+def _has_version_table(connection):
+    global _table_exists
+    if not _table_exists:
+        _table_exists = inspect(connection).has_table(
+            TableVersion.__tablename__
+        )
+    return _table_exists
+
+
+def _after_rollback(session):
+    session.info.pop('changed_tables', None)
+
+
+# register the session events, called once at startup
+def track_table_changes():
+    global _tracking
+    with _lock:
+        if _tracking:
+            return
+        _tracking = True
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'before_commit', _before_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+
+
+# add one to the versions of the tables within the connection's transaction
+def bump_table_versions(connection, tables):
+    insert = postgresql.insert \
+        if connection.dialect.name == 'postgresql' else sqlite.insert
+    now = datetime.now(timezone.utc)
+    statement = insert(TableVersion).values([
+        {'table_name': table, 'version': 1, 'changed_at': now}
+        for table in sorted(tables)
+    ])
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[TableVersion.table_name],
+        set_={
+            'version': TableVersion.version + 1,
+            'changed_at': statement.excluded.changed_at,
+        }
+    ))
+
+
+# the version and change time of each table and the unix time the latest
+# of them changed (None if none did). None before the table_version
+# migration ran
+def table_versions(tables):
+    try:
+        rows = db.session.execute(
+            select(
+                TableVersion.table_name,
+                TableVersion.version,
+                TableVersion.changed_at
+            )
+            .where(TableVersion.table_name.in_(tables))
+        ).all()
+    except (exc.OperationalError, exc.ProgrammingError):
+        db.session.rollback()
+        return None
+
+    changed = {
+        row.table_name: (
+            row.version,
+            row.changed_at.replace(tzinfo=timezone.utc).timestamp()
+        )
+        for row in rows
+    }
+    # the change times tell versions apart after the database was recreated
+    versions = [(table,) + changed.get(table, (0, None)) for table in tables]
+    changed_at = max(
+        [changed_at for version, changed_at in changed.values()],
+        default=None
+    )
+    return versions, changed_at
@@ -0,0 +1,139 @@
+# process-local copy of the revoked JWT ids in TokenBlocklist so the check that
+# runs on every authenticated request doesn't need a database query
+#
+# Each jti is kept until the token it belongs to would have expired anyway,
+# after that flask_jwt_extended rejects the token before asking about the
+# blocklist, so the set only ever holds tokens revoked within the last
+# JWT_REFRESH_TOKEN_EXPIRES. It is warmed from TokenBlocklist at startup,
+# added to on logout and pruned by the remove_old_tokens scheduled task.
+#
+# Logouts handled by other processes only reach TokenBlocklist, so every
+# TOKEN_BLOCKLIST_RELOAD_SECONDS the next check also loads the rows created
+# since the previous load. Rows are looked up from a minute before it, a row
+# created_at then may only have been committed after that load.
+
+import threading
+import time
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from sqlalchemy import exc
+from ..database import db
+from ..models import TokenBlocklist
+from ..metrics import cache_lookups
+
+_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_loaded = False
+# jti -> unix timestamp after which the token is expired
+_revoked = {}
+# when the last load started, and the time.monotonic() of the next reload
+_loaded_at = None
+_reload_at = 0
+
+_RELOAD_OVERLAP = timedelta(minutes=1)
+
+
+def _token_expires(app, token_type):
+    if token_type == 'refresh':
+        return app.config['JWT_REFRESH_TOKEN_EXPIRES']
+    return app.config['JWT_ACCESS_TOKEN_EXPIRES']
+
+
+# revoked tokens created_at or after oldest, jti -> expiry timestamp. None
+# when the table doesn't exist yet
+def _query_revoked(app, oldest):
+    try:
+        rows = db.session.query(
+            TokenBlocklist.jti,
+            TokenBlocklist.type,
+            TokenBlocklist.created_at
+        ) \
+            .filter(TokenBlocklist.created_at >= oldest) \
+            .all()
+    except (exc.OperationalError, exc.ProgrammingError):
+        # tables don't exist yet e.g. before `flask db upgrade`
+        db.session.rollback()
+        return None
+
+    revoked = {}
+    for row in rows:
+        # a token is always issued before it is revoked, so created_at plus
+        # its lifetime is a safe upper bound for its expiry
+        expires_at = row.created_at + _token_expires(app, row.type)
+        revoked[row.jti] = expires_at.replace(tzinfo=timezone.utc).timestamp()
+    return revoked
+
+
+# load revoked tokens that may not have expired yet from the database
+def load_token_blocklist():
+    global _loaded, _loaded_at, _reload_at
+    from ..app import app
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    revoked = _query_revoked(app, now - max(
+        app.config['JWT_ACCESS_TOKEN_EXPIRES'],
+        app.config['JWT_REFRESH_TOKEN_EXPIRES']
+    ))
+    if revoked is None:
+        return False
+
+    with _lock:
+        _revoked.clear()
+        _revoked.update(revoked)
+        _loaded = True
+        _loaded_at = now
+        _reload_at = time.monotonic() + \
+            app.config['TOKEN_BLOCKLIST_RELOAD_SECONDS']
+    return True
+
+
+# add the tokens revoked since the last load, only one thread at a time
+# reloads, the others keep using the cache meanwhile
+def _reload_recent():
+    global _loaded_at, _reload_at
+    from ..app import app
+
+    if not _reload_lock.acquire(blocking=False):
+        return
+    try:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        revoked = _query_revoked(app, _loaded_at - _RELOAD_OVERLAP)
+        if revoked is None:
+            return
+        with _lock:
+            _revoked.update(revoked)
+            _loaded_at = now
+            _reload_at = time.monotonic() + \
+                app.config['TOKEN_BLOCKLIST_RELOAD_SECONDS']
+    finally:
+        _reload_lock.release()
+
+
+# remember a token revoked on logout, expires_at is the token's exp claim
+def add_revoked_token(jti, expires_at):
+    with _lock:
+        _revoked[jti] = expires_at
+
+
+def is_token_revoked(jti):
+    if not _loaded and not load_token_blocklist():
+        # no cache available, ask the database directly
+        cache_lookups.inc(cache='token_blocklist', result='miss')
+        token = db.session.query(TokenBlocklist.id) \
+            .filter_by(jti=jti).scalar()
+        return token is not None
+    if time.monotonic() >= _reload_at:
+        _reload_recent()
+    cache_lookups.inc(cache='token_blocklist', result='hit')
+    return jti in _revoked
+
+
+# forget revoked tokens that have expired
+def prune_token_blocklist():
+    now = datetime.now(timezone.utc).timestamp()
+    with _lock:
+        expired = [jti for jti, exp in _revoked.items() if exp < now]
+        for jti in expired:
+            del _revoked[jti]
+    return len(expired)
@@ -0,0 +1,79 @@
+# small TTL + LRU cache of the user behind a JWT, used as flask_jwt_extended's
+# current_user so protected requests don't load the full User row every time
+#
+# Entries are read-only snapshots of the fields endpoints use from
+# current_user (not ORM objects, which can't be shared between requests).
+# The user update and archive endpoints invalidate the entry so role and
+# status changes apply on the next request, the TTL bounds staleness from any
+# other kind of change e.g. a direct database edit.
+
+import threading
+import time
+from collections import OrderedDict
+from collections import namedtuple
+from ..models import User
+from ..metrics import cache_lookups
+
+CachedUser = namedtuple('CachedUser', [
+    'id',
+    'username',
+    'first_name',
+    'last_name',
+    'role',
+    'status',
+    'emerge_access_level',
+])
+
+_lock = threading.Lock()
+# user id -> (expires at, CachedUser), least recently used first
+_users = OrderedDict()
+
+
+def _load_user(user_id):
+    user = User.query.with_entities(
+        User.id,
+        User.username,
+        User.first_name,
+        User.last_name,
+        User.role,
+        User.status,
+        User.emerge_access_level
+    ) \
+        .filter_by(id=user_id) \
+        .one_or_none()
+    if user is None:
+        return None
+    return CachedUser(*user)
+
+
+# get the user for a JWT identity, None if the user doesn't exist
+def get_user_identity(user_id):
+    from ..app import app
+    ttl = app.config['USER_IDENTITY_CACHE_TTL']
+    max_size = app.config['USER_IDENTITY_CACHE_SIZE']
+
+    now = time.monotonic()
+    with _lock:
+        cached = _users.get(user_id)
+        if cached is not None and cached[0] > now:
+            _users.move_to_end(user_id)
+            cache_lookups.inc(cache='user_identity', result='hit')
+            return cached[1]
+
+    cache_lookups.inc(cache='user_identity', result='miss')
+    user = _load_user(user_id)
+    if user is None or ttl <= 0 or max_size <= 0:
+        return user
+
+    with _lock:
+        _users[user_id] = (now + ttl, user)
+        _users.move_to_end(user_id)
+        while len(_users) > max_size:
+            _users.popitem(last=False)
+    return user
+
+
+# drop a user so the next request reloads it e.g. after a role change
+def invalidate_user_identity(user_id):
+    with _lock:
+        _users.pop(user_id, None)
@@ -0,0 +1,65 @@
+import click
+from flask.cli import AppGroup
+from .models import User
+from .model_enums import UserRoleEnum
+from .bulk_import import import_users_csv, import_access_cards_csv
+from .query.access_allowlists import refresh_access_allowlists
+
+# flask bulk-import users|access-cards FILE --by ADMIN-USERNAME
+bulk_import_cli = AppGroup(
+    'bulk-import',
+    help='Import users or access cards from a CSV file.'
+)
+
+
+def _run_import(import_csv, file, by, batch_size):
+    user = User.query.filter_by(username=by).first()
+    if not user or user.role != UserRoleEnum.ADMIN:
+        raise click.UsageError('--by has to be the username of an admin')
+
+    try:
+        results = import_csv(file, user.id, batch_size)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    finally:
+        # also for the batches saved before a failure. Allowlists are stored
+        # in the database, running API servers load the new cards into their
+        # scan index on its next reload (ACCESS_CARD_INDEX_RELOAD_SECONDS)
+        refresh_access_allowlists()
+
+    created = results['created']
+    click.echo(
+        '%s rows: %s users, %s access cards and %s assignments created'
+        % (
+            results['rowCount'],
+            created['users'],
+            created['accessCards'],
+            created['assignments']
+        )
+    )
+    for error in results['errors']:
+        click.echo('line %s: %s' % (error['row'], error['error']), err=True)
+    if results['errors']:
+        raise click.exceptions.Exit(1)
+
+
+@bulk_import_cli.command(
+    'users',
+    help='Import users, each with an optional access card.'
+)
+@click.argument('file', type=click.File('rb'))
+@click.option('--by', required=True, help='Username of the importing admin.')
+@click.option('--batch-size', type=int, help='Rows per transaction.')
+def import_users_command(file, by, batch_size):
+    _run_import(import_users_csv, file, by, batch_size)
+
+
+@bulk_import_cli.command(
+    'access-cards',
+    help='Import access cards, each optionally assigned to a user.'
+)
+@click.argument('file', type=click.File('rb'))
+@click.option('--by', required=True, help='Username of the importing admin.')
+@click.option('--batch-size', type=int, help='Rows per transaction.')
+def import_access_cards_command(file, by, batch_size):
+    _run_import(import_access_cards_csv, file, by, batch_size)
@@ -1,3 +1,158 @@
+import time
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+from .metrics import db_connection_wait
 
 db = SQLAlchemy()
+
+# PRAGMA values accepted from configuration, anything else is rejected rather
+# than formatted into SQL
+_sqlite_pragma_choices = {
+    'journal_mode': ['DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'],
+    'synchronous': ['OFF', 'NORMAL', 'FULL', 'EXTRA'],
+}
+
+
+def _sqlite_pragma_value(name, value):
+    choices = _sqlite_pragma_choices.get(name)
+    if choices is None:
+        return int(value)
+    value = str(value).upper()
+    if value not in choices:
+        raise ValueError('invalid sqlite %s: %s' % (name, value))
+    return value
+
+
+# The default connection pool, recording how long each checkout waited for
+# a free connection (tesla_db_connection_wait_seconds in /api/metrics).
+# In-memory SQLite databases still get Flask-SQLAlchemy's StaticPool.
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_connection_wait.observe(time.perf_counter() - started)
+
+
+# engine keyword arguments for SQLALCHEMY_ENGINE_OPTIONS, only the pool
+# settings that are configured are passed so SQLAlchemy defaults still apply
+def engine_options(pool_size=None, max_overflow=None, pool_timeout=None,
+                   pool_recycle=None, pool_pre_ping=False):
+    options = {'poolclass': TimedQueuePool}
+    if pool_size is not None:
+        options['pool_size'] = int(pool_size)
+    if max_overflow is not None:
+        options['max_overflow'] = int(max_overflow)
+    if pool_timeout is not None:
+        options['pool_timeout'] = int(pool_timeout)
+    if pool_recycle is not None:
+        options['pool_recycle'] = int(pool_recycle)
+    if pool_pre_ping:
+        options['pool_pre_ping'] = True
+    return options
+
+
+# Run the PRAGMA statements on every new SQLite connection, these settings
+# are per connection (except journal_mode which sticks to the file) so they
+# can't be set once at startup. Other databases are left alone.
+def apply_sqlite_pragmas(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    statements = [
+        'PRAGMA %s=%s' % (name, _sqlite_pragma_value(name, value))
+        for name, value in pragmas.items()
+        if value is not None
+    ]
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+
+# PostgreSQL connections use UTC, so date strings in report filters and the
+# date() of a timestamp mean the same UTC days as they do on SQLite
+def apply_postgresql_timezone(engine):
+    if engine.dialect.name != 'postgresql':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_utc_timezone(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET TIME ZONE 'UTC'")
+        cursor.close()
+        # SET is undone if the transaction it ran in is rolled back
+        dbapi_connection.commit()
+
+
+# Lock the single row of a state table (e.g. DeviceUsageRollupState) until
+# the session's transaction ends, so a refresh runs in one process at a time
+# even with several API servers or a CLI command on the same database. The
+# row is created when it doesn't exist yet. Call it before the transaction
+# reads anything, the refresh then reads the data other refreshes committed.
+#
+# PostgreSQL locks the row with SELECT ... FOR UPDATE. With wait=False a row
+# locked by another transaction isn't waited for and None is returned, the
+# caller skips its run. SQLite has no row locks, the insert takes the
+# database write lock which other writers always wait for (up to the busy
+# timeout), so there wait=False still waits.
+def lock_state_row(model, row_id, wait=True):
+    dialect = db.engine.dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    db.session.execute(
+        insert(model).values(id=row_id).on_conflict_do_nothing()
+    )
+    return db.session.scalars(
+        select(model)
+        .filter_by(id=row_id)
+        .with_for_update(skip_locked=not wait)
+        .execution_options(populate_existing=True)
+    ).first()
+
+
+# Store uuid keys on SQLite as 16 byte blobs instead of 36 character strings,
+# which more than halves the size of the keys and their indexes. The setting
+# has to match the data, the compact uuid keys migration converts existing
+# rows and the database settings migration records the format. Raises
+# RuntimeError when the setting doesn't match the recorded format, the keys
+# wouldn't be found. PostgreSQL always stores 16 byte native uuids.
+def apply_compact_uuid_keys(engine, enabled):
+    if engine.dialect.name != 'sqlite':
+        return
+    stored = stored_compact_uuid_keys(engine)
+    if stored is not None and stored != bool(enabled):
+        raise RuntimeError(
+            'TESLA_COMPACT_UUID_KEYS is %s but the database stores uuid keys '
+            'as %s. Start with TESLA_COMPACT_UUID_KEYS=%s, or to change the '
+            'format run `flask db downgrade e7e7ee01edaf` with the current '
+            'setting and `flask db upgrade` with the new one.' % (
+                '1' if enabled else 'unset',
+                '16 byte blobs' if stored else '36 character strings',
+                '1' if stored else '0',
+            )
+        )
+    engine.dialect.compact_uuid_keys = bool(enabled)
+
+
+# the uuid key format recorded by the migrations, True for 16 byte blobs.
+# None before the database settings migration ran, e.g. while it's upgraded.
+def stored_compact_uuid_keys(engine):
+    try:
+        with engine.connect() as conn:
+            value = conn.execute(text(
+                'SELECT value FROM database_setting '
+                'WHERE name = \'compact_uuid_keys\''
+            )).scalar()
+    except OperationalError:
+        return None
+    return None if value is None else value == '1'
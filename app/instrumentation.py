@@ -0,0 +1,190 @@
+# opt-in per-request timing, turned on with TESLA_INSTRUMENTATION=1
+#
+# Each request records its wall time, the number and total time of its SQL
+# statements (SQLAlchemy cursor events) and the time spent in the steps
+# wrapped with timed(), e.g. the token blocklist check, the current_user
+# lookup and JSON serialization. They're returned in a Server-Timing header,
+# which browser dev tools show next to the request, e.g.
+#   Server-Timing: total;dur=12.41, sql;dur=3.02;desc="4 statements",
+#       user;dur=0.05, blocklist;dur=0.01, serialize;dur=0.37
+# and added up per endpoint for GET /api/admin/requestStats.
+#
+# The total runs from this module's before_request to its after_request,
+# which wrap every other request hook except the metrics ones (see
+# instrument_app()), so it includes the unit of work commit but not
+# streaming a response body. SQL run outside a request, e.g. by the scan
+# log writer thread, isn't counted.
+
+import threading
+import time
+from contextlib import contextmanager
+from flask import g
+from flask import has_request_context
+from flask import request
+from sqlalchemy import event
+
+_enabled = False
+_stats_lock = threading.Lock()
+# (method, url rule) -> totals, see _EndpointStats
+_endpoint_stats = {}
+
+
+class _RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        # step name -> seconds, in the order the steps first ran
+        self.steps = {}
+
+    def add_step(self, name, seconds):
+        self.steps[name] = self.steps.get(name, 0.0) + seconds
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.error_count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.steps = {}
+
+    def add(self, seconds, timings, status_code):
+        self.count += 1
+        if status_code >= 500:
+            self.error_count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.sql_count += timings.sql_count
+        self.sql_seconds += timings.sql_seconds
+        for name, step_seconds in timings.steps.items():
+            self.steps[name] = self.steps.get(name, 0.0) + step_seconds
+
+
+def _milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _current_timings():
+    if not _enabled or not has_request_context():
+        return None
+    return g.get('request_timings')
+
+
+# time a step of the current request, a no-op unless instrumentation is on
+@contextmanager
+def timed(name):
+    timings = _current_timings()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_step(name, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('instrumentation_started', []) \
+        .append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = conn.info['instrumentation_started'].pop()
+    timings = _current_timings()
+    if timings is not None:
+        timings.sql_count += 1
+        timings.sql_seconds += time.perf_counter() - started
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get(
+            'instrumentation_started'):
+        connection.info['instrumentation_started'].pop()
+
+
+def _start_request():
+    g.request_timings = _RequestTimings()
+
+
+def _server_timing(total_seconds, timings):
+    metrics = ['total;dur=%.2f' % (total_seconds * 1000)]
+    metrics.append('sql;dur=%.2f;desc="%d statements"' % (
+        timings.sql_seconds * 1000,
+        timings.sql_count
+    ))
+    for name, seconds in timings.steps.items():
+        metrics.append('%s;dur=%.2f' % (name, seconds * 1000))
+    return ', '.join(metrics)
+
+
+def _finish_request(response):
+    timings = g.pop('request_timings', None)
+    if timings is None:
+        return response
+    total_seconds = time.perf_counter() - timings.started
+    response.headers['Server-Timing'] = _server_timing(total_seconds, timings)
+
+    rule = request.url_rule.rule if request.url_rule else '(unmatched)'
+    key = (request.method, rule)
+    with _stats_lock:
+        stats = _endpoint_stats.get(key)
+        if stats is None:
+            stats = _endpoint_stats[key] = _EndpointStats()
+        stats.add(total_seconds, timings, response.status_code)
+    return response
+
+
+# Register the request and SQL hooks when app.config['INSTRUMENTATION'] is
+# set. After request functions run in reverse order of registration: app.py
+# calls this after track_requests() and before profile_requests() and the
+# unit of work commit are registered, so this one runs after the commit and
+# the profiler, just before the metrics.
+def instrument_app(app, engine):
+    global _enabled
+    if not app.config['INSTRUMENTATION'] or _enabled:
+        return
+    _enabled = True
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def instrumentation_enabled():
+    return _enabled
+
+
+# per endpoint totals and averages since the server started, slowest total
+# first
+def endpoint_stats():
+    with _stats_lock:
+        items = list(_endpoint_stats.items())
+        rows = []
+        for (method, rule), stats in items:
+            rows.append({
+                'method': method,
+                'endpoint': rule,
+                'count': stats.count,
+                'errorCount': stats.error_count,
+                'totalMs': _milliseconds(stats.total_seconds),
+                'avgMs': _milliseconds(stats.total_seconds / stats.count),
+                'maxMs': _milliseconds(stats.max_seconds),
+                'sqlCount': stats.sql_count,
+                'avgSqlCount': round(stats.sql_count / stats.count, 2),
+                'sqlMs': _milliseconds(stats.sql_seconds),
+                'avgSqlMs': _milliseconds(stats.sql_seconds / stats.count),
+                'stepsMs': {
+                    name: _milliseconds(seconds)
+                    for name, seconds in stats.steps.items()
+                },
+            })
+    rows.sort(key=lambda row: row['totalMs'], reverse=True)
+    return rows
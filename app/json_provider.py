@@ -0,0 +1,117 @@
+# JSON encoding of API responses (jsonify, app.json)
+#
+# Uses orjson when it is installed, which serializes dicts, lists, datetimes
+# and the str enums in model_enums.py in native code. Without it the
+# standard library encoder is used, with one reusable encoder per set of
+# options rather than a new one per response. Both write sorted keys, are
+# compact unless in debug mode and write dates and datetimes as ISO 8601
+# like the .isoformat() values the endpoints already return (Flask's own
+# provider would use HTTP dates). orjson writes non-ASCII characters as
+# UTF-8 instead of \u escapes, which decodes to the same values.
+
+import json
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+from flask.json.provider import _default as flask_default
+from .instrumentation import timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    return flask_default(o)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+
+    def __init__(self, app):
+        super().__init__(app)
+        self._encoders = {}
+
+    def _indent(self):
+        if self.compact is None:
+            return self._app.debug
+        return not self.compact
+
+    def _orjson_option(self, sort_keys, indent):
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    # bytes with the same options as response(), or None when orjson can't
+    # encode the value e.g. an integer beyond 64 bits
+    def _orjson_dumps(self, obj, sort_keys, indent, default):
+        if orjson is None:
+            return None
+        try:
+            return orjson.dumps(
+                obj,
+                default=default,
+                option=self._orjson_option(sort_keys, indent)
+            )
+        except orjson.JSONEncodeError:
+            return None
+
+    def _stdlib_encoder(self, sort_keys, indent, default):
+        key = (sort_keys, indent, default)
+        encoder = self._encoders.get(key)
+        if encoder is None:
+            encoder = json.JSONEncoder(
+                default=default,
+                ensure_ascii=self.ensure_ascii,
+                sort_keys=sort_keys,
+                indent=2 if indent else None,
+                separators=None if indent else (',', ':')
+            )
+            self._encoders[key] = encoder
+        return encoder
+
+    def dumps(self, obj, **kwargs):
+        sort_keys = kwargs.pop('sort_keys', self.sort_keys)
+        default = kwargs.pop('default', self.default)
+        indent = kwargs.pop('indent', None)
+        kwargs.pop('separators', None)
+        # anything else, e.g. cls, is only understood by json.dumps()
+        if kwargs:
+            return json.dumps(
+                obj,
+                sort_keys=sort_keys,
+                default=default,
+                indent=indent,
+                **kwargs
+            )
+
+        data = self._orjson_dumps(obj, sort_keys, indent, default)
+        if data is not None:
+            return data.decode()
+        return self._stdlib_encoder(sort_keys, indent, default).encode(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self._indent()
+        with timed('serialize'):
+            data = self._orjson_dumps(
+                obj,
+                self.sort_keys,
+                indent,
+                self.default
+            )
+            if data is None:
+                data = self._stdlib_encoder(
+                    self.sort_keys,
+                    indent,
+                    self.default
+                ).encode(obj).encode()
+        return self._app.response_class(
+            data + b'\n',
+            mimetype=self.mimetype
+        )
@@ -0,0 +1,412 @@
+# in-process metrics served by GET /api/metrics in the Prometheus text
+# exposition format (version 0.0.4)
+#
+# Counters and histograms are updated where things happen (requests, scans,
+# cache lookups, database connection checkouts, scheduled jobs), gauges such
+# as queue depths are read when the endpoint is scraped. Values are per
+# process and start over when the server restarts, which Prometheus' rate()
+# and histogram_quantile() handle. e.g. to alert on slow scans:
+#   histogram_quantile(0.95, sum by (le) (rate(
+#     tesla_http_request_duration_seconds_bucket{
+#       route="/api/accessNodes/<access_node_id>/scan"}[5m])))
+
+import threading
+import time
+from flask import g
+from flask import request
+
+_lock = threading.Lock()
+_registry = []
+
+request_buckets = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+wait_buckets = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0
+)
+job_buckets = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, _escape(value)) for name, value in pairs
+    )
+
+
+# bucket bounds are written like the official clients do, e.g. 1.0 and +Inf
+def _format_bound(bound):
+    if bound == float('inf'):
+        return '+Inf'
+    return repr(float(bound))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        with _lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def _samples(self):
+        with _lock:
+            items = sorted(self._values.items())
+        return [
+            (self.name, _format_labels(self.labels, key), value)
+            for key, value in items
+        ]
+
+    def render(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.documentation),
+            '# TYPE %s %s' % (self.name, self.type),
+        ]
+        for name, labels, value in self._samples():
+            lines.append('%s%s %s' % (name, labels, _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+# value read by calling collect() at scrape time, which returns a number or
+# a dict of label value tuples to numbers
+class CallbackMetric(_Metric):
+    def __init__(self, name, documentation, type, collect, labels=()):
+        self.type = type
+        self.collect = collect
+        super().__init__(name, documentation, labels)
+
+    def _samples(self):
+        try:
+            values = self.collect()
+        except Exception:
+            return []
+        if values is None:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            (self.name, _format_labels(self.labels, key), value)
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        super().__init__(name, documentation, labels)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    # time the body of a with block
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with _lock:
+            items = sorted(
+                (key, ([*state[0]], state[1], state[2]))
+                for key, state in self._values.items()
+            )
+        samples = []
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((
+                    self.name + '_bucket',
+                    _format_labels(
+                        self.labels,
+                        key,
+                        [('le', _format_bound(bound))]
+                    ),
+                    cumulative
+                ))
+            labels = _format_labels(self.labels, key)
+            samples.append((self.name + '_count', labels, count))
+            samples.append((self.name + '_sum', labels, total))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(
+            time.perf_counter() - self.started,
+            **self.labels
+        )
+        return False
+
+
+def render_metrics():
+    with _lock:
+        metrics = list(_registry)
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+http_requests = Counter(
+    'tesla_http_requests_total',
+    'HTTP requests by method, route and status code.',
+    ['method', 'route', 'status']
+)
+http_request_duration = Histogram(
+    'tesla_http_request_duration_seconds',
+    'Time to handle an HTTP request including the database commit.',
+    ['method', 'route'],
+    request_buckets
+)
+_requests_in_progress = [0]
+http_requests_in_progress = CallbackMetric(
+    'tesla_http_requests_in_progress',
+    'HTTP requests being handled right now.',
+    'gauge',
+    lambda: _requests_in_progress[0]
+)
+scans = Counter(
+    'tesla_scans_total',
+    'Access card scans by access node, action and result (success, '
+    'unknown_card or invalid).',
+    ['access_node_id', 'action', 'result']
+)
+cache_lookups = Counter(
+    'tesla_cache_lookups_total',
+    'In-memory cache lookups by cache and result (hit or miss).',
+    ['cache', 'result']
+)
+db_connection_wait = Histogram(
+    'tesla_db_connection_wait_seconds',
+    'Time spent waiting for a database connection from the pool.',
+    buckets=wait_buckets
+)
+scheduler_job_duration = Histogram(
+    'tesla_scheduler_job_duration_seconds',
+    'Run time of scheduled jobs.',
+    ['job'],
+    job_buckets
+)
+scheduler_job_failures = Counter(
+    'tesla_scheduler_job_failures_total',
+    'Scheduled job runs that raised an exception.',
+    ['job']
+)
+
+
+def _route():
+    if request.url_rule is None:
+        return '(unmatched)'
+    return request.url_rule.rule
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    with _lock:
+        _requests_in_progress[0] += 1
+
+
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    route = _route()
+    http_request_duration.observe(
+        time.perf_counter() - started,
+        method=request.method,
+        route=route
+    )
+    http_requests.inc(
+        method=request.method,
+        route=route,
+        status=response.status_code
+    )
+    return response
+
+
+def _teardown_request(exception):
+    with _lock:
+        _requests_in_progress[0] = max(_requests_in_progress[0] - 1, 0)
+
+
+# Register the request hooks. After request functions run in reverse order
+# of registration: app.py calls this before instrument_app(),
+# profile_requests() and the unit of work commit, so this one runs last and
+# the duration includes the commit.
+def track_requests(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+
+
+# job name -> unix time the job last finished without an exception
+_job_last_success = {}
+
+
+# wrap a scheduled job so its run time, failures and last success are
+# recorded
+def measure_job(name, function):
+    def job(*args, **kwargs):
+        try:
+            with scheduler_job_duration.time(job=name):
+                result = function(*args, **kwargs)
+        except Exception:
+            scheduler_job_failures.inc(job=name)
+            raise
+        with _lock:
+            _job_last_success[name] = time.time()
+        return result
+    job.__name__ = getattr(function, '__name__', name)
+    return job
+
+
+# unix time of the job's last successful run in this process, or None
+def job_last_success(name):
+    with _lock:
+        return _job_last_success.get(name)
+
+
+def _job_last_success_values():
+    with _lock:
+        return {(name,): at for name, at in _job_last_success.items()}
+
+
+# waitress' task dispatcher when the server is started by app/serve.py
+_waitress_dispatcher = [None]
+
+
+def set_waitress_dispatcher(dispatcher):
+    _waitress_dispatcher[0] = dispatcher
+
+
+def _waitress_queue_depth():
+    dispatcher = _waitress_dispatcher[0]
+    if dispatcher is None:
+        return None
+    return len(dispatcher.queue)
+
+
+def _waitress_threads():
+    dispatcher = _waitress_dispatcher[0]
+    if dispatcher is None:
+        return None
+    return {
+        ('active',): dispatcher.active_count,
+        ('total',): len(dispatcher.threads),
+    }
+
+
+def _db_pool_checked_out():
+    from .database import db
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return None
+    return pool.checkedout()
+
+
+def _access_node_log_queue_depth():
+    from .background.access_node_log_writer import \
+        get_access_node_log_writer
+    return get_access_node_log_writer().queue_depth()
+
+
+def _password_hash_queue_depth():
+    from .background.password_hasher import get_password_hasher
+    return get_password_hasher().queue_depth()
+
+
+def _password_hash_rejected():
+    from .background.password_hasher import get_password_hasher
+    return get_password_hasher().rejected_count()
+
+
+scheduler_job_last_success = CallbackMetric(
+    'tesla_scheduler_job_last_success_timestamp_seconds',
+    'Unix time scheduled jobs last finished without an error.',
+    'gauge',
+    _job_last_success_values,
+    ['job']
+)
+waitress_queue_depth = CallbackMetric(
+    'tesla_waitress_queue_depth',
+    'Requests accepted by waitress and waiting for a worker thread.',
+    'gauge',
+    _waitress_queue_depth
+)
+waitress_threads = CallbackMetric(
+    'tesla_waitress_threads',
+    'Waitress worker threads, busy (active) and in total.',
+    'gauge',
+    _waitress_threads,
+    ['state']
+)
+db_pool_checked_out = CallbackMetric(
+    'tesla_db_pool_checked_out_connections',
+    'Database connections currently in use.',
+    'gauge',
+    _db_pool_checked_out
+)
+access_node_log_queue_depth = CallbackMetric(
+    'tesla_access_node_log_queue_depth',
+    'Scan log rows waiting to be committed by the background writer.',
+    'gauge',
+    _access_node_log_queue_depth
+)
+password_hash_queue_depth = CallbackMetric(
+    'tesla_password_hash_queue_depth',
+    'Password hashes and checks waiting for or running in a worker.',
+    'gauge',
+    _password_hash_queue_depth
+)
+password_hash_rejected = CallbackMetric(
+    'tesla_password_hash_rejected_total',
+    'Password hashes and checks turned away because the queue was full.',
+    'counter',
+    _password_hash_rejected
+)
@@ -0,0 +1,61 @@
+import uuid
+from datetime import timezone
+from sqlalchemy import DateTime, String
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.types import TypeDecorator
+
+
+# UUID primary and foreign keys. PostgreSQL stores a native uuid, other
+# databases a 36 character string, or a 16 byte blob on SQLite with compact
+# uuid keys (see apply_compact_uuid_keys() in database.py). Python always
+# sees the string form, the same as uuid_str() in models.py.
+class UUIDString(TypeDecorator):
+    impl = String(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(String(36))
+
+    def process_bind_param(self, value, dialect):
+        compact = getattr(dialect, 'compact_uuid_keys', False)
+        if value is None or not (dialect.name == 'postgresql' or compact):
+            return value
+        # an id from a request that isn't a uuid can't match any row, compare
+        # with NULL instead of letting the database reject the statement
+        try:
+            value = uuid.UUID(str(value))
+        except ValueError:
+            return None
+        if compact:
+            return value.bytes
+        return str(value)
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return str(uuid.UUID(bytes=value))
+        return value
+
+
+# Timestamps in UTC. PostgreSQL stores timestamptz, SQLite has no time zone
+# support so stores the UTC time as is. Python always sees naive UTC
+# datetimes, and naive datetimes passed in are taken to be UTC.
+class UTCDateTime(TypeDecorator):
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        # strings e.g. report date filters are left for the database
+        if not hasattr(value, 'tzinfo'):
+            return value
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        if dialect.name == 'postgresql':
+            return value
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
@@ -1,8 +1,9 @@
 import uuid
 from .database import db
-from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy import Enum
 from sqlalchemy.sql import func
+from .model_types import UUIDString, UTCDateTime
+from .background import password_hasher
 from .model_enums import UserRoleEnum, AccessCardStatusEnum, \
     AccessNodeStatusEnum, DeviceTypeEnum, DeviceStatusEnum, \
     UserEmergeAccessLevelEnum, UserStatusEnum, UserAccessActionEnum, \
@@ -15,10 +16,9 @@ def uuid_str():
 
 class TokenBlocklist(db.Model):
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     jti = db.Column(
@@ -31,7 +31,7 @@ class TokenBlocklist(db.Model):
         nullable=False
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
@@ -42,10 +42,9 @@ class TokenBlocklist(db.Model):
 # (just no default 'admin' with 'admin' password please!)
 class User(db.Model):
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     username = db.Column(
@@ -81,20 +80,20 @@ class User(db.Model):
         default=UserStatusEnum.ACTIVE
     )
     last_logged_in_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=True
     )
     last_updated_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now()
     )
     last_updated_by_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now()
     )
@@ -103,27 +102,36 @@ class User(db.Model):
     def password(self):
         raise AttributeError('password is not a readable attribute')
 
+    # hashed in the password hasher's worker processes, see
+    # app/background/password_hasher.py
     @password.setter
     def password(self, password):
-        self._password = generate_password_hash(password)
+        self._password = password_hasher.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self._password, password)
+        return password_hasher.check_password(self._password, password)
 
 
 class UserEditLog(db.Model):
+    __table_args__ = (
+        db.Index(
+            'ix_user_edit_log_user_id_created_at_id',
+            'user_id',
+            'created_at',
+            'id'
+        ),
+    )
+
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
-        nullable=False,
-        index=True
+        nullable=False
     )
     role = db.Column(
         Enum(UserRoleEnum),
@@ -138,13 +146,13 @@ class UserEditLog(db.Model):
         nullable=True,
     )
     updated_by_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         # This is nullable because on register there is no active user yet
         nullable=True,
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
@@ -152,25 +160,32 @@ class UserEditLog(db.Model):
 
 
 class UserAccessLog(db.Model):
+    __table_args__ = (
+        db.Index(
+            'ix_user_access_log_user_id_created_at_id',
+            'user_id',
+            'created_at',
+            'id'
+        ),
+    )
+
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
-        nullable=False,
-        index=True
+        nullable=False
     )
     action = db.Column(
         Enum(UserAccessActionEnum),
         nullable=False,
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
@@ -178,11 +193,18 @@ class UserAccessLog(db.Model):
 
 
 class AccessCard(db.Model):
+    __table_args__ = (
+        db.Index(
+            'ix_access_card_card_number_facility_code',
+            'card_number',
+            'facility_code'
+        ),
+    )
+
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     card_number = db.Column(
@@ -205,17 +227,17 @@ class AccessCard(db.Model):
         default=AccessCardStatusEnum.ACTIVE
     )
     last_updated_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now()
     )
     last_updated_by_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=False
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
@@ -224,10 +246,9 @@ class AccessCard(db.Model):
 
 class EmergeAccessCardStatusCodeLookup(db.Model):
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     status = db.Column(
@@ -242,32 +263,31 @@ class EmergeAccessCardStatusCodeLookup(db.Model):
 
 class UserAccessCard(db.Model):
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     assigned_to_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=False,
         index=True
     )
     access_card_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('access_card.id'),
         nullable=False,
         index=True
     )
     assigned_by_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=False,
         index=True
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
@@ -275,26 +295,38 @@ class UserAccessCard(db.Model):
 
 
 class AccessCardLog(db.Model):
+    __table_args__ = (
+        db.Index(
+            'ix_access_card_log_access_card_id_created_at_id',
+            'access_card_id',
+            'created_at',
+            'id'
+        ),
+        db.Index(
+            'ix_access_card_log_assigned_to_user_id_created_at_id',
+            'assigned_to_user_id',
+            'created_at',
+            'id'
+        ),
+    )
+
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     access_card_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('access_card.id'),
-        nullable=False,
-        index=True
+        nullable=False
     )
     assigned_to_user_id = db.Column(
-        db.String(36),
-        db.ForeignKey('user.id'),
-        index=True
+        UUIDString,
+        db.ForeignKey('user.id')
     )
     assigned_by_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=False,
     )
@@ -307,7 +339,7 @@ class AccessCardLog(db.Model):
         Enum(UserEmergeAccessLevelEnum),
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
@@ -316,10 +348,9 @@ class AccessCardLog(db.Model):
 
 class Device(db.Model):
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     type = db.Column(
@@ -336,7 +367,7 @@ class Device(db.Model):
         unique=True
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now()
     )
@@ -344,31 +375,30 @@ class Device(db.Model):
 
 class UserDevice(db.Model):
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     device_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('device.id'),
         nullable=False,
         index=True
     )
     assigned_to_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=False,
         index=True
     )
     assigned_by_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=False
     )
     assigned_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
@@ -377,35 +407,34 @@ class UserDevice(db.Model):
 
 class DeviceAssignmentLog(db.Model):
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     device_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('device.id'),
         nullable=False,
         index=True
     )
     assigned_to_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         index=True
     )
     unassigned_from_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         index=True
     )
     assigned_by_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=False,
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
@@ -414,10 +443,9 @@ class DeviceAssignmentLog(db.Model):
 
 class AccessNode(db.Model):
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     type = db.Column(
@@ -439,57 +467,79 @@ class AccessNode(db.Model):
         default=AccessNodeStatusEnum.OFFLINE
     )
     last_accessed_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=True
     )
     last_accessed_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=True
     )
     device_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('device.id'),
         nullable=True
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now()
     )
 
 
 class AccessNodeLog(db.Model):
+    __table_args__ = (
+        db.Index(
+            'ix_access_node_log_access_node_id_created_at_id',
+            'access_node_id',
+            'created_at',
+            'id'
+        ),
+        db.Index(
+            'ix_access_node_log_user_id_created_at_id',
+            'user_id',
+            'created_at',
+            'id'
+        ),
+        db.Index(
+            'ix_access_node_log_device_id_created_at_id',
+            'device_id',
+            'created_at',
+            'id'
+        ),
+        db.Index(
+            'ix_access_node_log_access_card_id_created_at_id',
+            'access_card_id',
+            'created_at',
+            'id'
+        ),
+    )
+
     id = db.Column(
-        db.String(36),
+        UUIDString,
         primary_key=True,
         nullable=False,
-        index=True,
         default=uuid_str
     )
     user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
-        nullable=False,
-        index=True
+        nullable=False
     )
     access_card_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('access_card.id'),
-        nullable=False,
-        index=True
+        nullable=False
     )
     access_node_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('access_node.id'),
-        nullable=False,
-        index=True
+        nullable=False
     )
     device_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('device.id'),
-        nullable=False,
-        index=True
+        nullable=False
     )
     action = db.Column(
         Enum(AccessNodeScanActionEnum),
@@ -503,13 +553,279 @@ class AccessNodeLog(db.Model):
         index=True
     )
     created_by_user_id = db.Column(
-        db.String(36),
+        UUIDString,
         db.ForeignKey('user.id'),
         nullable=False
     )
     created_at = db.Column(
-        db.DateTime,
+        UTCDateTime,
         nullable=False,
         server_default=func.now(),
         index=True
     )
+
+
+# materialized per-device allowlist of card numbers that access nodes sync
+# locally. Rows are never deleted, a revoked card is kept with allowed=False
+# so nodes can receive it as a removal when asking for changes since a version
+class AccessAllowlistEntry(db.Model):
+    __table_args__ = (
+        db.Index(
+            'ix_access_allowlist_entry_device_id_card_number_facility_code',
+            'device_id',
+            'card_number',
+            'facility_code',
+            unique=True
+        ),
+    )
+
+    id = db.Column(
+        UUIDString,
+        primary_key=True,
+        nullable=False,
+        default=uuid_str
+    )
+    device_id = db.Column(
+        UUIDString,
+        db.ForeignKey('device.id'),
+        nullable=False,
+        index=True
+    )
+    card_number = db.Column(
+        db.Integer,
+        nullable=False
+    )
+    facility_code = db.Column(
+        db.Integer,
+        nullable=False
+    )
+    access_card_id = db.Column(
+        UUIDString,
+        db.ForeignKey('access_card.id'),
+        nullable=False
+    )
+    user_id = db.Column(
+        UUIDString,
+        db.ForeignKey('user.id'),
+        nullable=False
+    )
+    allowed = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=True
+    )
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        index=True
+    )
+    updated_at = db.Column(
+        UTCDateTime,
+        nullable=False,
+        server_default=func.now()
+    )
+
+
+# single row holding the current allowlist version, refreshes lock it so
+# only one of them computes and writes the next version at a time
+class AccessAllowlistState(db.Model):
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0'
+    )
+
+
+# daily access node usage rolled up from AccessNodeLog by a scheduled task,
+# one row per day, device, access node and user. Reports group these rows by
+# device, user or node over a date range instead of scanning the log.
+class DeviceUsageDaily(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('day', 'device_id', 'access_node_id', 'user_id'),
+    )
+
+    id = db.Column(
+        UUIDString,
+        primary_key=True,
+        nullable=False,
+        default=uuid_str
+    )
+    # UTC day of AccessNodeLog.created_at
+    day = db.Column(
+        db.Date,
+        nullable=False,
+        index=True
+    )
+    device_id = db.Column(
+        UUIDString,
+        db.ForeignKey('device.id'),
+        nullable=False,
+        index=True
+    )
+    access_node_id = db.Column(
+        UUIDString,
+        db.ForeignKey('access_node.id'),
+        nullable=False,
+        index=True
+    )
+    user_id = db.Column(
+        UUIDString,
+        db.ForeignKey('user.id'),
+        nullable=False,
+        index=True
+    )
+    # all scans
+    scan_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    # login scans, each starts a session on the device
+    login_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+    success_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+
+
+# settings the database was migrated with, e.g. compact_uuid_keys '1' or '0'
+# on SQLite, written by the migrations
+class DatabaseSetting(db.Model):
+    name = db.Column(
+        db.String(64),
+        primary_key=True
+    )
+    value = db.Column(
+        db.String(255),
+        nullable=False
+    )
+
+
+# number of committed changes to each table and when the last one was made,
+# bumped in the writing transaction. GET endpoints derive their ETag and
+# Last-Modified from it, see app/cache/table_versions.py
+class TableVersion(db.Model):
+    table_name = db.Column(
+        db.String(64),
+        primary_key=True
+    )
+    version = db.Column(
+        db.BigInteger,
+        nullable=False
+    )
+    changed_at = db.Column(
+        UTCDateTime,
+        nullable=False
+    )
+
+
+# single row tracking the first day of DeviceUsageDaily that may be out of
+# date, the rollup task recomputes from this day onward
+class DeviceUsageRollupState(db.Model):
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+    stale_from = db.Column(
+        db.Date,
+        nullable=True
+    )
+    refreshed_at = db.Column(
+        UTCDateTime,
+        nullable=True
+    )
+
+
+# a user's time on an access node, from a login scan to the following logout
+# scan for the same user and node. Built from AccessNodeLog by a scheduled
+# task. A session is in progress until its logout, or is left without an end
+# when the user logs in to the node again first.
+class DeviceSession(db.Model):
+    __table_args__ = (
+        db.Index(
+            'ix_device_session_user_id_access_node_id_started_at',
+            'user_id',
+            'access_node_id',
+            'started_at'
+        ),
+    )
+
+    id = db.Column(
+        UUIDString,
+        primary_key=True,
+        nullable=False,
+        default=uuid_str
+    )
+    user_id = db.Column(
+        UUIDString,
+        db.ForeignKey('user.id'),
+        nullable=False
+    )
+    access_node_id = db.Column(
+        UUIDString,
+        db.ForeignKey('access_node.id'),
+        nullable=False
+    )
+    device_id = db.Column(
+        UUIDString,
+        db.ForeignKey('device.id'),
+        nullable=False,
+        index=True
+    )
+    login_log_id = db.Column(
+        UUIDString,
+        db.ForeignKey('access_node_log.id'),
+        nullable=False,
+        unique=True
+    )
+    logout_log_id = db.Column(
+        UUIDString,
+        db.ForeignKey('access_node_log.id'),
+        nullable=True
+    )
+    started_at = db.Column(
+        UTCDateTime,
+        nullable=False,
+        index=True
+    )
+    ended_at = db.Column(
+        UTCDateTime,
+        nullable=True
+    )
+    duration_seconds = db.Column(
+        db.Integer,
+        nullable=True
+    )
+    in_progress = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=True,
+        index=True
+    )
+
+
+# single row tracking the time from which DeviceSession may be out of date,
+# the session task rebuilds sessions from this time onward
+class DeviceSessionState(db.Model):
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+    stale_from = db.Column(
+        UTCDateTime,
+        nullable=True
+    )
+    refreshed_at = db.Column(
+        UTCDateTime,
+        nullable=True
+    )
@@ -0,0 +1,209 @@
+# on-demand cProfile capture of single requests
+#
+# A request is run under cProfile when an admin asks for it with
+# `X-Profile: 1` or `?profile=1`, or when it is picked by sampling: one in
+# every PROFILE_SAMPLE_RATE requests (TESLA_PROFILE_SAMPLE_RATE, 0 turns
+# sampling off) whose url starts with PROFILE_SAMPLE_PATH. The profile is
+# saved as a .pstats file in PROFILE_DIR and the response gets an
+# X-Profile-Id header. Admins list and download the profiles through
+# /api/admin/profiles. The latest PROFILE_HISTORY files are kept, older ones
+# are removed as new profiles are saved and, for those left by earlier runs
+# of the server, at startup.
+#
+# When nothing asks for a profile a request costs a header and query string
+# lookup (plus a counter when sampling is on). The profile covers the view,
+# including the jwt check and the unit of work commit, but not streaming a
+# response body. The jwt check of the flag itself isn't profiled.
+
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timezone
+from flask import g
+from flask import request
+from flask_jwt_extended import current_user
+from flask_jwt_extended import verify_jwt_in_request
+from .model_enums import UserRoleEnum
+
+_lock = threading.Lock()
+_sample_counter = itertools.count(1)
+# profile id -> details, oldest first
+_profiles = OrderedDict()
+_config = {}
+
+
+# reads the WSGI environ directly, most requests never parse request.args
+def _requested():
+    environ = request.environ
+    if environ.get('HTTP_X_PROFILE') == '1':
+        return True
+    return 'profile=' in environ.get('QUERY_STRING', '') \
+        and request.args.get('profile') == '1'
+
+
+# only admins can profile a request on demand, anyone else's flag is ignored
+def _requested_by_admin():
+    try:
+        verify_jwt_in_request()
+    except Exception:
+        return False
+    return getattr(current_user, 'role', None) == UserRoleEnum.ADMIN
+
+
+def _sampled():
+    rate = _config['sample_rate']
+    if rate <= 0 or not request.path.startswith(_config['sample_path']):
+        return False
+    return next(_sample_counter) % rate == 0
+
+
+def _start_request():
+    if _requested():
+        if not _requested_by_admin():
+            return
+        trigger = 'flag'
+    elif _sampled():
+        trigger = 'sample'
+    else:
+        return
+
+    profiler = cProfile.Profile()
+    g.profile = (profiler, trigger, time.perf_counter())
+    profiler.enable()
+
+
+def _stop_profiler():
+    profile = g.pop('profile', None)
+    if profile is None:
+        return None
+    profile[0].disable()
+    return profile
+
+
+def _finish_request(response):
+    profile = _stop_profiler()
+    if profile is None:
+        return response
+    profiler, trigger, started = profile
+    try:
+        profile_id = _save(profiler, trigger, started, response.status_code)
+        response.headers['X-Profile-Id'] = profile_id
+    except Exception:
+        # a profile that couldn't be written shouldn't fail the request
+        pass
+    return response
+
+
+def _teardown_request(exception):
+    # a request that failed before its after request functions ran
+    _stop_profiler()
+
+
+def _save(profiler, trigger, started, status_code):
+    profile_id = uuid.uuid4().hex
+    directory = _config['directory']
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, profile_id + '.pstats')
+    profiler.dump_stats(path)
+
+    details = {
+        'id': profile_id,
+        'at': datetime.now(timezone.utc).isoformat(),
+        'method': request.method,
+        'endpoint': request.url_rule.rule
+        if request.url_rule else '(unmatched)',
+        'url': request.full_path.rstrip('?'),
+        'status': status_code,
+        'durationMs': round((time.perf_counter() - started) * 1000, 3),
+        'trigger': trigger,
+    }
+    removed = []
+    with _lock:
+        _profiles[profile_id] = dict(details, path=path)
+        while len(_profiles) > _config['history']:
+            removed.append(_profiles.popitem(last=False)[1]['path'])
+    for old_path in removed:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+    return profile_id
+
+
+# remove all but the newest keep .pstats files in directory, e.g. those of
+# earlier runs of the server, which aren't listed anymore
+def _prune_directory(directory, keep):
+    try:
+        names = [
+            name for name in os.listdir(directory)
+            if name.endswith('.pstats')
+        ]
+    except OSError:
+        return
+    paths = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            paths.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    paths.sort(reverse=True)
+    for _, path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Register the request hooks. After request functions run in reverse order
+# of registration: app.py calls this after track_requests() and
+# instrument_app() and before the unit of work commit is registered, so this
+# one runs right after the commit and the profile includes it.
+def profile_requests(app):
+    _config.update(
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        sample_path=app.config['PROFILE_SAMPLE_PATH'],
+        directory=app.config['PROFILE_DIR'],
+        history=app.config['PROFILE_HISTORY'],
+    )
+    _prune_directory(_config['directory'], _config['history'])
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
+
+
+# the profiles kept, newest first
+def list_profiles():
+    with _lock:
+        profiles = list(_profiles.values())
+    profiles.reverse()
+    return [
+        {key: value for key, value in profile.items() if key != 'path'}
+        for profile in profiles
+    ]
+
+
+# path of the profile's .pstats file, or None when there's no such profile
+def profile_path(profile_id):
+    with _lock:
+        profile = _profiles.get(profile_id)
+    return profile['path'] if profile else None
+
+
+# the pstats report of the profile, functions with the most cumulative time
+# first
+def profile_report(profile_id, limit=50):
+    path = profile_path(profile_id)
+    if path is None:
+        return None
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
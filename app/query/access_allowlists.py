@@ -0,0 +1,166 @@
+import threading
+from datetime import datetime
+from datetime import timezone
+from sqlalchemy import exc
+from ..app import db
+from ..database import lock_state_row
+from ..models import AccessAllowlistEntry, AccessAllowlistState, \
+    AccessCard, UserAccessCard, UserDevice, User
+from ..model_enums import AccessCardStatusEnum, UserStatusEnum
+
+_refresh_lock = threading.Lock()
+
+# the allowlist state table only ever has this row
+_STATE_ID = 1
+
+
+# card numbers that should currently be allowed on each device:
+# the active cards of active users assigned to the device
+def _desired_allowlists():
+    rows = db.session.query(
+        UserDevice.device_id,
+        AccessCard.id.label('access_card_id'),
+        AccessCard.card_number,
+        AccessCard.facility_code,
+        User.id.label('user_id')
+    ) \
+        .join(
+            UserAccessCard,
+            UserAccessCard.assigned_to_user_id ==
+            UserDevice.assigned_to_user_id
+        ) \
+        .join(AccessCard, AccessCard.id == UserAccessCard.access_card_id) \
+        .join(User, User.id == UserDevice.assigned_to_user_id) \
+        .filter(AccessCard.status == AccessCardStatusEnum.ACTIVE) \
+        .filter(User.status == UserStatusEnum.ACTIVE) \
+        .all()
+
+    desired = {}
+    for row in rows:
+        key = (row.device_id, row.card_number, row.facility_code)
+        desired.setdefault(key, row)
+    return desired
+
+
+def access_allowlist_version():
+    state = db.session.get(AccessAllowlistState, _STATE_ID)
+    return state.version if state else 0
+
+
+# Bring the materialized allowlists in line with the current card, user and
+# device assignments. Every entry added or revoked in one refresh gets the
+# same new version number. Allowlists are small (devices x member cards) so
+# the whole set is recomputed after any write that may affect it, rather than
+# working out which devices a change touches.
+#
+# Refreshes in other processes (API servers, CLI imports) are waited for on
+# the state row lock, so each one reads the assignments the previous one
+# committed and versions are never handed out twice.
+def refresh_access_allowlists():
+    with _refresh_lock:
+        try:
+            state = lock_state_row(AccessAllowlistState, _STATE_ID)
+            desired = _desired_allowlists()
+            current = {
+                (e.device_id, e.card_number, e.facility_code): e
+                for e in AccessAllowlistEntry.query.all()
+            }
+        except (exc.OperationalError, exc.ProgrammingError):
+            # tables don't exist yet e.g. before `flask db upgrade`
+            db.session.rollback()
+            return None
+
+        version = state.version + 1
+        now = datetime.now(timezone.utc)
+        changed = False
+
+        for key, row in desired.items():
+            entry = current.get(key)
+            if entry is None:
+                db.session.add(AccessAllowlistEntry(
+                    device_id=row.device_id,
+                    card_number=row.card_number,
+                    facility_code=row.facility_code,
+                    access_card_id=row.access_card_id,
+                    user_id=row.user_id,
+                    allowed=True,
+                    version=version,
+                    updated_at=now
+                ))
+                changed = True
+            elif not entry.allowed:
+                entry.allowed = True
+                entry.access_card_id = row.access_card_id
+                entry.user_id = row.user_id
+                entry.version = version
+                entry.updated_at = now
+                changed = True
+
+        for key, entry in current.items():
+            if entry.allowed and key not in desired:
+                entry.allowed = False
+                entry.version = version
+                entry.updated_at = now
+                changed = True
+
+        if changed:
+            state.version = version
+        else:
+            version = state.version
+        # ends the transaction and releases the lock either way
+        db.session.commit()
+        return version
+
+
+def _card_res(entry):
+    return {
+        'cardNumber': entry.card_number,
+        'facilityCode': entry.facility_code,
+    }
+
+
+# full allowlist for a device along with the version it is current as of
+def access_allowlist_snapshot(device_id):
+    version = access_allowlist_version()
+    entries = AccessAllowlistEntry.query \
+        .filter_by(device_id=device_id, allowed=True) \
+        .order_by(
+            AccessAllowlistEntry.card_number,
+            AccessAllowlistEntry.facility_code
+        ) \
+        .all()
+
+    return {
+        'version': version,
+        'deviceId': device_id,
+        'cards': [_card_res(entry) for entry in entries],
+    }
+
+
+# cards added to or removed from a device allowlist after a version
+def access_allowlist_delta(device_id, since):
+    version = access_allowlist_version()
+    if since > version:
+        raise ValueError('since is newer than the current allowlist version')
+
+    entries = AccessAllowlistEntry.query \
+        .filter(AccessAllowlistEntry.device_id == device_id) \
+        .filter(AccessAllowlistEntry.version > since) \
+        .order_by(AccessAllowlistEntry.version) \
+        .all()
+
+    added = []
+    removed = []
+    for entry in entries:
+        if entry.allowed:
+            added.append(_card_res(entry))
+        else:
+            removed.append(_card_res(entry))
+
+    return {
+        'version': version,
+        'since': since,
+        'deviceId': device_id,
+        'added': added,
+        'removed': removed,
+    }
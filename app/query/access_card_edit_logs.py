@@ -3,6 +3,7 @@ from ..app import app
 from ..models import User, AccessCardLog, AccessCardStatusEnum, \
     UserEmergeAccessLevelEnum
 from .device_access_logs import validate_date
+from .pagination import paginate_by_created_at
 from sqlalchemy.orm import aliased
 
 
@@ -22,19 +23,16 @@ default_params = {
     # optional start date, example: 2023-11-01 (YYYY-MM-DD)
     'start_date': None,
     # optional end date using datetime
-    'end_date': None
+    'end_date': None,
+    # optional opaque cursor returned with the previous page, used instead of
+    # page when set
+    'cursor': None,
+    # also count all matching rows (an extra query)
+    'include_count': False
 }
 
 
-def access_card_edit_logs(params):
-    try:
-        page = params['page']
-    except Exception:
-        page = default_params['page']
-    try:
-        per_page = params['per_page']
-    except Exception:
-        per_page = default_params['per_page']
+def access_card_edit_logs_query(params):
     try:
         assigned_to_user_id = params['assigned_to_user_id']
     except Exception:
@@ -69,6 +67,7 @@ def access_card_edit_logs(params):
     assignedByUser = aliased(User)
 
     query = db.session.query(
+        AccessCardLog.id,
         AccessCardLog.access_card_id,
         AccessCardLog.assigned_to_user_id,
         AccessCardLog.assigned_by_user_id,
@@ -128,33 +127,78 @@ def access_card_edit_logs(params):
         validate_date(end_date)
         query = query.filter(AccessCardLog.created_at <= end_date)
 
-    # sort results (date created descending for now)
-    order = AccessCardLog.created_at.desc()
-    query = query.order_by(order)
-
-    # run query
-    results = query \
-        .paginate(
-            page=page,
-            per_page=per_page,
-            max_per_page=app.config['DEFAULT_MAX_PER_PAGE'],
-            error_out=False
-        )
+    return query
+
+
+# API-formatted response for a single log row
+def access_card_edit_log_res(edit_log):
+    return {
+        'accessCardId': edit_log.access_card_id,
+        'assignedToUserId': edit_log.assigned_to_user_id,
+        'assignedToFirstName': edit_log.to_first_name,
+        'assignedToLastName': edit_log.to_last_name,
+        'assignedByUserId': edit_log.assigned_by_user_id,
+        'assignedByFirstName': edit_log.by_first_name,
+        'assignedByLastName': edit_log.by_last_name,
+        'status': edit_log.status,
+        'emergeAccessLevel': edit_log.emerge_access_level,
+        'createdAt': edit_log.created_at.isoformat(),
+    }
+
+
+def access_card_edit_logs_page(params):
+    try:
+        page = params['page']
+    except Exception:
+        page = default_params['page']
+    try:
+        per_page = params['per_page']
+    except Exception:
+        per_page = default_params['per_page']
+    try:
+        cursor = params['cursor']
+    except Exception:
+        cursor = default_params['cursor']
+    try:
+        include_count = params['include_count']
+    except Exception:
+        include_count = default_params['include_count']
+
+    query = access_card_edit_logs_query(params)
+
+    # run query, newest first
+    results, next_cursor, total = paginate_by_created_at(
+        query,
+        AccessCardLog,
+        page=page,
+        per_page=per_page,
+        cursor=cursor,
+        include_count=include_count
+    )
+
+    edit_logs = [access_card_edit_log_res(edit_log) for edit_log in results]
+
+    return {
+        'items': edit_logs,
+        'nextCursor': next_cursor,
+        'total': total,
+    }
+
+
+# just the rows of a page, for views that embed recent history
+def access_card_edit_logs(params):
+    return access_card_edit_logs_page(params)['items']
+
+
+# every matching row newest first, read from the database in chunks so an
+# export of any size uses a flat amount of memory. Filters are validated
+# right away, rows are only read once the returned generator is used.
+def access_card_edit_logs_stream(params):
+    query = access_card_edit_logs_query(params) \
+        .order_by(AccessCardLog.created_at.desc(), AccessCardLog.id.desc())
+
+    def rows():
+        for edit_log in query.yield_per(app.config['STREAM_CHUNK_SIZE']):
+            yield access_card_edit_log_res(edit_log)
 
-    edit_logs = []
-    if results:
-        for edit_log in results:
-            edit_logs.append({
-                'accessCardId': edit_log.access_card_id,
-                'assignedToUserId': edit_log.assigned_to_user_id,
-                'assignedToFirstName': edit_log.to_first_name,
-                'assignedToLastName': edit_log.to_last_name,
-                'assignedByUserId': edit_log.assigned_by_user_id,
-                'assignedByFirstName': edit_log.by_first_name,
-                'assignedByLastName': edit_log.by_last_name,
-                'status': edit_log.status,
-                'emergeAccessLevel': edit_log.emerge_access_level,
-                'createdAt': edit_log.created_at.isoformat(),
-            })
-
-    return edit_logs
+    return rows()
@@ -2,6 +2,7 @@ from ..app import db
 from ..app import app
 from ..models import Device, User, AccessNodeLog, AccessNodeScanActionEnum
 from datetime import datetime
+from .pagination import paginate_by_created_at
 
 
 def validate_date(date_string):
@@ -29,19 +30,16 @@ default_params = {
     # optional start date, example: 2023-11-01 (YYYY-MM-DD)
     'start_date': None,
     # optional end date using datetime
-    'end_date': None
+    'end_date': None,
+    # optional opaque cursor returned with the previous page, used instead of
+    # page when set
+    'cursor': None,
+    # also count all matching rows (an extra query)
+    'include_count': False
 }
 
 
-def device_access_logs(params):
-    try:
-        page = params['page']
-    except Exception:
-        page = default_params['page']
-    try:
-        per_page = params['per_page']
-    except Exception:
-        per_page = default_params['per_page']
+def device_access_logs_query(params):
     try:
         user_id = params['user_id']
     except Exception:
@@ -72,6 +70,7 @@ def device_access_logs(params):
         end_date = default_params['end_date']
 
     query = db.session.query(
+        AccessNodeLog.id,
         AccessNodeLog.user_id,
         AccessNodeLog.access_card_id,
         AccessNodeLog.access_node_id,
@@ -115,35 +114,79 @@ def device_access_logs(params):
         validate_date(end_date)
         query = query.filter(AccessNodeLog.created_at <= end_date)
 
-    # sort results (date created descending for now)
-    order = AccessNodeLog.created_at.desc()
-    query = query.order_by(order)
-
-    # run query
-    results = query \
-        .paginate(
-            page=page,
-            per_page=per_page,
-            max_per_page=app.config['DEFAULT_MAX_PER_PAGE'],
-            error_out=False
-        )
-
-    # generate API-formatted response
-    access_logs = []
-    if results:
-        for access_log in results:
-            access_logs.append({
-                'userId': access_log.user_id,
-                'userFirstName': access_log.first_name,
-                'userLastName': access_log.last_name,
-                'accessCardId': access_log.access_card_id,
-                'accessNodeId': access_log.access_node_id,
-                'deviceId': access_log.device_id,
-                'deviceName': access_log.name,
-                'action': access_log.action,
-                'success': access_log.success,
-                'createdByUserId': access_log.created_by_user_id,
-                'createdAt': access_log.created_at.isoformat()
-            })
-
-    return access_logs
+    return query
+
+
+# API-formatted response for a single log row
+def device_access_log_res(access_log):
+    return {
+        'userId': access_log.user_id,
+        'userFirstName': access_log.first_name,
+        'userLastName': access_log.last_name,
+        'accessCardId': access_log.access_card_id,
+        'accessNodeId': access_log.access_node_id,
+        'deviceId': access_log.device_id,
+        'deviceName': access_log.name,
+        'action': access_log.action,
+        'success': access_log.success,
+        'createdByUserId': access_log.created_by_user_id,
+        'createdAt': access_log.created_at.isoformat()
+    }
+
+
+def device_access_logs_page(params):
+    try:
+        page = params['page']
+    except Exception:
+        page = default_params['page']
+    try:
+        per_page = params['per_page']
+    except Exception:
+        per_page = default_params['per_page']
+    try:
+        cursor = params['cursor']
+    except Exception:
+        cursor = default_params['cursor']
+    try:
+        include_count = params['include_count']
+    except Exception:
+        include_count = default_params['include_count']
+
+    query = device_access_logs_query(params)
+
+    # run query, newest first
+    results, next_cursor, total = paginate_by_created_at(
+        query,
+        AccessNodeLog,
+        page=page,
+        per_page=per_page,
+        cursor=cursor,
+        include_count=include_count
+    )
+
+    access_logs = [device_access_log_res(access_log) for access_log in results]
+
+    return {
+        'items': access_logs,
+        'nextCursor': next_cursor,
+        'total': total,
+    }
+
+
+# just the rows of a page, for views that embed recent history
+def device_access_logs(params):
+    return device_access_logs_page(params)['items']
+
+
+# every matching row newest first, read from the database in chunks so an
+# export of any size uses a flat amount of memory. Filters are validated
+# right away, rows are only read once the returned generator is used.
+def device_access_logs_stream(params):
+    query = device_access_logs_query(params) \
+        .order_by(AccessNodeLog.created_at.desc(), AccessNodeLog.id.desc())
+
+    def rows():
+        for access_log in query.yield_per(app.config['STREAM_CHUNK_SIZE']):
+            yield device_access_log_res(access_log)
+
+    return rows()
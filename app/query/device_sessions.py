@@ -0,0 +1,378 @@
+import threading
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from sqlalchemy import and_
+from sqlalchemy import exc
+from sqlalchemy import func
+from sqlalchemy import insert
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.orm import aliased
+from ..app import db
+from ..app import app
+from ..database import lock_state_row
+from ..models import AccessNodeLog, Device, DeviceSession, \
+    DeviceSessionState, User, uuid_str
+from ..model_enums import AccessNodeScanActionEnum
+from .pagination import paginate_by_created_at
+
+_refresh_lock = threading.Lock()
+
+# the session state table only ever has this row
+_STATE_ID = 1
+
+# new and closed sessions are written every this many of them
+_WRITE_BATCH_SIZE = 1000
+
+_session_actions = [
+    AccessNodeScanActionEnum.LOGIN,
+    AccessNodeScanActionEnum.LOGOUT
+]
+
+default_params = {
+    'page': 1,
+    'per_page': app.config['DEFAULT_PER_PAGE'],
+    # optional user id string
+    'user_id': None,
+    # optional device id string
+    'device_id': None,
+    # optional access node id string
+    'access_node_id': None,
+    # optional start date, sessions started at or after it
+    'start_date': None,
+    # optional end date, sessions started at or before it
+    'end_date': None,
+    # optional opaque cursor returned with the previous page, used instead of
+    # page when set
+    'cursor': None,
+    # also count all matching sessions and their total duration (an extra
+    # query)
+    'include_count': False
+}
+
+
+def validate_date(date_string):
+    try:
+        datetime.fromisoformat(date_string)
+    except ValueError:
+        raise \
+            ValueError("Incorrect data format, should be YYYY-MM-DD HH:MM:SS")
+
+
+# Undo every session built from the logs that are about to be replayed:
+# sessions they started are deleted, and the session each of them closed is
+# put back in progress. A session closed by a login (no logout) is only put
+# back when it is now the latest one left for its user and node.
+def _rewind_sessions(replayed_log_ids):
+    db.session.execute(
+        DeviceSession.__table__.delete()
+        .where(DeviceSession.login_log_id.in_(replayed_log_ids))
+    )
+
+    later = aliased(DeviceSession)
+    latest = ~select(later.id).where(
+        later.user_id == DeviceSession.user_id,
+        later.access_node_id == DeviceSession.access_node_id,
+        later.started_at > DeviceSession.started_at
+    ).exists()
+    db.session.execute(
+        update(DeviceSession)
+        .execution_options(synchronize_session=False)
+        .where(DeviceSession.in_progress.is_(False))
+        .where(or_(
+            DeviceSession.logout_log_id.in_(replayed_log_ids),
+            and_(DeviceSession.logout_log_id.is_(None), latest)
+        ))
+        .values(
+            in_progress=True,
+            logout_log_id=None,
+            ended_at=None,
+            duration_seconds=None
+        )
+    )
+
+
+# Pair login and logout scans per user and access node into DeviceSession
+# rows. Logs are replayed once in created_at order from the state's
+# stale_from, keeping only the open session of each user and node in
+# memory, so a run is linear in the number of logs replayed. The first run
+# replays the whole log.
+#
+# The state row stays locked until the refresh commits, like the usage
+# rollups a refresh started while another process is refreshing is skipped
+# and returns None.
+def refresh_device_sessions():
+    with _refresh_lock:
+        started_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        try:
+            state = lock_state_row(DeviceSessionState, _STATE_ID, wait=False)
+        except (exc.OperationalError, exc.ProgrammingError):
+            # tables don't exist yet e.g. before `flask db upgrade`
+            db.session.rollback()
+            return None
+
+        if state is None:
+            return None
+
+        logs = db.session.query(
+            AccessNodeLog.id,
+            AccessNodeLog.user_id,
+            AccessNodeLog.access_node_id,
+            AccessNodeLog.device_id,
+            AccessNodeLog.action,
+            AccessNodeLog.created_at
+        ) \
+            .filter(AccessNodeLog.action.in_(_session_actions)) \
+            .filter(AccessNodeLog.success.is_(True))
+        if state.stale_from:
+            logs = logs.filter(AccessNodeLog.created_at >= state.stale_from)
+            _rewind_sessions(
+                logs.with_entities(AccessNodeLog.id).scalar_subquery()
+            )
+        else:
+            db.session.execute(DeviceSession.__table__.delete())
+
+        # the open session of each user and access node
+        open_sessions = {}
+        for session in db.session.query(
+            DeviceSession.id,
+            DeviceSession.user_id,
+            DeviceSession.access_node_id,
+            DeviceSession.started_at
+        ).filter(DeviceSession.in_progress.is_(True)):
+            open_sessions[(session.user_id, session.access_node_id)] = {
+                'id': session.id,
+                'started_at': session.started_at,
+                'stored': True,
+            }
+
+        new_sessions = []
+        ended_sessions = []
+        count = 0
+
+        def close(session, values):
+            if session.pop('stored'):
+                ended_sessions.append(dict(values, id=session['id']))
+            else:
+                new_sessions.append(dict(session, **values))
+
+        def write():
+            if new_sessions:
+                db.session.execute(insert(DeviceSession), new_sessions)
+                new_sessions.clear()
+            if ended_sessions:
+                db.session.execute(update(DeviceSession), ended_sessions)
+                ended_sessions.clear()
+
+        logs = logs.order_by(AccessNodeLog.created_at, AccessNodeLog.id)
+        for log in logs.yield_per(_WRITE_BATCH_SIZE):
+            key = (log.user_id, log.access_node_id)
+            session = open_sessions.pop(key, None)
+
+            if log.action == AccessNodeScanActionEnum.LOGIN:
+                # logging in again without logging out leaves the previous
+                # session without an end
+                if session:
+                    close(session, {'in_progress': False})
+                open_sessions[key] = {
+                    'id': uuid_str(),
+                    'user_id': log.user_id,
+                    'access_node_id': log.access_node_id,
+                    'device_id': log.device_id,
+                    'login_log_id': log.id,
+                    'started_at': log.created_at,
+                    'in_progress': True,
+                    'stored': False,
+                }
+                count += 1
+            elif session:
+                close(session, {
+                    'in_progress': False,
+                    'logout_log_id': log.id,
+                    'ended_at': log.created_at,
+                    'duration_seconds': int(
+                        (log.created_at - session['started_at'])
+                        .total_seconds()
+                    ),
+                })
+
+            if len(new_sessions) + len(ended_sessions) >= _WRITE_BATCH_SIZE:
+                write()
+
+        # sessions still in progress that were started in this run
+        new_sessions.extend(
+            session for session in open_sessions.values()
+            if not session.pop('stored')
+        )
+        write()
+
+        # logs committed a little after they were created are picked up by
+        # replaying the last hour again on the next run
+        state.stale_from = started_at - timedelta(hours=1)
+        state.refreshed_at = started_at
+        db.session.commit()
+        return count
+
+
+# make the next session refresh replay logs from created_at onward, used when
+# scans older than the last run are written. A running refresh is waited for,
+# it may have read the logs before these scans were committed.
+def mark_device_sessions_stale(created_at):
+    with _refresh_lock:
+        state = lock_state_row(DeviceSessionState, _STATE_ID)
+        # without stale_from the next refresh replays every log anyway
+        if state.stale_from is not None and created_at < state.stale_from:
+            state.stale_from = created_at
+        db.session.commit()
+
+
+# API-formatted response for a single session
+def device_session_res(session):
+    ended_at = None
+    if session.ended_at:
+        ended_at = session.ended_at.isoformat()
+    return {
+        'id': session.id,
+        'userId': session.user_id,
+        'userFirstName': session.first_name,
+        'userLastName': session.last_name,
+        'accessNodeId': session.access_node_id,
+        'deviceId': session.device_id,
+        'deviceName': session.name,
+        'startedAt': session.started_at.isoformat(),
+        'endedAt': ended_at,
+        'durationSeconds': session.duration_seconds,
+        'inProgress': session.in_progress
+    }
+
+
+def device_sessions_query(params):
+    try:
+        user_id = params['user_id']
+    except Exception:
+        user_id = default_params['user_id']
+    try:
+        device_id = params['device_id']
+    except Exception:
+        device_id = default_params['device_id']
+    try:
+        access_node_id = params['access_node_id']
+    except Exception:
+        access_node_id = default_params['access_node_id']
+    try:
+        start_date = params['start_date']
+    except Exception:
+        start_date = default_params['start_date']
+    try:
+        end_date = params['end_date']
+    except Exception:
+        end_date = default_params['end_date']
+
+    query = db.session.query(
+        DeviceSession.id,
+        DeviceSession.user_id,
+        DeviceSession.access_node_id,
+        DeviceSession.device_id,
+        DeviceSession.started_at,
+        DeviceSession.ended_at,
+        DeviceSession.duration_seconds,
+        DeviceSession.in_progress,
+        User.first_name,
+        User.last_name,
+        Device.name
+    ) \
+        .join(User, User.id == DeviceSession.user_id) \
+        .join(Device, Device.id == DeviceSession.device_id)
+
+    # filter options
+    if user_id:
+        query = query.filter(DeviceSession.user_id == user_id)
+
+    if device_id:
+        query = query.filter(DeviceSession.device_id == device_id)
+
+    if access_node_id:
+        query = query.filter(DeviceSession.access_node_id == access_node_id)
+
+    if start_date:
+        validate_date(start_date)
+        query = query.filter(
+            DeviceSession.started_at >= datetime.fromisoformat(start_date)
+        )
+
+    if end_date:
+        validate_date(end_date)
+        query = query.filter(
+            DeviceSession.started_at <= datetime.fromisoformat(end_date)
+        )
+
+    return query
+
+
+# a page of sessions newest first. With include_count also the number of
+# sessions and the total duration of the ended ones over every page
+def device_sessions_page(params):
+    try:
+        page = params['page']
+    except Exception:
+        page = default_params['page']
+    try:
+        per_page = params['per_page']
+    except Exception:
+        per_page = default_params['per_page']
+    try:
+        cursor = params['cursor']
+    except Exception:
+        cursor = default_params['cursor']
+    try:
+        include_count = params['include_count']
+    except Exception:
+        include_count = default_params['include_count']
+
+    query = device_sessions_query(params)
+
+    total_duration_seconds = None
+    if include_count:
+        total_duration_seconds = query.with_entities(
+            func.sum(DeviceSession.duration_seconds)
+        ).scalar() or 0
+
+    results, next_cursor, total = paginate_by_created_at(
+        query,
+        DeviceSession,
+        page=page,
+        per_page=per_page,
+        cursor=cursor,
+        include_count=include_count,
+        column=DeviceSession.started_at
+    )
+
+    state = db.session.get(DeviceSessionState, _STATE_ID)
+    refreshed_at = None
+    if state and state.refreshed_at:
+        refreshed_at = state.refreshed_at.isoformat()
+
+    return {
+        'items': [device_session_res(session) for session in results],
+        'nextCursor': next_cursor,
+        'total': total,
+        'totalDurationSeconds': total_duration_seconds,
+        'refreshedAt': refreshed_at,
+    }
+
+
+# every matching session newest first, read from the database in chunks so
+# an export of any size uses a flat amount of memory. Filters are validated
+# right away, rows are only read once the returned generator is used.
+def device_sessions_stream(params):
+    query = device_sessions_query(params) \
+        .order_by(DeviceSession.started_at.desc(), DeviceSession.id.desc())
+
+    def rows():
+        for session in query.yield_per(app.config['STREAM_CHUNK_SIZE']):
+            yield device_session_res(session)
+
+    return rows()
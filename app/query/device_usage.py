@@ -0,0 +1,267 @@
+import threading
+from datetime import date
+from datetime import datetime
+from datetime import time
+from datetime import timedelta
+from datetime import timezone
+from sqlalchemy import case
+from sqlalchemy import exc
+from sqlalchemy import func
+from sqlalchemy import insert
+from ..app import db
+from ..database import lock_state_row
+from ..models import AccessNodeLog, Device, DeviceUsageDaily, \
+    DeviceUsageRollupState
+from ..model_enums import AccessNodeScanActionEnum
+
+_refresh_lock = threading.Lock()
+
+# the rollup state table only ever has this row
+_STATE_ID = 1
+
+default_params = {
+    # optional start day, example: 2023-11-01 (YYYY-MM-DD)
+    'start_date': None,
+    # optional end day, included in the summary
+    'end_date': None,
+    # optional device id string
+    'device_id': None,
+    # optional user id string
+    'user_id': None,
+    # optional access node id string
+    'access_node_id': None,
+    # day, week (starting monday), month or total
+    'group_by': 'day'
+}
+
+group_by_options = ['day', 'week', 'month', 'total']
+
+
+def _parse_day(value):
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+# Recompute DeviceUsageDaily from the first stale day onward, the first run
+# builds every day in the log. Later runs only redo recent days, plus any
+# older day an offline access node uploaded scans for, see
+# mark_device_usage_stale(). Days are UTC like AccessNodeLog.created_at.
+#
+# The state row stays locked until the refresh commits. A refresh started
+# while another process is refreshing is skipped and returns None, the
+# running one already covers it.
+def refresh_device_usage_rollups():
+    with _refresh_lock:
+        started_at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        try:
+            state = lock_state_row(
+                DeviceUsageRollupState,
+                _STATE_ID,
+                wait=False
+            )
+        except (exc.OperationalError, exc.ProgrammingError):
+            # tables don't exist yet e.g. before `flask db upgrade`
+            db.session.rollback()
+            return None
+
+        if state is None:
+            return None
+
+        day = func.date(AccessNodeLog.created_at)
+        query = db.session.query(
+            day.label('day'),
+            AccessNodeLog.device_id,
+            AccessNodeLog.access_node_id,
+            AccessNodeLog.user_id,
+            func.count(AccessNodeLog.id).label('scan_count'),
+            func.sum(case(
+                (AccessNodeLog.action == AccessNodeScanActionEnum.LOGIN, 1),
+                else_=0
+            )).label('login_count'),
+            func.sum(case(
+                (AccessNodeLog.success.is_(True), 1),
+                else_=0
+            )).label('success_count')
+        ) \
+            .group_by(
+                day,
+                AccessNodeLog.device_id,
+                AccessNodeLog.access_node_id,
+                AccessNodeLog.user_id
+            )
+        delete = DeviceUsageDaily.__table__.delete()
+
+        if state.stale_from:
+            # the created_at filter lets the index narrow the rows down,
+            # the day filter is the exact boundary
+            query = query \
+                .filter(
+                    AccessNodeLog.created_at >=
+                    datetime.combine(state.stale_from, time.min) -
+                    timedelta(days=1)
+                ) \
+                .filter(day >= state.stale_from)
+            delete = delete.where(DeviceUsageDaily.day >= state.stale_from)
+
+        rollups = [
+            {
+                'day': _parse_day(row.day),
+                'device_id': row.device_id,
+                'access_node_id': row.access_node_id,
+                'user_id': row.user_id,
+                'scan_count': row.scan_count,
+                'login_count': row.login_count,
+                'success_count': row.success_count,
+            }
+            for row in query.all()
+        ]
+
+        db.session.execute(delete)
+        if rollups:
+            db.session.execute(insert(DeviceUsageDaily), rollups)
+
+        # scans committed just after midnight may still belong to the
+        # previous day, so it is only considered complete an hour later
+        state.stale_from = (started_at - timedelta(hours=1)).date()
+        state.refreshed_at = started_at
+        db.session.commit()
+        return len(rollups)
+
+
+# make the next rollup refresh recompute from day onward, used when scans
+# older than the current rollup window are written. A running refresh is
+# waited for, it may have read the logs before these scans were committed.
+def mark_device_usage_stale(day):
+    with _refresh_lock:
+        state = lock_state_row(DeviceUsageRollupState, _STATE_ID)
+        # without stale_from the next refresh rebuilds every day anyway
+        if state.stale_from is not None and day < state.stale_from:
+            state.stale_from = day
+        db.session.commit()
+
+
+def _period_start(day, group_by, start_date):
+    match group_by:
+        case 'week':
+            return day - timedelta(days=day.weekday())
+        case 'month':
+            return day.replace(day=1)
+        case 'total':
+            return start_date
+    return day
+
+
+# sessions (login scans), scans and unique users per device per period, read
+# from the daily rollups
+def device_usage_summary(params):
+    try:
+        start_date = params['start_date']
+    except Exception:
+        start_date = default_params['start_date']
+    try:
+        end_date = params['end_date']
+    except Exception:
+        end_date = default_params['end_date']
+    try:
+        device_id = params['device_id']
+    except Exception:
+        device_id = default_params['device_id']
+    try:
+        user_id = params['user_id']
+    except Exception:
+        user_id = default_params['user_id']
+    try:
+        access_node_id = params['access_node_id']
+    except Exception:
+        access_node_id = default_params['access_node_id']
+    try:
+        group_by = params['group_by']
+    except Exception:
+        group_by = default_params['group_by']
+
+    if group_by not in group_by_options:
+        raise ValueError('groupBy value is not valid')
+
+    try:
+        if start_date:
+            start_date = date.fromisoformat(start_date)
+        if end_date:
+            end_date = date.fromisoformat(end_date)
+    except ValueError:
+        raise ValueError("Incorrect date format, should be YYYY-MM-DD")
+
+    query = db.session.query(
+        DeviceUsageDaily.device_id,
+        Device.name,
+        DeviceUsageDaily.day,
+        DeviceUsageDaily.user_id,
+        func.sum(DeviceUsageDaily.scan_count).label('scan_count'),
+        func.sum(DeviceUsageDaily.login_count).label('login_count')
+    ) \
+        .join(Device, Device.id == DeviceUsageDaily.device_id) \
+        .group_by(
+            DeviceUsageDaily.device_id,
+            Device.name,
+            DeviceUsageDaily.day,
+            DeviceUsageDaily.user_id
+        )
+
+    # filter options
+    if start_date:
+        query = query.filter(DeviceUsageDaily.day >= start_date)
+
+    if end_date:
+        query = query.filter(DeviceUsageDaily.day <= end_date)
+
+    if device_id:
+        query = query.filter(DeviceUsageDaily.device_id == device_id)
+
+    if user_id:
+        query = query.filter(DeviceUsageDaily.user_id == user_id)
+
+    if access_node_id:
+        query = query.filter(
+            DeviceUsageDaily.access_node_id == access_node_id
+        )
+
+    # unique users can't be summed across days, so rows are per user per
+    # day and combined into periods here
+    periods = {}
+    for row in query.all():
+        period = _period_start(row.day, group_by, start_date)
+        summary = periods.setdefault((period, row.device_id), {
+            'deviceId': row.device_id,
+            'deviceName': row.name,
+            'periodStart': period.isoformat() if period else None,
+            'sessions': 0,
+            'scans': 0,
+            'users': set(),
+        })
+        summary['sessions'] += row.login_count
+        summary['scans'] += row.scan_count
+        summary['users'].add(row.user_id)
+
+    results = []
+    for summary in sorted(
+        periods.values(),
+        # device names are optional
+        key=lambda s: (
+            s['periodStart'] or '',
+            s['deviceName'] or '',
+            s['deviceId']
+        )
+    ):
+        summary['uniqueUsers'] = len(summary.pop('users'))
+        results.append(summary)
+
+    state = db.session.get(DeviceUsageRollupState, _STATE_ID)
+    refreshed_at = None
+    if state and state.refreshed_at:
+        refreshed_at = state.refreshed_at.isoformat()
+
+    return {
+        'items': results,
+        'refreshedAt': refreshed_at,
+    }
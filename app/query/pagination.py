@@ -0,0 +1,81 @@
+import base64
+import binascii
+from sqlalchemy import and_
+from sqlalchemy import or_
+from sqlalchemy import select
+from ..app import app
+
+
+# Opaque cursors point at the last row of a page. They hold the row id, the
+# row's created_at is looked up by primary key inside the same statement.
+# Comparing the column with itself keeps the keyset consistent with ORDER BY
+# even though SQLite stores created_at both with and without microseconds.
+def encode_cursor(row_id):
+    return base64.urlsafe_b64encode(row_id.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        row_id = base64.b64decode(
+            cursor + padding,
+            altchars=b'-_',
+            validate=True
+        ).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError('cursor value is not valid')
+    if not row_id:
+        raise ValueError('cursor value is not valid')
+    return row_id
+
+
+# Page through a log query newest first. With a cursor only rows after it are
+# read (keyset pagination) so every page costs the same, otherwise page is
+# used as an offset. The total is only counted when asked for. Rows are
+# ordered by model.created_at, or by column for tables without one.
+def paginate_by_created_at(
+        query,
+        model,
+        page=1,
+        per_page=None,
+        cursor=None,
+        include_count=False,
+        column=None
+        ):
+    if not per_page or per_page < 1:
+        per_page = app.config['DEFAULT_PER_PAGE']
+    per_page = min(per_page, app.config['DEFAULT_MAX_PER_PAGE'])
+    if not page or page < 1:
+        page = 1
+
+    if column is None:
+        column = model.created_at
+
+    total = None
+    if include_count:
+        total = query.order_by(None).count()
+
+    if cursor:
+        cursor_id = decode_cursor(cursor)
+        cursor_created_at = select(column) \
+            .where(model.id == cursor_id) \
+            .scalar_subquery()
+        query = query.filter(or_(
+            column < cursor_created_at,
+            and_(
+                column == cursor_created_at,
+                model.id < cursor_id
+            )
+        ))
+
+    query = query.order_by(column.desc(), model.id.desc())
+    if not cursor and page > 1:
+        query = query.offset((page - 1) * per_page)
+    rows = query.limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1].id)
+
+    return rows, next_cursor, total
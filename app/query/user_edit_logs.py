@@ -4,6 +4,7 @@ from ..models import User, UserEditLog
 from ..model_enums import UserRoleEnum, UserStatusEnum, \
     UserEmergeAccessLevelEnum
 from .device_access_logs import validate_date
+from .pagination import paginate_by_created_at
 from sqlalchemy.orm import aliased
 
 
@@ -23,19 +24,16 @@ default_params = {
     # optional start date, example: 2023-11-01 (YYYY-MM-DD)
     'start_date': None,
     # optional end date using datetime
-    'end_date': None
+    'end_date': None,
+    # optional opaque cursor returned with the previous page, used instead of
+    # page when set
+    'cursor': None,
+    # also count all matching rows (an extra query)
+    'include_count': False
 }
 
 
-def user_edit_logs(params):
-    try:
-        page = params['page']
-    except Exception:
-        page = default_params['page']
-    try:
-        per_page = params['per_page']
-    except Exception:
-        per_page = default_params['per_page']
+def user_edit_logs_query(params):
     try:
         user_id = params['user_id']
     except Exception:
@@ -69,6 +67,7 @@ def user_edit_logs(params):
     editedUser = aliased(User)
     updatedByUser = aliased(User)
     query = db.session.query(
+        UserEditLog.id,
         UserEditLog.user_id,
         UserEditLog.role,
         UserEditLog.status,
@@ -130,33 +129,78 @@ def user_edit_logs(params):
         validate_date(end_date)
         query = query.filter(UserEditLog.created_at <= end_date)
 
-    # sort results (date created descending for now)
-    order = UserEditLog.created_at.desc()
-    query = query.order_by(order)
-
-    # run query
-    results = query \
-        .paginate(
-            page=page,
-            per_page=per_page,
-            max_per_page=app.config['DEFAULT_MAX_PER_PAGE'],
-            error_out=False
-        )
+    return query
+
+
+# API-formatted response for a single log row
+def user_edit_log_res(edit_log):
+    return {
+        'userId': edit_log.user_id,
+        'userFirstName': edit_log.edited_first_name,
+        'userLastName': edit_log.edited_last_name,
+        'role': edit_log.role,
+        'status': edit_log.status,
+        'emergeAccessLevel': edit_log.emerge_access_level,
+        'updatedByUserId': edit_log.updated_by_user_id,
+        'updatedByUserFirstName': edit_log.updated_by_first_name,
+        'updatedByUserLastName': edit_log.updated_by_last_name,
+        'createdAt': edit_log.created_at.isoformat(),
+    }
+
+
+def user_edit_logs_page(params):
+    try:
+        page = params['page']
+    except Exception:
+        page = default_params['page']
+    try:
+        per_page = params['per_page']
+    except Exception:
+        per_page = default_params['per_page']
+    try:
+        cursor = params['cursor']
+    except Exception:
+        cursor = default_params['cursor']
+    try:
+        include_count = params['include_count']
+    except Exception:
+        include_count = default_params['include_count']
+
+    query = user_edit_logs_query(params)
+
+    # run query, newest first
+    results, next_cursor, total = paginate_by_created_at(
+        query,
+        UserEditLog,
+        page=page,
+        per_page=per_page,
+        cursor=cursor,
+        include_count=include_count
+    )
+
+    edit_logs = [user_edit_log_res(edit_log) for edit_log in results]
+
+    return {
+        'items': edit_logs,
+        'nextCursor': next_cursor,
+        'total': total,
+    }
+
+
+# just the rows of a page, for views that embed recent history
+def user_edit_logs(params):
+    return user_edit_logs_page(params)['items']
+
+
+# every matching row newest first, read from the database in chunks so an
+# export of any size uses a flat amount of memory. Filters are validated
+# right away, rows are only read once the returned generator is used.
+def user_edit_logs_stream(params):
+    query = user_edit_logs_query(params) \
+        .order_by(UserEditLog.created_at.desc(), UserEditLog.id.desc())
+
+    def rows():
+        for edit_log in query.yield_per(app.config['STREAM_CHUNK_SIZE']):
+            yield user_edit_log_res(edit_log)
 
-    edit_logs = []
-    if results:
-        for edit_log in results:
-            edit_logs.append({
-                'userId': edit_log.user_id,
-                'userFirstName': edit_log.edited_first_name,
-                'userLastName': edit_log.edited_last_name,
-                'role': edit_log.role,
-                'status': edit_log.status,
-                'emergeAccessLevel': edit_log.emerge_access_level,
-                'updatedByUserId': edit_log.updated_by_user_id,
-                'updatedByUserFirstName': edit_log.updated_by_first_name,
-                'updatedByUserLastName': edit_log.updated_by_last_name,
-                'createdAt': edit_log.created_at.isoformat(),
-            })
-
-    return edit_logs
+    return rows()
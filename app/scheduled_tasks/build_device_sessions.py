@@ -0,0 +1,9 @@
+def build_device_sessions():
+    from app.app import app
+    from app.query.device_sessions import refresh_device_sessions
+    with app.app_context():
+        count = refresh_device_sessions()
+        if count is None:
+            print('device sessions not built')
+        else:
+            print('%s device sessions built' % count)
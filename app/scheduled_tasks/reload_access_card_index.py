@@ -0,0 +1,5 @@
+def reload_access_card_index():
+    from app.app import app
+    from app.cache.access_card_index import load_access_card_index
+    with app.app_context():
+        load_access_card_index()
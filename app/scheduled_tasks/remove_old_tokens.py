@@ -1,16 +1,21 @@
 from app.database import db
 from app.models import TokenBlocklist
-from datetime import datetime, timedelta
+from app.cache.token_blocklist_cache import prune_token_blocklist
+from datetime import datetime, timedelta, timezone
 
 
 def remove_old_tokens():
     from app.app import app
     with app.app_context():
         forty_days = timedelta(days=40)
-        forty_days_ago = datetime.now() - forty_days
+        forty_days_ago = datetime.now(timezone.utc) - forty_days
         query = TokenBlocklist.__table__.delete().where(
             TokenBlocklist.created_at < forty_days_ago
         )
         db.session.execute(query)
         db.session.commit()
         print('old jwt tokens removed')
+
+        # expired tokens no longer need to be checked in memory either
+        pruned = prune_token_blocklist()
+        print('%s expired jwt tokens pruned from blocklist cache' % pruned)
@@ -0,0 +1,9 @@
+def roll_up_device_usage():
+    from app.app import app
+    from app.query.device_usage import refresh_device_usage_rollups
+    with app.app_context():
+        count = refresh_device_usage_rollups()
+        if count is None:
+            print('device usage rollups not refreshed')
+        else:
+            print('%s device usage rollup rows refreshed' % count)
@@ -1,18 +1,75 @@
+import time
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from .remove_old_tokens import remove_old_tokens
+from .reload_access_card_index import reload_access_card_index
+from .roll_up_device_usage import roll_up_device_usage
+from .build_device_sessions import build_device_sessions
+from ..metrics import measure_job
+
+# the running scheduler and the unix time it was started, for the readiness
+# check in app/api/health.py
+_scheduler = None
+_started_at = None
 
 
 def start_scheduled_tasks():
+    global _scheduler, _started_at
+    from app.app import app
     schedule = BackgroundScheduler(daemon=True)
 
     remove_old_tokens_trigger = CronTrigger(
         year="*", month="*", day="*", hour="1", minute="0", second="0"
     )
     schedule.add_job(
-        remove_old_tokens,
+        measure_job('remove_old_tokens', remove_old_tokens),
         trigger=remove_old_tokens_trigger,
         name='daily remove old jwt tokens'
     )
 
+    roll_up_device_usage_trigger = CronTrigger(
+        year="*", month="*", day="*", hour="*", minute="*/15", second="0"
+    )
+    schedule.add_job(
+        measure_job('roll_up_device_usage', roll_up_device_usage),
+        trigger=roll_up_device_usage_trigger,
+        name='roll up device usage every 15 minutes'
+    )
+
+    build_device_sessions_trigger = CronTrigger(
+        year="*", month="*", day="*", hour="*", minute="*/15", second="0"
+    )
+    schedule.add_job(
+        measure_job('build_device_sessions', build_device_sessions),
+        trigger=build_device_sessions_trigger,
+        name='build device sessions every 15 minutes'
+    )
+
+    reload_seconds = app.config['ACCESS_CARD_INDEX_RELOAD_SECONDS']
+    if reload_seconds > 0:
+        schedule.add_job(
+            measure_job('reload_access_card_index', reload_access_card_index),
+            trigger=IntervalTrigger(seconds=reload_seconds),
+            name='reload the access card index every %s seconds'
+            % reload_seconds
+        )
+
     schedule.start()
+    _scheduler = schedule
+    _started_at = time.time()
+
+
+# whether the scheduler is running, when it was started and the next run of
+# each job
+def scheduler_status():
+    if _scheduler is None:
+        return {'running': False, 'started_at': None, 'jobs': []}
+    return {
+        'running': _scheduler.running,
+        'started_at': _started_at,
+        'jobs': [
+            {'name': job.name, 'next_run_time': job.next_run_time}
+            for job in _scheduler.get_jobs()
+        ],
+    }
@@ -0,0 +1,28 @@
+# run the API server with waitress, used by `make run`
+#
+# Same as `waitress-serve app.app:app` but keeps hold of waitress' task
+# dispatcher so /api/metrics can report its queue depth and busy threads.
+# TESLA_HOST, TESLA_PORT and TESLA_THREADS override the defaults.
+
+import os
+from waitress import create_server
+from .metrics import set_waitress_dispatcher
+
+
+# the app is imported here rather than at the top, this module is __main__
+# and any process started with spawn imports __main__ again
+def serve():
+    from .app import app
+    server = create_server(
+        app,
+        host=os.environ.get('TESLA_HOST') or '0.0.0.0',
+        port=int(os.environ.get('TESLA_PORT') or 8080),
+        threads=int(os.environ.get('TESLA_THREADS') or 4)
+    )
+    set_waitress_dispatcher(server.task_dispatcher)
+    server.print_listen('Serving on http://{}:{}')
+    server.run()
+
+
+if __name__ == '__main__':
+    serve()
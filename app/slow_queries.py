@@ -0,0 +1,242 @@
+# slow query log, on unless TESLA_SLOW_QUERY_MS=0
+#
+# Every SQL statement that takes longer than SLOW_QUERY_THRESHOLD_MS is
+# recorded with its bound parameters, the request (or background thread) that
+# ran it and its query plan: EXPLAIN QUERY PLAN on SQLite, EXPLAIN on
+# PostgreSQL (without ANALYZE, the statement isn't run again). Records are
+# written as JSON lines to a rotating log file and the most recent ones are
+# kept in memory for GET /api/admin/slowQueries.
+#
+# The plan is read on the same connection right after the statement, so it
+# sees the same transaction. On PostgreSQL it runs inside a savepoint so a
+# failing EXPLAIN can't abort the caller's transaction. Statements that are
+# fast cost two timestamps.
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from datetime import timezone
+from logging.handlers import RotatingFileHandler
+from flask import has_request_context
+from flask import request
+from sqlalchemy import event
+
+_enabled = False
+_threshold_seconds = 0.0
+_explain = True
+_lock = threading.Lock()
+_recent = deque(maxlen=200)
+_logger = logging.getLogger('tesla.slow_queries')
+
+_explained_statements = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+# werkzeug password hashes, e.g. pbkdf2:sha256:600000$salt$hash
+_password_hash = re.compile(r'^(pbkdf2|scrypt)[:$]')
+_max_parameter_length = 200
+
+
+def _parameter(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        # compact uuid keys on SQLite
+        if len(value) == 16:
+            return str(uuid.UUID(bytes=value))
+        return '<%d bytes>' % len(value)
+    if isinstance(value, str):
+        if _password_hash.match(value):
+            return '<password hash>'
+        if len(value) > _max_parameter_length:
+            return value[:_max_parameter_length] + '...'
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return str(value)
+
+
+def _parameters(parameters, executemany):
+    if executemany:
+        # only the first row of a bulk insert/update
+        parameters = parameters[0] if parameters else None
+    if isinstance(parameters, dict):
+        return {str(key): _parameter(value)
+                for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_parameter(value) for value in parameters]
+    return parameters
+
+
+# the request that ran the statement, or the thread outside of requests
+# e.g. access-node-log-writer or the scheduler
+def _caller():
+    if has_request_context():
+        return {
+            'method': request.method,
+            'endpoint': request.url_rule.rule
+            if request.url_rule else '(unmatched)',
+            'url': request.full_path.rstrip('?'),
+        }
+    return {
+        'method': None,
+        'endpoint': None,
+        'url': None,
+        'thread': threading.current_thread().name,
+    }
+
+
+def _sqlite_plan(cursor, statement, parameters):
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    depth = {0: -1}
+    plan = []
+    for row in cursor.fetchall():
+        node_id, parent_id, detail = row[0], row[1], row[3]
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        plan.append('  ' * depth[node_id] + detail)
+    return plan
+
+
+def _postgresql_plan(cursor, statement, parameters):
+    cursor.execute('SAVEPOINT slow_query_plan')
+    try:
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        plan = [row[0] for row in cursor.fetchall()]
+    except Exception:
+        cursor.execute('ROLLBACK TO SAVEPOINT slow_query_plan')
+        raise
+    cursor.execute('RELEASE SAVEPOINT slow_query_plan')
+    return plan
+
+
+def _plan(conn, statement, parameters, executemany):
+    if not _explain or executemany:
+        return None
+    keyword = statement.lstrip().split(None, 1)[0].upper() \
+        if statement.strip() else ''
+    if keyword not in _explained_statements:
+        return None
+
+    explain = {
+        'sqlite': _sqlite_plan,
+        'postgresql': _postgresql_plan,
+    }.get(conn.dialect.name)
+    if explain is None:
+        return None
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        return explain(cursor, statement, parameters)
+    finally:
+        cursor.close()
+
+
+def _record(conn, statement, parameters, executemany, seconds):
+    entry = {
+        'at': datetime.now(timezone.utc).isoformat(),
+        'durationMs': round(seconds * 1000, 3),
+        'statement': statement,
+        'parameters': _parameters(parameters, executemany),
+        'executemany': executemany,
+    }
+    entry.update(_caller())
+    try:
+        entry['plan'] = _plan(conn, statement, parameters, executemany)
+    except Exception as err:
+        entry['plan'] = None
+        entry['planError'] = str(err).splitlines()[0] if str(err) else \
+            type(err).__name__
+
+    with _lock:
+        _recent.append(entry)
+    _logger.warning(json.dumps(entry, default=str))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('slow_query_started', []) \
+        .append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    seconds = time.perf_counter() - conn.info['slow_query_started'].pop()
+    if seconds < _threshold_seconds:
+        return
+    try:
+        _record(conn, statement, parameters, executemany, seconds)
+    except Exception:
+        # never fail the statement because it couldn't be recorded
+        pass
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('slow_query_started'):
+        connection.info['slow_query_started'].pop()
+
+
+def _open_log(path, max_bytes, backup_count):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        delay=True
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    _logger.addHandler(handler)
+    _logger.setLevel(logging.WARNING)
+    _logger.propagate = False
+
+
+# Register the SQL hooks unless app.config['SLOW_QUERY_THRESHOLD_MS'] is 0,
+# called once at startup
+def record_slow_queries(app, engine):
+    global _enabled, _threshold_seconds, _explain, _recent
+    threshold = app.config['SLOW_QUERY_THRESHOLD_MS']
+    if not threshold or _enabled:
+        return
+    _enabled = True
+    _threshold_seconds = threshold / 1000
+    _explain = app.config['SLOW_QUERY_EXPLAIN']
+    _recent = deque(maxlen=app.config['SLOW_QUERY_HISTORY'])
+    if app.config['SLOW_QUERY_LOG']:
+        _open_log(
+            app.config['SLOW_QUERY_LOG'],
+            app.config['SLOW_QUERY_LOG_MAX_BYTES'],
+            app.config['SLOW_QUERY_LOG_BACKUPS']
+        )
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def slow_queries_enabled():
+    return _enabled
+
+
+def slow_query_threshold_ms():
+    return _threshold_seconds * 1000 if _enabled else None
+
+
+# recorded slow queries since the server started, newest first, optionally
+# only those at least min_ms long or whose endpoint or url contains text
+def recent_slow_queries(limit=None, min_ms=None, endpoint=None):
+    with _lock:
+        entries = list(_recent)
+    entries.reverse()
+    if min_ms is not None:
+        entries = [e for e in entries if e['durationMs'] >= min_ms]
+    if endpoint:
+        entries = [
+            e for e in entries
+            if endpoint in (e['endpoint'] or '')
+            or endpoint in (e['url'] or '')
+        ]
+    if limit is not None:
+        entries = entries[:limit]
+    return entries
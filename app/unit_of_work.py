@@ -0,0 +1,61 @@
+# one database transaction per API request
+#
+# Write endpoints used to commit after every step, e.g. login committed the
+# last login time and then the access log, archiving a device committed three
+# times. Every commit is an fsync on SQLite, and a failure part way through
+# left the earlier steps written. Endpoints now only add their changes to
+# db.session (and flush() when they need generated values or want errors such
+# as IntegrityError raised in place). The request's transaction is committed
+# once after the view returned a successful response and rolled back after an
+# error response.
+#
+# Work that has to see the committed data, e.g. refreshing the in-memory
+# caches and the access allowlists, is queued with after_commit() and runs
+# once the commit succeeded.
+
+import traceback
+from json import dumps
+from flask import Response
+from flask import g
+from .database import db
+
+
+# run function(*args) after the current request is committed, queuing the
+# same call twice only runs it once
+def after_commit(function, *args):
+    if 'after_commit' not in g:
+        g.after_commit = []
+    if (function, args) not in g.after_commit:
+        g.after_commit.append((function, args))
+
+
+def commit_request(response):
+    callbacks = g.pop('after_commit', [])
+
+    if response.status_code >= 400:
+        db.session.rollback()
+        return response
+
+    try:
+        db.session.commit()
+    except Exception:
+        traceback.print_exc()
+        db.session.rollback()
+        return Response(
+            status=500,
+            mimetype="application/json",
+            response=dumps({
+                "code": 500,
+                "error": "Internal Server Error",
+                "description": "an unknown error occurred",
+            })
+        )
+
+    # the changes are saved at this point, a failing callback only means a
+    # cache is behind until its next refresh
+    for function, args in callbacks:
+        try:
+            function(*args)
+        except Exception:
+            traceback.print_exc()
+    return response
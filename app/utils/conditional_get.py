@@ -0,0 +1,70 @@
+import hashlib
+import math
+import time
+from datetime import datetime
+from datetime import timezone
+from functools import wraps
+from flask import request
+from flask import make_response
+from flask_jwt_extended import current_user
+from werkzeug.http import is_resource_modified
+from ..cache.table_versions import table_versions
+
+
+# Answer GET requests with 304 Not Modified while none of the tables the
+# response is read from changed, see app/cache/table_versions.py. The ETag
+# covers the tables' versions from the database, the URL with its query
+# string, the Content-Type (json or csv) and the caller's role, so the view
+# itself only runs when the client's copy may be out of date. Goes below
+# @jwt_required().
+#
+# Last-Modified only has whole seconds. It's the last change rounded up, and
+# it's left out until a second after that: a later change in the same
+# second would get the same Last-Modified and a client that only sends
+# If-Modified-Since would get a 304 for its stale copy. The extra second
+# covers the moment between a change's version bump and its commit, and
+# small clock differences between servers.
+# example:
+# @conditional_get('user', 'user_device')
+def conditional_get(*tables):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = table_versions(tables)
+            if current is None:
+                return view(*args, **kwargs)
+            versions, changed_at = current
+
+            etag = hashlib.sha1(repr((
+                versions,
+                request.full_path,
+                request.headers.get('Content-Type'),
+                str(getattr(current_user, 'role', None)),
+            )).encode()).hexdigest()
+            last_modified = None
+            if changed_at is not None and \
+                    math.ceil(changed_at) <= time.time() - 1:
+                last_modified = datetime.fromtimestamp(
+                    math.ceil(changed_at),
+                    timezone.utc
+                )
+
+            if not is_resource_modified(
+                request.environ,
+                etag=etag,
+                last_modified=last_modified
+            ):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # let browsers keep the copy but always check it's current
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
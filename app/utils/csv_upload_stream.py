@@ -0,0 +1,11 @@
+from flask import request
+
+
+# The binary stream of an uploaded CSV file, either a multipart form field
+# named file or the raw request body e.g. with Content-Type: text/csv. The
+# stream is read as it's consumed rather than loaded into memory first.
+def csv_upload_stream():
+    upload = request.files.get('file')
+    if upload:
+        return upload.stream
+    return request.stream
@@ -0,0 +1,49 @@
+import csv
+import enum
+import io
+from flask import Response
+from flask import stream_with_context
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+# Stream an iterable of dictionaries (usually returned as json) as a csv file
+# without building it in memory first. The output matches
+# array_to_csv_flask_response: a leading row number column then one column
+# per key. Columns come from fieldnames or else the keys of the first row.
+def stream_csv_flask_response(rows, fieldnames=None, chunk_size=500):
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        columns = fieldnames
+        index = 0
+
+        if columns is not None:
+            writer.writerow([''] + list(columns))
+
+        for row in rows:
+            if columns is None:
+                columns = list(row.keys())
+                writer.writerow([''] + columns)
+            writer.writerow(
+                [index] + [_csv_value(row.get(column)) for column in columns]
+            )
+            index += 1
+
+            if index % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+
+        yield buffer.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers["Content-Disposition"] = \
+        "attachment; filename=export.csv"
+    return response
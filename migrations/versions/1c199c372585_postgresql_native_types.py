@@ -0,0 +1,147 @@
+"""postgresql native types
+
+Revision ID: 1c199c372585
+Revises: 5811cd109ee4
+Create Date: 2026-10-18 16:05:12.118524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '1c199c372585'
+down_revision = '5811cd109ee4'
+branch_labels = None
+depends_on = None
+
+# On PostgreSQL, uuid ids become native uuid columns and timestamps become
+# timestamptz (existing values are UTC). SQLite already stores both the
+# way app/model_types.py expects so nothing changes there.
+uuid_columns = {
+    'access_allowlist_entry': ['id', 'device_id', 'access_card_id', 'user_id'],
+    'access_card': ['id', 'last_updated_by_user_id'],
+    'access_card_log': [
+        'id', 'access_card_id', 'assigned_to_user_id', 'assigned_by_user_id'
+    ],
+    'access_node': ['id', 'last_accessed_user_id', 'device_id'],
+    'access_node_log': [
+        'id', 'user_id', 'access_card_id', 'access_node_id', 'device_id',
+        'created_by_user_id'
+    ],
+    'device': ['id'],
+    'device_assignment_log': [
+        'id', 'device_id', 'assigned_to_user_id', 'unassigned_from_user_id',
+        'assigned_by_user_id'
+    ],
+    'device_session': [
+        'id', 'user_id', 'access_node_id', 'device_id', 'login_log_id',
+        'logout_log_id'
+    ],
+    'device_usage_daily': ['id', 'device_id', 'access_node_id', 'user_id'],
+    'emerge_access_card_status_code_lookup': ['id'],
+    'token_blocklist': ['id'],
+    'user': ['id', 'last_updated_by_user_id'],
+    'user_access_card': [
+        'id', 'assigned_to_user_id', 'access_card_id', 'assigned_by_user_id'
+    ],
+    'user_access_log': ['id', 'user_id'],
+    'user_device': [
+        'id', 'device_id', 'assigned_to_user_id', 'assigned_by_user_id'
+    ],
+    'user_edit_log': ['id', 'user_id', 'updated_by_user_id'],
+}
+
+timestamp_columns = {
+    'access_allowlist_entry': ['updated_at'],
+    'access_card': ['last_updated_at', 'created_at'],
+    'access_card_log': ['created_at'],
+    'access_node': ['last_accessed_at', 'created_at'],
+    'access_node_log': ['created_at'],
+    'device': ['created_at'],
+    'device_assignment_log': ['created_at'],
+    'device_session': ['started_at', 'ended_at'],
+    'device_session_state': ['stale_from', 'refreshed_at'],
+    'device_usage_rollup_state': ['refreshed_at'],
+    'token_blocklist': ['created_at'],
+    'user': ['last_logged_in_at', 'last_updated_at', 'created_at'],
+    'user_access_card': ['created_at'],
+    'user_access_log': ['created_at'],
+    'user_device': ['assigned_at'],
+    'user_edit_log': ['created_at'],
+}
+
+
+# foreign keys have to be dropped while the columns on both sides change type
+def drop_foreign_keys():
+    inspector = sa.inspect(op.get_bind())
+    foreign_keys = []
+    for table in uuid_columns:
+        for foreign_key in inspector.get_foreign_keys(table):
+            foreign_keys.append((table, foreign_key))
+            op.drop_constraint(
+                foreign_key['name'], table, type_='foreignkey'
+            )
+    return foreign_keys
+
+
+def create_foreign_keys(foreign_keys):
+    for table, foreign_key in foreign_keys:
+        op.create_foreign_key(
+            foreign_key['name'],
+            table,
+            foreign_key['referred_table'],
+            foreign_key['constrained_columns'],
+            foreign_key['referred_columns']
+        )
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    foreign_keys = drop_foreign_keys()
+    for table, columns in uuid_columns.items():
+        for column in columns:
+            op.alter_column(
+                table,
+                column,
+                type_=postgresql.UUID(as_uuid=False),
+                postgresql_using='%s::uuid' % column
+            )
+    create_foreign_keys(foreign_keys)
+
+    for table, columns in timestamp_columns.items():
+        for column in columns:
+            op.alter_column(
+                table,
+                column,
+                type_=sa.DateTime(timezone=True),
+                postgresql_using="%s AT TIME ZONE 'UTC'" % column
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table, columns in timestamp_columns.items():
+        for column in columns:
+            op.alter_column(
+                table,
+                column,
+                type_=sa.DateTime(),
+                postgresql_using="%s AT TIME ZONE 'UTC'" % column
+            )
+
+    foreign_keys = drop_foreign_keys()
+    for table, columns in uuid_columns.items():
+        for column in columns:
+            op.alter_column(
+                table,
+                column,
+                type_=sa.String(length=36),
+                postgresql_using='%s::text' % column
+            )
+    create_foreign_keys(foreign_keys)
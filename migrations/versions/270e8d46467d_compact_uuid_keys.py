@@ -0,0 +1,116 @@
+"""compact uuid keys
+
+Revision ID: 270e8d46467d
+Revises: e7e7ee01edaf
+Create Date: 2026-10-18 16:06:00.518244
+
+"""
+import uuid
+from alembic import op
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = '270e8d46467d'
+down_revision = 'e7e7ee01edaf'
+branch_labels = None
+depends_on = None
+
+
+# every primary key already has an index of its own
+redundant_indexes = {
+    'access_card': 'ix_access_card_id',
+    'access_node': 'ix_access_node_id',
+    'device': 'ix_device_id',
+    'device_assignment_log': 'ix_device_assignment_log_id',
+    'emerge_access_card_status_code_lookup':
+        'ix_emerge_access_card_status_code_lookup_id',
+    'token_blocklist': 'ix_token_blocklist_id',
+    'user': 'ix_user_id',
+    'user_access_card': 'ix_user_access_card_id',
+    'user_device': 'ix_user_device_id',
+}
+
+# With COMPACT_UUID_KEYS on, SQLite uuid keys are stored as 16 byte blobs
+# instead of 36 character strings. SQLite doesn't enforce column types so
+# only the values change. PostgreSQL already stores native uuids.
+uuid_columns = {
+    'access_allowlist_entry': ['id', 'device_id', 'access_card_id', 'user_id'],
+    'access_card': ['id', 'last_updated_by_user_id'],
+    'access_card_log': [
+        'id', 'access_card_id', 'assigned_to_user_id', 'assigned_by_user_id'
+    ],
+    'access_node': ['id', 'last_accessed_user_id', 'device_id'],
+    'access_node_log': [
+        'id', 'user_id', 'access_card_id', 'access_node_id', 'device_id',
+        'created_by_user_id'
+    ],
+    'device': ['id'],
+    'device_assignment_log': [
+        'id', 'device_id', 'assigned_to_user_id', 'unassigned_from_user_id',
+        'assigned_by_user_id'
+    ],
+    'device_session': [
+        'id', 'user_id', 'access_node_id', 'device_id', 'login_log_id',
+        'logout_log_id'
+    ],
+    'device_usage_daily': ['id', 'device_id', 'access_node_id', 'user_id'],
+    'emerge_access_card_status_code_lookup': ['id'],
+    'token_blocklist': ['id'],
+    'user': ['id', 'last_updated_by_user_id'],
+    'user_access_card': [
+        'id', 'assigned_to_user_id', 'access_card_id', 'assigned_by_user_id'
+    ],
+    'user_access_log': ['id', 'user_id'],
+    'user_device': [
+        'id', 'device_id', 'assigned_to_user_id', 'assigned_by_user_id'
+    ],
+    'user_edit_log': ['id', 'user_id', 'updated_by_user_id'],
+}
+
+
+# values that aren't uuids are left as they are
+def uuid_blob(value):
+    try:
+        return uuid.UUID(value).bytes
+    except (TypeError, ValueError):
+        return value
+
+
+def uuid_text(value):
+    try:
+        return str(uuid.UUID(bytes=value))
+    except (TypeError, ValueError):
+        return value
+
+
+# rewrite every uuid value stored as from_type ('text' or 'blob') in place
+def convert_uuid_columns(function, from_type):
+    bind = op.get_bind()
+    bind.connection.driver_connection.create_function(
+        function.__name__, 1, function, deterministic=True
+    )
+    for table, columns in uuid_columns.items():
+        for column in columns:
+            op.execute(
+                'UPDATE "%s" SET %s = %s(%s) WHERE typeof(%s) = \'%s\''
+                % (table, column, function.__name__, column, column,
+                   from_type)
+            )
+
+
+def upgrade():
+    for table, index in redundant_indexes.items():
+        op.drop_index(index, table_name=table)
+
+    if op.get_bind().dialect.name == 'sqlite' \
+            and current_app.config.get('COMPACT_UUID_KEYS'):
+        convert_uuid_columns(uuid_blob, 'text')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        convert_uuid_columns(uuid_text, 'blob')
+
+    for table, index in redundant_indexes.items():
+        op.create_index(index, table, ['id'], unique=False)
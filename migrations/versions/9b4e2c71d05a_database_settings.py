@@ -0,0 +1,57 @@
+"""database settings
+
+Revision ID: 9b4e2c71d05a
+Revises: 270e8d46467d
+Create Date: 2026-10-18 17:02:14.603318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e2c71d05a'
+down_revision = '270e8d46467d'
+branch_labels = None
+depends_on = None
+
+
+# tables whose first key tells how the uuid keys are stored
+uuid_key_tables = ['user', 'device', 'access_card', 'access_node',
+                   'token_blocklist']
+
+
+# True when the uuid keys are stored as 16 byte blobs. An empty database
+# takes the format of COMPACT_UUID_KEYS, like the compact uuid keys migration
+def stored_compact_uuid_keys(bind):
+    for table in uuid_key_tables:
+        key_type = bind.execute(
+            sa.text('SELECT typeof(id) FROM "%s" LIMIT 1' % table)
+        ).scalar()
+        if key_type is not None:
+            return key_type == 'blob'
+    return bool(current_app.config.get('COMPACT_UUID_KEYS'))
+
+
+def upgrade():
+    op.create_table('database_setting',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('value', sa.String(length=255), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # the app refuses to start when TESLA_COMPACT_UUID_KEYS doesn't match
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        bind.execute(
+            sa.text(
+                'INSERT INTO database_setting (name, value) '
+                'VALUES (\'compact_uuid_keys\', :value)'
+            ),
+            {'value': '1' if stored_compact_uuid_keys(bind) else '0'}
+        )
+
+
+def downgrade():
+    op.drop_table('database_setting')
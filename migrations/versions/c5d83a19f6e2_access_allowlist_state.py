@@ -0,0 +1,53 @@
+"""access allowlist state
+
+Revision ID: c5d83a19f6e2
+Revises: 9b4e2c71d05a
+Create Date: 2026-10-18 21:40:52.118604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d83a19f6e2'
+down_revision = '9b4e2c71d05a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('access_allowlist_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # concurrent refreshes could add the same card to a device twice, keep
+    # the newest entry of each
+    op.execute(
+        'DELETE FROM access_allowlist_entry WHERE id IN ('
+        'SELECT a.id FROM access_allowlist_entry a '
+        'JOIN access_allowlist_entry b '
+        'ON b.device_id = a.device_id '
+        'AND b.card_number = a.card_number '
+        'AND b.facility_code = a.facility_code '
+        'AND (b.version > a.version '
+        'OR (b.version = a.version AND b.id > a.id)))'
+    )
+
+    with op.batch_alter_table('access_allowlist_entry', schema=None) as batch_op:
+        batch_op.create_index('ix_access_allowlist_entry_device_id_card_number_facility_code', ['device_id', 'card_number', 'facility_code'], unique=True)
+
+    # the version nodes already synced to carries on
+    op.execute(
+        'INSERT INTO access_allowlist_state (id, version) '
+        'SELECT 1, COALESCE(MAX(version), 0) FROM access_allowlist_entry'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('access_allowlist_entry', schema=None) as batch_op:
+        batch_op.drop_index('ix_access_allowlist_entry_device_id_card_number_facility_code')
+
+    op.drop_table('access_allowlist_state')
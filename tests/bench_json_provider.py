@@ -0,0 +1,100 @@
+# Serializing a 100 row report page with the JSON providers
+#
+# Not a test (pytest only collects test_*.py), run it by hand to compare
+# the orjson and standard library paths of FastJSONProvider with Flask's
+# own provider:
+#
+#   PYTHONPATH=. python tests/bench_json_provider.py [rows] [runs]
+#
+# The page has the rows of GET /api/reports/deviceAccess, with the enum and
+# datetime values the endpoints pass to jsonify(). Doesn't import the app,
+# so it needs no database.
+
+import sys
+import timeit
+import uuid
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from flask import Flask
+from app import json_provider
+from app.json_provider import FastJSONProvider
+from app.model_enums import AccessNodeScanActionEnum
+
+
+def report_page(rows):
+    created_at = datetime(2026, 10, 18, 9, 30, tzinfo=timezone.utc)
+    items = []
+    for i in range(rows):
+        items.append({
+            'userId': str(uuid.uuid4()),
+            'userFirstName': 'Member %d' % i,
+            'userLastName': 'Makerspace',
+            'accessCardId': str(uuid.uuid4()),
+            'accessNodeId': str(uuid.uuid4()),
+            'deviceId': str(uuid.uuid4()),
+            'deviceName': 'Laser cutter %d' % (i % 5),
+            'action': AccessNodeScanActionEnum.LOGIN
+            if i % 2 else AccessNodeScanActionEnum.LOGOUT,
+            'success': i % 7 != 0,
+            'createdByUserId': None,
+            'createdAt': (created_at - timedelta(minutes=i)).isoformat(),
+        })
+    return {'items': items, 'nextCursor': str(uuid.uuid4()), 'total': None}
+
+
+# microseconds per response of the best of 5 repeats
+def time_response(app, page, runs):
+    with app.test_request_context():
+        app.json.response(page)
+        seconds = min(timeit.repeat(
+            lambda: app.json.response(page),
+            number=runs,
+            repeat=5
+        ))
+    return seconds / runs * 1000000
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    page = report_page(rows)
+
+    flask_app = Flask('bench')
+    fast_app = Flask('bench')
+    fast_app.json = FastJSONProvider(fast_app)
+
+    results = [('flask DefaultJSONProvider', time_response(
+        flask_app,
+        page,
+        runs
+    ))]
+    orjson = json_provider.orjson
+    if orjson is not None:
+        results.append(('FastJSONProvider, orjson', time_response(
+            fast_app,
+            page,
+            runs
+        )))
+    json_provider.orjson = None
+    try:
+        results.append(('FastJSONProvider, json', time_response(
+            fast_app,
+            page,
+            runs
+        )))
+    finally:
+        json_provider.orjson = orjson
+
+    print('%d rows, best of 5 x %d responses' % (rows, runs))
+    baseline = results[0][1]
+    for name, microseconds in results:
+        print('%-28s %8.1f us  %5.2fx' % (
+            name,
+            microseconds,
+            baseline / microseconds
+        ))
+
+
+if __name__ == '__main__':
+    main()
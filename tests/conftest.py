@@ -0,0 +1,169 @@
+# Tests run against a throwaway SQLite database by default. Set
+# TESLA_TEST_POSTGRES_URL (e.g. postgresql://postgres@/tesla_test?host=...)
+# to run them against PostgreSQL instead, the tables are dropped and
+# created again for every test so don't point it at real data.
+#
+# The app reads its configuration when app.app is imported, so the
+# environment has to be set before that happens.
+
+import os
+import tempfile
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix='tesla-tests-')
+POSTGRES_URL = os.environ.get('TESLA_TEST_POSTGRES_URL')
+
+os.environ['TESLA_DATABASE_URL'] = POSTGRES_URL or \
+    'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ['TESLA_PASSWORD_HASH_WORKERS'] = '0'
+os.environ['TESLA_SLOW_QUERY_LOG'] = os.path.join(_tmp, 'slow_queries.log')
+os.environ['TESLA_PROFILE_DIR'] = os.path.join(_tmp, 'profiles')
+os.environ['TESLA_INSTRUMENTATION'] = '1'
+
+# imported first so test modules can import the rest of the app
+from app.app import app as flask_app  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    return flask_app
+
+
+# an empty database with all tables, once per backend. The postgresql run is
+# skipped unless TESLA_TEST_POSTGRES_URL is set and the sqlite run is skipped
+# when it is, the app can only be connected to one of them per process
+@pytest.fixture(params=['sqlite', 'postgresql'])
+def database(request, app):
+    from app.database import db
+    from app.cache.access_card_index import load_access_card_index
+    from app.cache.token_blocklist_cache import load_token_blocklist
+
+    if db.engine.dialect.name != request.param:
+        pytest.skip('the tests run against %s, see tests/conftest.py'
+                    % db.engine.dialect.name)
+
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    # PostgreSQL gives the recreated enum types new oids, connections that
+    # cached the old ones would fail
+    db.engine.dispose()
+    load_access_card_index()
+    load_token_blocklist()
+    db.session.remove()
+    yield db
+    db.session.remove()
+
+
+@pytest.fixture
+def client(app, database):
+    return app.test_client()
+
+
+# auth headers of the first (admin) user
+@pytest.fixture
+def admin(client):
+    client.post('/api/auth/register', json={
+        'username': 'admin',
+        'password': 'admin-password',
+        'firstName': 'Ada',
+        'lastName': 'Admin',
+    })
+    response = client.post('/api/auth/login', json={
+        'username': 'admin',
+        'password': 'admin-password',
+    })
+    assert response.status_code == 200, response.data
+    return {'Authorization': 'Bearer ' + response.json['accessToken']}
+
+
+def post(client, headers, url, body):
+    response = client.post(url, json=body, headers=headers)
+    assert response.status_code == 200, (url, response.data)
+    return response.json
+
+
+def create_user(client, headers, username, **fields):
+    body = {
+        'username': username,
+        'firstName': username.title(),
+        'lastName': 'Member',
+        'role': 'user',
+        'eMergeAccessLevel': 'full day access',
+        'password': 'member-password',
+        'status': 'active',
+    }
+    body.update(fields)
+    return post(client, headers, '/api/users', body)
+
+
+def create_device(client, headers, name, **fields):
+    body = {'type': 'machine', 'name': name, 'status': 'available'}
+    body.update(fields)
+    return post(client, headers, '/api/devices', body)
+
+
+def create_access_node(client, headers, name, device_id=''):
+    return post(client, headers, '/api/accessNodes', {
+        'type': 'machine',
+        'name': name,
+        'macAddress': name,
+        'deviceId': device_id,
+    })
+
+
+def create_access_card(client, headers, card_number, user_id=None):
+    card = post(client, headers, '/api/accessCards', {
+        'cardNumber': card_number,
+        'facilityCode': 46,
+        'cardType': 46,
+        'status': 'active',
+    })
+    if user_id:
+        post(
+            client,
+            headers,
+            '/api/accessCards/%s/assign' % card['id'],
+            {'userId': user_id}
+        )
+    return card
+
+
+def scan(client, headers, access_node_id, card_number, action='login'):
+    return post(
+        client,
+        headers,
+        '/api/accessNodes/%s/scan' % access_node_id,
+        {'accessCardNumber': card_number, 'action': action}
+    )
+
+
+# upload scans like an access node that was offline, returns the results
+def batch_scan(client, headers, access_node_id, scans):
+    return post(
+        client,
+        headers,
+        '/api/accessNodes/%s/scans' % access_node_id,
+        {'scans': scans}
+    )['scans']
+
+
+# seven scan logs newest first like the reports, five of them are at the
+# same time
+@pytest.fixture
+def scan_logs(client, admin):
+    user = create_user(client, admin, 'maker')
+    create_access_card(client, admin, 1234, user['id'])
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+    times = ['2026-01-02T10:00:00Z'] * 5 + \
+        ['2026-01-02T09:00:00Z', '2026-01-02T11:00:00Z']
+    results = batch_scan(client, admin, node['id'], [
+        {'accessCardNumber': 1234, 'action': 'login', 'scannedAt': time}
+        for time in times
+    ])
+    return sorted(
+        results,
+        key=lambda log: (log['createdAt'], log['id']),
+        reverse=True
+    )
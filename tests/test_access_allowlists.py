@@ -0,0 +1,99 @@
+# Access nodes download the full card allowlist of their device once and
+# then ask for the cards added and removed since the version they have.
+# Every change to the assignments gets one new version, a card that's no
+# longer allowed is kept as a removal and allowing it again reuses its row.
+
+from app.models import AccessAllowlistEntry
+from app.query.access_allowlists import refresh_access_allowlists
+from conftest import post, create_user, create_device, create_access_node, \
+    create_access_card
+
+
+def allowlist(client, headers, node_id):
+    response = client.get(
+        '/api/accessNodes/%s/allowlist' % node_id,
+        headers=headers
+    )
+    assert response.status_code == 200, response.data
+    return response.json
+
+
+def delta(client, headers, node_id, since):
+    response = client.get(
+        '/api/accessNodes/%s/allowlist/delta?since=%s' % (node_id, since),
+        headers=headers
+    )
+    assert response.status_code == 200, response.data
+    return response.json
+
+
+def card(number):
+    return {'cardNumber': number, 'facilityCode': 46}
+
+
+def test_allowlist_full_delta_and_revocations(app, client, admin):
+    maker = create_user(client, admin, 'maker')
+    welder = create_user(client, admin, 'welder')
+    create_access_card(client, admin, 1001, maker['id'])
+    create_access_card(client, admin, 1002, welder['id'])
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+
+    empty = allowlist(client, admin, node['id'])
+    assert empty['deviceId'] == device['id']
+    assert empty['cards'] == []
+
+    post(client, admin, '/api/devices/%s/assign' % device['id'],
+         {'userId': maker['id']})
+    full = allowlist(client, admin, node['id'])
+    assert full['version'] == empty['version'] + 1
+    assert full['cards'] == [card(1001)]
+
+    post(client, admin, '/api/devices/%s/assign' % device['id'],
+         {'userId': welder['id']})
+    added = delta(client, admin, node['id'], full['version'])
+    assert added['version'] == full['version'] + 1
+    assert added['added'] == [card(1002)]
+    assert added['removed'] == []
+
+    # revoking the maker's device access removes their card
+    response = client.delete(
+        '/api/devices/%s/unassign' % device['id'],
+        json={'userId': maker['id']},
+        headers=admin
+    )
+    assert response.status_code == 200, response.data
+    removed = delta(client, admin, node['id'], added['version'])
+    assert removed['version'] == added['version'] + 1
+    assert removed['added'] == []
+    assert removed['removed'] == [card(1001)]
+
+    # a node that missed both changes gets their net result
+    missed = delta(client, admin, node['id'], full['version'])
+    assert missed['added'] == [card(1002)]
+    assert missed['removed'] == [card(1001)]
+
+    assert allowlist(client, admin, node['id'])['cards'] == [card(1002)]
+
+    # nothing changed, no new version
+    with app.app_context():
+        assert refresh_access_allowlists() == removed['version']
+    assert delta(client, admin, node['id'], removed['version'])['added'] \
+        == []
+
+    # allowing the card again reuses its entry
+    post(client, admin, '/api/devices/%s/assign' % device['id'],
+         {'userId': maker['id']})
+    readded = delta(client, admin, node['id'], removed['version'])
+    assert readded['added'] == [card(1001)]
+    with app.app_context():
+        assert AccessAllowlistEntry.query.filter_by(card_number=1001) \
+            .count() == 1
+
+    # versions newer than the current one are refused
+    response = client.get(
+        '/api/accessNodes/%s/allowlist/delta?since=%s'
+        % (node['id'], readded['version'] + 1),
+        headers=admin
+    )
+    assert response.status_code == 422
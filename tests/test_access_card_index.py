@@ -0,0 +1,85 @@
+# The scan endpoint resolves cards from a process-local index. Changes made
+# outside this process's endpoints, e.g. by another API process, are picked
+# up by the scheduled reload.
+
+from app.cache import access_card_index
+from app.models import AccessCard, UserAccessCard
+from app.model_enums import AccessCardStatusEnum
+from app.scheduled_tasks.reload_access_card_index import \
+    reload_access_card_index
+from conftest import post, create_user, create_device, \
+    create_access_node, create_access_card
+
+
+# a card assigned the way another process would, straight in the database
+def assign_card_directly(database, card_number, user_id):
+    card = AccessCard(
+        card_number=card_number,
+        facility_code=46,
+        card_type=46,
+        status=AccessCardStatusEnum.ACTIVE,
+        last_updated_by_user_id=user_id
+    )
+    database.session.add(card)
+    database.session.flush()
+    database.session.add(UserAccessCard(
+        assigned_to_user_id=user_id,
+        access_card_id=card.id,
+        assigned_by_user_id=user_id
+    ))
+    database.session.commit()
+    return card.id
+
+
+def test_reload_finds_cards_written_elsewhere(client, admin, database):
+    user = create_user(client, admin, 'maker')
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+    create_access_card(client, admin, 1001, user['id'])
+    access_card_id = assign_card_directly(database, 1002, user['id'])
+
+    assert access_card_index.lookup_access_card(1001) is not None
+    assert access_card_index.lookup_access_card(1002) is None
+
+    reload_access_card_index()
+
+    entry = access_card_index.lookup_access_card(1002)
+    assert entry.access_card_id == access_card_id
+    scanned = post(client, admin, '/api/accessNodes/%s/scan' % node['id'], {
+        'accessCardNumber': 1002,
+        'action': 'login',
+    })
+    assert scanned['userId'] == user['id']
+
+
+def test_reload_overtaken_by_a_refresh(client, admin, database, monkeypatch):
+    user = create_user(client, admin, 'maker')
+    node = create_access_node(client, admin, 'node-lathe')
+    assign_card_directly(database, 1002, user['id'])
+    card_query = access_card_index._card_query
+
+    # an endpoint's refresh lands while the reload reads the database
+    def overtaken_card_query():
+        access_card_index.refresh_access_node(node['id'])
+        return card_query()
+
+    monkeypatch.setattr(
+        access_card_index,
+        '_card_query',
+        overtaken_card_query
+    )
+
+    assert access_card_index.load_access_card_index() is False
+    assert access_card_index.lookup_access_card(1002) is None
+
+
+def test_scan_with_a_list_card_number(client, admin):
+    node = create_access_node(client, admin, 'node-lathe')
+
+    response = client.post(
+        '/api/accessNodes/%s/scan' % node['id'],
+        json={'accessCardNumber': [1001], 'action': 'login'},
+        headers=admin
+    )
+
+    assert response.status_code == 422
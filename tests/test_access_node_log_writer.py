@@ -0,0 +1,101 @@
+# The access node log writer group-commits scan logs: rows queued together
+# are inserted with one statement, everything queued is written when it
+# stops, and a batch that fails is retried row by row so the good rows are
+# written once and only the bad row fails.
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy import func
+from app.background.access_node_log_writer import AccessNodeLogWriter
+from app.models import AccessNodeLog, uuid_str
+from app.model_enums import AccessNodeScanActionEnum
+from conftest import create_user, create_device, create_access_node, \
+    create_access_card
+
+
+@pytest.fixture
+def scan_values(client, admin):
+    user = create_user(client, admin, 'maker')
+    card = create_access_card(client, admin, 1234, user['id'])
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+    return {
+        'user_id': user['id'],
+        'access_card_id': card['id'],
+        'access_node_id': node['id'],
+        'device_id': device['id'],
+        'action': AccessNodeScanActionEnum.LOGIN,
+        'success': True,
+        'created_by_user_id': user['id'],
+    }
+
+
+@pytest.fixture
+def inserts(database):
+    batches = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO access_node_log'):
+            batches.append(len(parameters) if executemany else 1)
+
+    event.listen(database.engine, 'before_cursor_execute', count)
+    yield batches
+    event.remove(database.engine, 'before_cursor_execute', count)
+
+
+def log_ids(database):
+    database.session.remove()
+    return [
+        row.id for row in database.session.query(AccessNodeLog.id)
+        .order_by(AccessNodeLog.id)
+    ]
+
+
+def test_rows_queued_together_share_a_batch(app, database, scan_values,
+                                            inserts):
+    writer = AccessNodeLogWriter(app, batch_size=5, max_latency=1)
+    logs = [writer.write(wait=False, **scan_values) for i in range(12)]
+    writer.flush(timeout=10)
+    writer.stop()
+
+    assert inserts == [5, 5, 2]
+    assert log_ids(database) == sorted(log.id for log in logs)
+
+
+def test_stop_writes_everything_queued(app, database, scan_values):
+    # nothing would be committed for a minute without the stop
+    writer = AccessNodeLogWriter(app, batch_size=100, max_latency=60)
+    pending = [writer.enqueue(dict(scan_values, id=uuid_str()))
+               for i in range(3)]
+
+    writer.stop()
+
+    assert all(item.done.is_set() and item.error is None for item in pending)
+    assert len(log_ids(database)) == 3
+
+    # a scan after the stop is written right away
+    writer.write(**scan_values)
+    assert len(log_ids(database)) == 4
+
+
+def test_failed_batch_is_retried_row_by_row(app, database, scan_values,
+                                            inserts):
+    writer = AccessNodeLogWriter(app, batch_size=5, max_latency=1)
+    existing = writer.write(**scan_values)
+    del inserts[:]
+
+    good = [dict(scan_values, id=uuid_str()) for i in range(4)]
+    # the same id again, the batch's insert fails on the primary key
+    bad = dict(scan_values, id=existing.id)
+    pending = [writer.enqueue(values) for values in good[:2] + [bad]
+               + good[2:]]
+    writer.flush(timeout=10)
+    writer.stop()
+
+    assert inserts == [5, 1, 1, 1, 1, 1]
+    assert [item.error is None for item in pending] == \
+        [True, True, False, True, True]
+    assert log_ids(database) == sorted([existing.id] + [
+        values['id'] for values in good
+    ])
+    assert database.session.query(func.count(AccessNodeLog.id)).scalar() == 5
@@ -0,0 +1,58 @@
+# Scans an access node buffered while offline are uploaded in one request,
+# there is a result for every scan in the order they were sent and all the
+# logs are written with one insert in the request's transaction.
+
+import pytest
+from sqlalchemy import event
+from conftest import post, create_user, create_device, create_access_node, \
+    create_access_card
+
+
+@pytest.fixture
+def statements(database):
+    seen = []
+
+    def insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO access_node_log'):
+            seen.append(('insert', len(parameters) if executemany else 1))
+
+    def commit(conn):
+        seen.append(('commit', None))
+
+    event.listen(database.engine, 'before_cursor_execute', insert)
+    event.listen(database.engine, 'commit', commit)
+    yield seen
+    event.remove(database.engine, 'before_cursor_execute', insert)
+    event.remove(database.engine, 'commit', commit)
+
+
+def test_batch_scans(client, admin, statements):
+    user = create_user(client, admin, 'maker')
+    create_access_card(client, admin, 1234, user['id'])
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+    del statements[:]
+
+    scans = post(client, admin, '/api/accessNodes/%s/scans' % node['id'], {
+        'scans': [
+            {'accessCardNumber': 1234, 'action': 'login',
+             'scannedAt': '2026-01-02T10:00:00Z'},
+            {'accessCardNumber': 'not a number', 'action': 'login'},
+            {'accessCardNumber': 9999, 'action': 'login'},
+            {'accessCardNumber': 1234, 'action': 'logout',
+             'scannedAt': '2026-01-02T12:30:00+02:00'},
+        ],
+    })['scans']
+
+    assert [scan['index'] for scan in scans] == [0, 1, 2, 3]
+    assert scans[0]['action'] == 'login'
+    assert scans[0]['createdAt'] == '2026-01-02T10:00:00'
+    assert scans[1]['error'].startswith('invalid scan')
+    assert scans[2]['error'].startswith('unable to find a user')
+    assert scans[3]['action'] == 'logout'
+    assert scans[3]['createdAt'] == '2026-01-02T10:30:00'
+    assert scans[0]['userId'] == scans[3]['userId'] == user['id']
+
+    # both logs in one insert, committed with the request
+    assert statements[:2] == [('insert', 2), ('commit', None)]
+    assert [s for s in statements if s[0] == 'insert'] == [('insert', 2)]
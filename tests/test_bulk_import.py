@@ -0,0 +1,92 @@
+# CSV imports through POST /api/users/import: rows that aren't valid UTF-8
+# or CSV are reported with the other row errors, and the caches are
+# refreshed even when the import fails after some batches were committed.
+# Cards imported with the flask bulk-import command are found by the API
+# after its periodic access card index reload.
+
+import csv
+from app import bulk_import
+from app.cache.access_card_index import lookup_access_card
+from app.scheduled_tasks.reload_access_card_index import \
+    reload_access_card_index
+from conftest import create_device, create_access_node, scan
+
+
+def import_users(client, headers, data):
+    return client.post(
+        '/api/users/import',
+        headers=dict(headers, **{'Content-Type': 'text/csv'}),
+        data=data
+    )
+
+
+def test_unreadable_rows_are_reported(client, admin):
+    data = b'\r\n'.join([
+        b'username,firstName,cardNumber',
+        b'alice,Alice,1001',
+        b'bob,B\xe9b,1002',
+        b'carol,"' + b'x' * (csv.field_size_limit() + 1) + b'",1003',
+        b'dave,Dave,1004',
+    ]) + b'\r\n'
+
+    response = import_users(client, admin, data)
+
+    assert response.status_code == 200
+    assert response.json['rowCount'] == 4
+    assert response.json['created']['users'] == 2
+    assert [error['row'] for error in response.json['errors']] == [3, 4]
+    assert response.json['errors'][0]['error'] == 'the row is not valid UTF-8'
+    assert response.json['errors'][1]['error'] \
+        .startswith('unable to read the row')
+    assert lookup_access_card(1001) is not None
+    assert lookup_access_card(1004) is not None
+
+
+def test_header_not_valid_utf8(client, admin):
+    response = import_users(client, admin, b'user\xe9name\r\nalice\r\n')
+
+    assert response.status_code == 422
+
+
+def test_caches_refreshed_after_failure(client, admin, app, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMPORT_BATCH_SIZE', 1)
+    existing_cards = bulk_import._existing_cards
+    calls = []
+
+    def fail_second_batch(card_numbers):
+        calls.append(card_numbers)
+        if len(calls) > 1:
+            raise RuntimeError('database went away')
+        return existing_cards(card_numbers)
+
+    monkeypatch.setattr(bulk_import, '_existing_cards', fail_second_batch)
+
+    response = import_users(
+        client,
+        admin,
+        b'username,cardNumber\r\nalice,2001\r\nbob,2002\r\n'
+    )
+
+    assert response.status_code == 500
+    # alice's batch was committed before bob's failed
+    assert lookup_access_card(2001) is not None
+    assert lookup_access_card(2002) is None
+
+
+def test_cli_import_is_found_after_the_reload(app, client, admin, tmp_path):
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+    path = tmp_path / 'users.csv'
+    path.write_text('username,firstName,cardNumber\r\nalice,Alice,1001\r\n')
+
+    result = app.test_cli_runner().invoke(
+        args=['bulk-import', 'users', str(path), '--by', 'admin']
+    )
+    assert result.exit_code == 0, result.output
+    assert '1 users' in result.output
+
+    # the import ran in another process as far as the API knows
+    assert lookup_access_card(1001) is None
+    reload_access_card_index()
+    assert lookup_access_card(1001) is not None
+    assert scan(client, admin, node['id'], 1001)['success']
@@ -0,0 +1,45 @@
+# The uuid key format recorded by the database settings migration has to
+# match TESLA_COMPACT_UUID_KEYS, otherwise no key would be found.
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import text
+from app.database import apply_compact_uuid_keys
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'keys.sqlite'))
+    yield engine
+    engine.dispose()
+
+
+def record_format(engine, value):
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE database_setting '
+            '(name VARCHAR(64) PRIMARY KEY, value VARCHAR(255) NOT NULL)'
+        ))
+        conn.execute(text(
+            'INSERT INTO database_setting VALUES (\'compact_uuid_keys\', :v)'
+        ), {'v': value})
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_format_not_recorded(engine, enabled):
+    apply_compact_uuid_keys(engine, enabled)
+    assert engine.dialect.compact_uuid_keys is enabled
+
+
+@pytest.mark.parametrize('value,enabled', [('0', False), ('1', True)])
+def test_matching_format(engine, value, enabled):
+    record_format(engine, value)
+    apply_compact_uuid_keys(engine, enabled)
+    assert engine.dialect.compact_uuid_keys is enabled
+
+
+@pytest.mark.parametrize('value,enabled', [('0', True), ('1', False)])
+def test_mismatched_format(engine, value, enabled):
+    record_format(engine, value)
+    with pytest.raises(RuntimeError, match='TESLA_COMPACT_UUID_KEYS'):
+        apply_compact_uuid_keys(engine, enabled)
@@ -0,0 +1,94 @@
+# Last-Modified is the table's last change rounded up to the second, and
+# isn't sent until a second after that, so If-Modified-Since alone can't
+# get a 304 for a copy that's older than a change made in the same second.
+# The ETag comes from the table_version rows, so a change committed by
+# another server or the CLI is seen right away.
+
+import importlib
+import math
+import time
+from types import SimpleNamespace
+from werkzeug.http import http_date
+
+conditional_get = importlib.import_module('app.utils.conditional_get')
+
+
+def changed_at(monkeypatch, changed_at, now):
+    table_versions = conditional_get.table_versions
+
+    def versions(tables):
+        versions, _ = table_versions(tables)
+        return versions, changed_at
+
+    monkeypatch.setattr(conditional_get, 'table_versions', versions)
+    monkeypatch.setattr(conditional_get, 'time', SimpleNamespace(
+        time=lambda: now
+    ))
+
+
+def test_last_modified_rounded_up(client, admin, monkeypatch):
+    now = time.time()
+    changed = now - 10.5
+    changed_at(monkeypatch, changed, now)
+
+    response = client.get('/api/users', headers=admin)
+    assert response.status_code == 200
+    assert response.headers['Last-Modified'] == http_date(math.ceil(changed))
+
+    response = client.get('/api/users', headers=dict(admin, **{
+        'If-Modified-Since': response.headers['Last-Modified'],
+    }))
+    assert response.status_code == 304
+
+
+def test_no_last_modified_within_the_changed_second(client, admin,
+                                                    monkeypatch):
+    now = time.time()
+    changed = now - 0.5
+    changed_at(monkeypatch, changed, now)
+
+    response = client.get('/api/users', headers=dict(admin, **{
+        'If-Modified-Since': http_date(math.ceil(changed)),
+    }))
+    assert response.status_code == 200
+    assert 'Last-Modified' not in response.headers
+    assert response.headers['ETag']
+
+
+def test_change_from_another_connection(app, client, admin):
+    from app.database import db
+    from app.cache.table_versions import bump_table_versions
+
+    response = client.get('/api/users', headers=admin)
+    etag = response.headers['ETag']
+    response = client.get('/api/users', headers=dict(admin, **{
+        'If-None-Match': etag,
+    }))
+    assert response.status_code == 304
+
+    # what a commit on another server or in `flask bulk-import` does
+    with db.engine.begin() as connection:
+        bump_table_versions(connection, {'user'})
+
+    response = client.get('/api/users', headers=dict(admin, **{
+        'If-None-Match': etag,
+    }))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_rollback_keeps_etag(app, client, admin):
+    from app.database import db
+    from app.models import User
+
+    etag = client.get('/api/users', headers=admin).headers['ETag']
+    with app.app_context():
+        user = db.session.scalars(db.select(User)).first()
+        user.first_name = 'Rolled Back'
+        db.session.flush()
+        db.session.rollback()
+
+    response = client.get('/api/users', headers=dict(admin, **{
+        'If-None-Match': etag,
+    }))
+    assert response.status_code == 304
@@ -0,0 +1,102 @@
+# The detail views read their row, its small relations and the first page of
+# its history with a fixed number of statements (see the commit for
+# user-018). Count them with a before_cursor_execute listener before and
+# after adding history, so a view that loads a relation per row shows up.
+
+import pytest
+from sqlalchemy import event
+from conftest import post, create_user, create_device, create_access_node, \
+    create_access_card, scan
+
+detail_views = {
+    'users': 4,
+    'devices': 4,
+    'accessNodes': 3,
+    'accessCards': 3,
+}
+
+
+def count_statements(client, headers, database, url):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', count)
+    assert response.status_code == 200, (url, response.data)
+    return len(statements)
+
+
+def send(client, headers, method, url, body):
+    response = client.open(url, method=method, json=body, headers=headers)
+    assert response.status_code == 200, (url, response.data)
+
+
+# device assignments, access card assignments, scans and user edits
+def add_history(client, headers, ids, times):
+    for i in range(times):
+        user = create_user(client, headers, 'member%d' % len(ids['more']))
+        ids['more'].append(user['id'])
+        device_url = '/api/devices/%s' % ids['devices']
+        card_url = '/api/accessCards/%s' % ids['accessCards']
+        send(client, headers, 'POST', device_url + '/assign', {
+            'userId': user['id'],
+        })
+        send(client, headers, 'DELETE', card_url + '/unassign', {
+            'userId': ids['users'],
+        })
+        # unassigning deactivates the card
+        send(client, headers, 'PUT', card_url, {
+            'cardNumber': 1234,
+            'facilityCode': 46,
+            'cardType': 46,
+            'status': 'active',
+        })
+        send(client, headers, 'POST', card_url + '/assign', {
+            'userId': ids['users'],
+        })
+        scan(client, headers, ids['accessNodes'], 1234)
+        scan(client, headers, ids['accessNodes'], 1234, 'logout')
+        send(client, headers, 'PUT', '/api/users/%s' % ids['users'], {
+            'username': '',
+            'firstName': 'Maker %d' % i,
+            'lastName': '',
+            'role': '',
+            'eMergeAccessLevel': '',
+            'password': '',
+            'status': '',
+        })
+
+
+@pytest.fixture
+def ids(client, admin):
+    user = create_user(client, admin, 'maker')
+    card = create_access_card(client, admin, 1234, user['id'])
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+    post(client, admin, '/api/devices/%s/assign' % device['id'], {
+        'userId': user['id'],
+    })
+    scan(client, admin, node['id'], 1234)
+    return {
+        'users': user['id'],
+        'devices': device['id'],
+        'accessNodes': node['id'],
+        'accessCards': card['id'],
+        'more': [],
+    }
+
+
+@pytest.mark.parametrize('view', sorted(detail_views))
+def test_detail_view_statements(client, admin, database, ids, view):
+    url = '/api/%s/%s' % (view, ids[view])
+    before = count_statements(client, admin, database, url)
+
+    add_history(client, admin, ids, 3)
+
+    after = count_statements(client, admin, database, url)
+    assert (before, after) == (detail_views[view], detail_views[view])
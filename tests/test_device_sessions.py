@@ -0,0 +1,164 @@
+# Device sessions pair each login scan with the following logout scan of the
+# same user and access node. Refreshes only replay the logs from the state's
+# stale_from, scans uploaded late move it back so they are paired too.
+
+import csv
+import io
+from datetime import datetime
+import pytest
+from sqlalchemy import text
+from app.models import DeviceSession, DeviceSessionState
+from app.query.device_sessions import refresh_device_sessions
+from conftest import create_user, create_device, create_access_node, \
+    create_access_card, batch_scan
+
+
+@pytest.fixture
+def node_scan(client, admin):
+    user = create_user(client, admin, 'maker')
+    create_access_card(client, admin, 1234, user['id'])
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+
+    def node_scan(*scans):
+        return batch_scan(client, admin, node['id'], [
+            {
+                'accessCardNumber': 1234,
+                'action': action,
+                'scannedAt': '2026-01-02T%s:00Z' % time,
+            }
+            for action, time in scans
+        ])
+
+    return node_scan
+
+
+def sessions(database):
+    database.session.remove()
+    return [
+        (
+            session.started_at.strftime('%H:%M'),
+            session.ended_at.strftime('%H:%M') if session.ended_at else None,
+            session.duration_seconds,
+            session.in_progress,
+        )
+        for session in database.session.query(DeviceSession)
+        .order_by(DeviceSession.started_at)
+    ]
+
+
+def test_logins_are_paired_with_logouts(database, node_scan):
+    node_scan(
+        ('login', '10:00'),
+        ('logout', '11:00'),
+        # logged in again without logging out
+        ('login', '12:00'),
+        ('login', '13:00'),
+        ('logout', '13:15'),
+        # a logout without a session is ignored
+        ('logout', '13:30'),
+    )
+    assert refresh_device_sessions() == 3
+    assert sessions(database) == [
+        ('10:00', '11:00', 3600, False),
+        ('12:00', None, None, False),
+        ('13:00', '13:15', 900, False),
+    ]
+
+    # nothing new, a second run adds no sessions
+    assert refresh_device_sessions() == 0
+    assert len(sessions(database)) == 3
+
+
+def test_late_scans_are_replayed(database, node_scan):
+    node_scan(
+        ('login', '10:00'),
+        ('logout', '11:00'),
+        ('login', '12:00'),
+        ('login', '13:00'),
+    )
+    assert refresh_device_sessions() == 3
+    assert database.session.get(DeviceSessionState, 1).stale_from > \
+        datetime(2026, 1, 2, 13)
+
+    # a logout the node only uploaded now, older than the last run
+    node_scan(('logout', '12:30'))
+    database.session.remove()
+    assert database.session.get(DeviceSessionState, 1).stale_from == \
+        datetime(2026, 1, 2, 12, 30)
+
+    assert refresh_device_sessions() == 1
+    assert sessions(database) == [
+        ('10:00', '11:00', 3600, False),
+        ('12:00', '12:30', 1800, False),
+        ('13:00', None, None, True),
+    ]
+
+    assert refresh_device_sessions() == 0
+    assert len(sessions(database)) == 3
+
+
+# SQLite has no row locks, a second refresh waits for the first one there
+def test_refresh_is_skipped_while_another_one_runs(database):
+    if database.engine.dialect.name != 'postgresql':
+        pytest.skip('row locks are only taken on postgresql')
+
+    assert refresh_device_sessions() == 0
+    with database.engine.connect() as other:
+        other.execute(text('SELECT id FROM device_session_state FOR UPDATE'))
+        assert refresh_device_sessions() is None
+
+    assert refresh_device_sessions() == 0
+
+
+def test_sessions_report_pages(client, admin, database, node_scan):
+    node_scan(
+        ('login', '10:00'),
+        ('logout', '11:00'),
+        ('login', '12:00'),
+        ('logout', '12:30'),
+        ('login', '13:00'),
+    )
+    refresh_device_sessions()
+
+    response = client.get(
+        '/api/reports/deviceSessions?perPage=2',
+        headers=admin
+    )
+    assert response.status_code == 200, response.data
+    first = response.json
+    assert [s['startedAt'][11:16] for s in first['deviceSessions']] == \
+        ['13:00', '12:00']
+    assert 'total' not in first
+    assert 'totalDurationSeconds' not in first
+    assert first['refreshedAt']
+
+    response = client.get(
+        '/api/reports/deviceSessions',
+        query_string={'perPage': 2, 'cursor': first['nextCursor'],
+                      'count': 1},
+        headers=admin
+    )
+    assert response.status_code == 200, response.data
+    second = response.json
+    assert [s['startedAt'][11:16] for s in second['deviceSessions']] == \
+        ['10:00']
+    assert second['nextCursor'] is None
+    assert second['total'] == 3
+    assert second['totalDurationSeconds'] == 3600 + 1800
+
+    response = client.get(
+        '/api/reports/deviceSessions?stream=1&perPage=1',
+        headers=dict(admin, **{'Content-Type': 'text/csv'})
+    )
+    assert response.status_code == 200, response.data
+    header, *rows = list(csv.reader(io.StringIO(response.text)))
+    assert header[:3] == ['', 'id', 'userId']
+    assert [row[header.index('durationSeconds')] for row in rows] == \
+        ['', '1800', '3600']
+
+    response = client.get(
+        '/api/reports/deviceSessions?cursor=not a cursor!',
+        headers=admin
+    )
+    assert response.status_code == 422
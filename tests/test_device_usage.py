@@ -0,0 +1,76 @@
+from datetime import date
+import pytest
+from sqlalchemy import text
+from app.models import Device, DeviceUsageRollupState
+from app.query.device_usage import refresh_device_usage_rollups
+from conftest import create_user, create_device, create_access_node, \
+    create_access_card, scan, batch_scan
+
+
+def test_usage_summary_with_unnamed_devices(client, admin, database):
+    user = create_user(client, admin, 'maker')
+    create_access_card(client, admin, 1234, user['id'])
+    devices = []
+    for name in ['lathe', 'mill', 'laser']:
+        device = create_device(client, admin, name)
+        node = create_access_node(client, admin, 'node-' + name, device['id'])
+        scan(client, admin, node['id'], 1234)
+        devices.append(device)
+
+    # name is nullable, e.g. devices created before it was required
+    for device in devices[1:]:
+        database.session.get(Device, device['id']).name = None
+    database.session.commit()
+    refresh_device_usage_rollups()
+
+    response = client.get('/api/reports/deviceUsageSummary', headers=admin)
+    assert response.status_code == 200, response.data
+    rows = response.json['deviceUsageSummary']
+    assert [row['deviceName'] for row in rows] == [None, None, 'lathe']
+    assert {row['deviceId'] for row in rows} == \
+        {device['id'] for device in devices}
+
+
+def test_old_scans_mark_the_rollups_stale(client, admin, database):
+    user = create_user(client, admin, 'maker')
+    create_access_card(client, admin, 1234, user['id'])
+    device = create_device(client, admin, 'lathe')
+    node = create_access_node(client, admin, 'node-lathe', device['id'])
+    scan(client, admin, node['id'], 1234)
+    assert refresh_device_usage_rollups() == 1
+    assert database.session.get(DeviceUsageRollupState, 1).stale_from > \
+        date(2026, 1, 2)
+
+    # uploaded by a node that was offline since january
+    batch_scan(client, admin, node['id'], [{
+        'accessCardNumber': 1234,
+        'action': 'login',
+        'scannedAt': '2026-01-02T10:00:00Z',
+    }])
+    database.session.remove()
+    assert database.session.get(DeviceUsageRollupState, 1).stale_from == \
+        date(2026, 1, 2)
+
+    assert refresh_device_usage_rollups() == 2
+    response = client.get(
+        '/api/reports/deviceUsageSummary?startDate=2026-01-02'
+        '&endDate=2026-01-02',
+        headers=admin
+    )
+    assert [row['scans'] for row in response.json['deviceUsageSummary']] \
+        == [1]
+
+
+# SQLite has no row locks, a second refresh waits for the first one there
+def test_refresh_is_skipped_while_another_one_runs(database):
+    if database.engine.dialect.name != 'postgresql':
+        pytest.skip('row locks are only taken on postgresql')
+
+    assert refresh_device_usage_rollups() == 0
+    with database.engine.connect() as other:
+        other.execute(text(
+            'SELECT id FROM device_usage_rollup_state FOR UPDATE'
+        ))
+        assert refresh_device_usage_rollups() is None
+
+    assert refresh_device_usage_rollups() == 0
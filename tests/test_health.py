@@ -0,0 +1,47 @@
+# GET /api/health/ready keeps a node in the load balancer while its password
+# hash queue is full, unless failing on it was turned on.
+
+import pytest
+from app.background.password_hasher import get_password_hasher
+
+
+@pytest.fixture
+def full_password_hash_queue(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_WORKERS', 2)
+    monkeypatch.setattr(
+        get_password_hasher(),
+        'queue_depth',
+        lambda: app.config['PASSWORD_HASH_MAX_QUEUE']
+    )
+
+
+def test_ready(client):
+    response = client.get('/api/health/ready')
+
+    assert response.status_code == 200, response.json
+    assert response.json['status'] == 'ok'
+    assert response.json['warnings'] == []
+    assert response.json['queues']['passwordHashFull'] is False
+
+
+def test_full_password_hash_queue_is_a_warning(client,
+                                               full_password_hash_queue):
+    response = client.get('/api/health/ready')
+
+    assert response.status_code == 200, response.json
+    assert response.json['status'] == 'ok'
+    assert response.json['problems'] == []
+    assert len(response.json['warnings']) == 1
+    assert response.json['queues']['passwordHashFull'] is True
+
+
+def test_fail_on_full_password_hash_queue(client, app, monkeypatch,
+                                          full_password_hash_queue):
+    monkeypatch.setitem(app.config, 'HEALTH_FAIL_ON_PASSWORD_HASH_QUEUE', True)
+
+    response = client.get('/api/health/ready')
+
+    assert response.status_code == 503
+    assert response.json['status'] == 'degraded'
+    assert response.json['warnings'] == []
+    assert len(response.json['problems']) == 1
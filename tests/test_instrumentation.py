@@ -0,0 +1,62 @@
+# With TESLA_INSTRUMENTATION=1 responses get a Server-Timing header. After
+# request functions run in reverse order of registration, the commit has to
+# run before the profiler, the instrumentation and the metrics so their
+# durations include it.
+
+import importlib
+import time
+from app import instrumentation
+from app import metrics
+from app import profiling
+
+unit_of_work = importlib.import_module('app.unit_of_work')
+
+
+def server_timing(response):
+    return dict(
+        metric.split(';')[0:2]
+        for metric in response.headers['Server-Timing'].split(', ')
+    )
+
+
+def test_server_timing(client, admin):
+    response = client.get('/api/users', headers=admin)
+    assert response.status_code == 200
+
+    timing = server_timing(response)
+    assert list(timing)[:2] == ['total', 'sql']
+    assert float(timing['total'].split('=')[1]) > 0
+    assert 'statements"' in response.headers['Server-Timing']
+    assert 'user' in timing
+
+    response = client.get('/api/admin/requestStats', headers=admin)
+    assert response.json['enabled'] is True
+    endpoints = {
+        (row['method'], row['endpoint']): row
+        for row in response.json['endpoints']
+    }
+    assert endpoints[('GET', '/api/users')]['count'] >= 1
+
+
+def test_after_request_order(app):
+    hooks = app.after_request_funcs[None]
+    assert [hook.__module__ for hook in hooks[-4:]] == [
+        metrics.__name__,
+        instrumentation.__name__,
+        profiling.__name__,
+        'app.app',
+    ]
+    assert hooks[-1].__name__ == 'commit_unit_of_work'
+
+
+def test_total_includes_commit(client, admin, monkeypatch):
+    commit_request = unit_of_work.commit_request
+
+    def slow_commit(response):
+        time.sleep(0.05)
+        return commit_request(response)
+
+    monkeypatch.setattr(unit_of_work, 'commit_request', slow_commit)
+    response = client.get('/api/users', headers=admin)
+
+    assert float(server_timing(response)['total'].split('=')[1]) >= 50
@@ -0,0 +1,75 @@
+# Log reports are paged newest first. The opaque cursor returned with a
+# page continues after its last row, rows created in the same instant are
+# ordered by id so none of them is skipped or repeated across pages.
+
+import pytest
+from app.database import db
+from app.models import AccessNodeLog
+from app.query.pagination import paginate_by_created_at
+
+
+def report(client, headers, **args):
+    response = client.get(
+        '/api/reports/deviceAccess',
+        query_string=args,
+        headers=headers
+    )
+    return response
+
+
+def test_cursor_pages_keep_ties_in_order(app, scan_logs):
+    ids = []
+    cursor = None
+    with app.app_context():
+        while True:
+            rows, cursor, total = paginate_by_created_at(
+                db.session.query(AccessNodeLog),
+                AccessNodeLog,
+                per_page=2,
+                cursor=cursor
+            )
+            assert len(rows) <= 2
+            assert total is None
+            ids += [row.id for row in rows]
+            if not cursor:
+                break
+
+    assert ids == [log['id'] for log in scan_logs]
+
+
+def test_report_cursor_round_trip(client, admin, scan_logs):
+    pages = []
+    cursor = None
+    while True:
+        args = {'perPage': 3}
+        if cursor:
+            args['cursor'] = cursor
+        response = report(client, admin, **args)
+        assert response.status_code == 200, response.data
+        assert 'total' not in response.json
+        pages.append(response.json['deviceAccessLogs'])
+        cursor = response.json['nextCursor']
+        if not cursor:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [log['createdAt'] for page in pages for log in page] == \
+        [log['createdAt'] for log in scan_logs]
+
+    # page numbers still work and agree with the cursor
+    response = report(client, admin, perPage=3, page=2)
+    assert response.json['deviceAccessLogs'] == pages[1]
+
+
+def test_report_count(client, admin, scan_logs):
+    response = report(client, admin, perPage=2, count=1)
+    assert response.status_code == 200, response.data
+    assert response.json['total'] == 7
+    assert len(response.json['deviceAccessLogs']) == 2
+    assert response.json['nextCursor']
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor!', '====', 'YQ%'])
+def test_bad_cursor(client, admin, scan_logs, cursor):
+    response = report(client, admin, cursor=cursor)
+    assert response.status_code == 422, response.data
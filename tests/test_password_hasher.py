@@ -0,0 +1,68 @@
+# The password hash workers only run werkzeug.security. Under
+# `python -m app.serve` the parent's __main__ imports the app, a worker that
+# imported it again would open the database and start the scheduled tasks.
+# A worker imports the parent's __main__ module as __mp_main__.
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import app.serve
+from app.background.password_hasher import PasswordHasher, \
+    PasswordHasherBusy
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_queue=4, timeout=60)
+    yield hasher
+    hasher.stop()
+
+
+def test_workers_dont_import_the_app(hasher, monkeypatch):
+    monkeypatch.setitem(sys.modules, '__main__', app.serve)
+
+    main, imported = hasher._get_executor().submit(
+        eval,
+        "(__import__('sys').modules['__mp_main__'].__spec__.name, "
+        "[name for name in __import__('sys').modules "
+        "if name == 'app' or name.startswith('app.')])"
+    ).result(60)
+
+    assert main == 'app.serve'
+    assert 'app.app' not in imported
+    assert hasher.check(hasher.hash('password'), 'password')
+
+
+# a bulk import leaves max_queue - bulk_queue slots for logins
+def test_bulk_hashing_leaves_room_for_logins():
+    hasher = PasswordHasher(
+        workers=2,
+        max_queue=8,
+        timeout=60,
+        method='pbkdf2:sha256:100000'
+    )
+    bulk = threading.Thread(
+        target=hasher.hash_all,
+        args=[['password%d' % i for i in range(40)]]
+    )
+    login_slots = hasher.max_queue - hasher.bulk_queue
+    results = []
+
+    def login():
+        try:
+            results.append(bool(hasher.hash('password')))
+        except PasswordHasherBusy:
+            results.append(False)
+
+    try:
+        bulk.start()
+        with ThreadPoolExecutor(login_slots) as logins:
+            while bulk.is_alive() and len(results) < 60:
+                list(logins.map(lambda _: login(), range(login_slots)))
+        bulk.join()
+    finally:
+        hasher.stop()
+
+    assert results and all(results)
+    assert hasher.rejected_count() == 0
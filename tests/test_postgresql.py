@@ -0,0 +1,145 @@
+# The endpoints against PostgreSQL's native uuid and timestamptz columns
+# (migration 1c199c372585). Run with TESLA_TEST_POSTGRES_URL set (or `make
+# test-postgres`), on SQLite the same round trip covers the string ids and
+# naive timestamps. Every other test runs on both backends too.
+
+import csv
+import io
+import uuid
+from datetime import datetime
+import pytest
+from sqlalchemy import text
+from app.query.device_sessions import refresh_device_sessions
+from app.query.device_usage import refresh_device_usage_rollups
+from conftest import create_user, create_device, create_access_node, \
+    create_access_card, scan, post, batch_scan
+
+
+def test_native_column_types(database):
+    if database.engine.dialect.name != 'postgresql':
+        pytest.skip('postgresql only')
+    rows = database.session.execute(text(
+        "SELECT table_name, column_name, data_type "
+        "FROM information_schema.columns "
+        "WHERE (table_name, column_name) IN ("
+        "('user', 'id'), ('access_node_log', 'user_id'), "
+        "('access_node_log', 'created_at'), ('user', 'created_at'))"
+    )).all()
+    types = {(row[0], row[1]): row[2] for row in rows}
+    assert types == {
+        ('user', 'id'): 'uuid',
+        ('access_node_log', 'user_id'): 'uuid',
+        ('access_node_log', 'created_at'): 'timestamp with time zone',
+        ('user', 'created_at'): 'timestamp with time zone',
+    }
+
+
+def test_endpoints_round_trip_ids_and_timestamps(client, admin):
+    device = create_device(client, admin, 'laser')
+    node = create_access_node(client, admin, 'node-1', device['id'])
+    user = create_user(client, admin, 'maker')
+    card = create_access_card(client, admin, 1234, user['id'])
+    post(client, admin, '/api/devices/%s/assign' % device['id'],
+         {'userId': user['id']})
+    logged = scan(client, admin, node['id'], 1234)
+
+    assert str(uuid.UUID(logged['id'])) == logged['id']
+    assert logged['userId'] == user['id']
+    assert logged['accessCardId'] == card['id']
+    datetime.fromisoformat(logged['createdAt'])
+
+    batch_scan(client, admin, node['id'], [
+        {'accessCardNumber': 1234, 'action': 'logout',
+         'scannedAt': '2026-01-02T10:00:00Z'},
+    ])
+    refresh_device_usage_rollups()
+    refresh_device_sessions()
+
+    for url in [
+        '/api/users/%s' % user['id'],
+        '/api/devices/%s' % device['id'],
+        '/api/accessNodes/%s' % node['id'],
+        '/api/accessCards/%s' % card['id'],
+        '/api/users?eMergeAccessLevel=full%20day%20access',
+        '/api/accessNodes/%s/allowlist' % node['id'],
+        '/api/accessNodes/%s/allowlist/delta?since=0' % node['id'],
+        '/api/reports/deviceAccess?deviceId=%s' % device['id'],
+        '/api/reports/userAccess',
+        '/api/reports/userEdits',
+        '/api/reports/accessCardEdits?accessCardId=%s' % card['id'],
+        '/api/reports/deviceUsageSummary?groupBy=month',
+        '/api/reports/deviceSessions?userId=%s' % user['id'],
+    ]:
+        response = client.get(url, headers=admin)
+        assert response.status_code == 200, (url, response.data)
+
+    logs = client.get(
+        '/api/reports/deviceAccess?deviceId=%s' % device['id'],
+        headers=admin
+    ).json['deviceAccessLogs']
+    assert len(logs) == 2
+    assert logs[0]['userId'] == user['id']
+    assert logs[0]['accessNodeId'] == node['id']
+    assert datetime.fromisoformat(logs[0]['createdAt']) == \
+        datetime.fromisoformat(logged['createdAt'])
+    assert logs[1]['createdAt'] == '2026-01-02T10:00:00'
+
+    cards = client.get(
+        '/api/accessNodes/%s/allowlist' % node['id'],
+        headers=admin
+    ).json['cards']
+    assert cards == [{'cardNumber': 1234, 'facilityCode': 46}]
+
+
+# the name of the rows in each report response
+log_reports = {
+    'deviceAccess': 'deviceAccessLogs',
+    'userAccess': 'userAccessLogs',
+    'userEdits': 'userEditLogs',
+    'accessCardEdits': 'accessCardEditLogs',
+    'deviceSessions': 'deviceSessions',
+}
+
+
+# every page by cursor, the count and the csv stream agree
+@pytest.mark.parametrize('report', log_reports)
+def test_report_cursor_count_and_stream(client, admin, report):
+    device = create_device(client, admin, 'laser')
+    node = create_access_node(client, admin, 'node-1', device['id'])
+    for name in ['maker', 'welder']:
+        user = create_user(client, admin, name)
+        number = 1000 + len(name)
+        create_access_card(client, admin, number, user['id'])
+        scan(client, admin, node['id'], number)
+        scan(client, admin, node['id'], number, action='logout')
+        client.post('/api/auth/login', json={
+            'username': name,
+            'password': 'member-password',
+        })
+    refresh_device_sessions()
+
+    url = '/api/reports/%s' % report
+    response = client.get(url + '?perPage=1&count=1', headers=admin)
+    assert response.status_code == 200, response.data
+    total = response.json['total']
+    assert total >= 2
+
+    rows = response.json[log_reports[report]]
+    cursor = response.json['nextCursor']
+    while cursor:
+        response = client.get(
+            url,
+            query_string={'perPage': 1, 'cursor': cursor},
+            headers=admin
+        )
+        assert response.status_code == 200, response.data
+        rows += response.json[log_reports[report]]
+        cursor = response.json['nextCursor']
+    assert len(rows) == total
+
+    response = client.get(
+        url + '?stream=1',
+        headers=dict(admin, **{'Content-Type': 'text/csv'})
+    )
+    assert response.status_code == 200, response.data
+    assert len(list(csv.reader(io.StringIO(response.text)))) == total + 1
@@ -0,0 +1,22 @@
+# Profiles saved by earlier runs of the server aren't listed anymore, all
+# but the newest PROFILE_HISTORY of them are removed at startup.
+
+import os
+from app import profiling
+
+
+def test_prune_directory(tmp_path):
+    for i in range(8):
+        path = tmp_path / ('%d.pstats' % i)
+        path.write_bytes(b'')
+        os.utime(path, (1000 + i, 1000 + i))
+    (tmp_path / 'notes.txt').write_text('kept')
+
+    profiling._prune_directory(str(tmp_path), 3)
+
+    assert sorted(os.listdir(tmp_path)) == \
+        ['5.pstats', '6.pstats', '7.pstats', 'notes.txt']
+
+
+def test_prune_missing_directory(tmp_path):
+    profiling._prune_directory(str(tmp_path / 'profiles'), 3)
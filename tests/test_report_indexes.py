@@ -0,0 +1,82 @@
+# The report queries filter on one key and page by created_at, id. Check
+# with EXPLAIN QUERY PLAN that SQLite answers them from the composite
+# indexes of migration e7e7ee01edaf, so a change to a query function (or
+# to the indexes) that falls back to a scan and sort shows up here.
+
+import uuid
+import pytest
+from sqlalchemy import event
+from app.query.device_access_logs import device_access_logs_page
+from app.query.user_access_logs import user_access_logs_page
+from app.query.user_edit_logs import user_edit_logs_page
+
+
+@pytest.fixture
+def sqlite_database(database):
+    if database.engine.dialect.name != 'sqlite':
+        pytest.skip('EXPLAIN QUERY PLAN is sqlite only')
+    return database
+
+
+# the plan of the first statement run by function(params) that reads table
+def query_plan(database, table, function, params):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM %s' % table in statement:
+            statements.append((statement, parameters))
+
+    event.listen(database.engine, 'before_cursor_execute', capture)
+    try:
+        function(params)
+    finally:
+        event.remove(database.engine, 'before_cursor_execute', capture)
+    assert statements, 'no query on %s' % table
+
+    statement, parameters = statements[0]
+    with database.engine.connect() as connection:
+        rows = connection.exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + statement,
+            parameters
+        ).all()
+    return '\n'.join(row[3] for row in rows)
+
+
+@pytest.mark.parametrize('filter_name, index', [
+    ('device_id', 'ix_access_node_log_device_id_created_at_id'),
+    ('user_id', 'ix_access_node_log_user_id_created_at_id'),
+    ('access_node_id', 'ix_access_node_log_access_node_id_created_at_id'),
+    ('access_card_id', 'ix_access_node_log_access_card_id_created_at_id'),
+])
+def test_device_access_report_uses_composite_index(sqlite_database,
+                                                   filter_name, index):
+    plan = query_plan(
+        sqlite_database,
+        'access_node_log',
+        device_access_logs_page,
+        {filter_name: str(uuid.uuid4())}
+    )
+    assert 'INDEX %s' % index in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_user_access_report_uses_composite_index(sqlite_database):
+    plan = query_plan(
+        sqlite_database,
+        'user_access_log',
+        user_access_logs_page,
+        {'user_id': str(uuid.uuid4())}
+    )
+    assert 'INDEX ix_user_access_log_user_id_created_at_id' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
+
+
+def test_user_edits_report_uses_composite_index(sqlite_database):
+    plan = query_plan(
+        sqlite_database,
+        'user_edit_log',
+        user_edit_logs_page,
+        {'user_id': str(uuid.uuid4())}
+    )
+    assert 'INDEX ix_user_edit_log_user_id_created_at_id' in plan, plan
+    assert 'TEMP B-TREE' not in plan, plan
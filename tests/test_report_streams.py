@@ -0,0 +1,42 @@
+# With stream=1 a CSV report is written while the rows are read, in chunks
+# of STREAM_CHUNK_SIZE, and has every matching row whatever the page size.
+# The columns are the same as the CSV of a single page.
+
+import csv
+import io
+
+
+def csv_report(client, headers, **args):
+    response = client.get(
+        '/api/reports/deviceAccess',
+        query_string=args,
+        headers=dict(headers, **{'Content-Type': 'text/csv'})
+    )
+    assert response.status_code == 200, response.data
+    return response
+
+
+def test_stream_returns_every_row(app, client, admin, scan_logs,
+                                  monkeypatch):
+    monkeypatch.setitem(app.config, 'STREAM_CHUNK_SIZE', 2)
+
+    response = csv_report(client, admin, stream=1, perPage=2)
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == \
+        'attachment; filename=export.csv'
+
+    header, *rows = list(csv.reader(io.StringIO(response.text)))
+    assert header == [
+        '', 'userId', 'userFirstName', 'userLastName', 'accessCardId',
+        'accessNodeId', 'deviceId', 'deviceName', 'action', 'success',
+        'createdByUserId', 'createdAt',
+    ]
+    assert [row[0] for row in rows] == [str(i) for i in range(7)]
+    assert [row[11] for row in rows] == \
+        [log['createdAt'] for log in scan_logs]
+    assert {row[1] for row in rows} == {scan_logs[0]['userId']}
+    assert {row[8] for row in rows} == {'login'}
+
+    # the same rows as one page holding all of them
+    page = csv_report(client, admin, perPage=100)
+    assert list(csv.reader(io.StringIO(page.text))) == [header] + rows
@@ -0,0 +1,59 @@
+# Statements slower than TESLA_SLOW_QUERY_MS are written to the slow query
+# log as JSON lines with their parameters, the request that ran them and
+# their query plan. Password hashes are never logged.
+
+import json
+from app import slow_queries
+from conftest import create_user
+
+
+def read_log(app):
+    with open(app.config['SLOW_QUERY_LOG']) as log:
+        return [json.loads(line) for line in log if line.strip()]
+
+
+def test_slow_query_logged_with_plan(app, client, admin, monkeypatch):
+    monkeypatch.setattr(slow_queries, '_threshold_seconds', 0.0)
+
+    response = client.get('/api/users?slowQueryTest=1', headers=admin)
+    assert response.status_code == 200
+
+    entries = [
+        entry for entry in read_log(app)
+        if entry['url'] == '/api/users?slowQueryTest=1'
+        and entry['statement'].lstrip().startswith('SELECT')
+        and 'user' in entry['statement']
+    ]
+    assert entries
+    entry = entries[-1]
+    assert entry['method'] == 'GET'
+    assert entry['endpoint'] == '/api/users'
+    assert entry['durationMs'] >= 0
+    assert entry['plan']
+    assert all(isinstance(row, str) for row in entry['plan'])
+    assert 'planError' not in entry
+
+    response = client.get('/api/admin/slowQueries?endpoint=slowQueryTest',
+                          headers=admin)
+    assert response.json['slowQueries']
+    assert all(
+        recent['url'] == '/api/users?slowQueryTest=1'
+        for recent in response.json['slowQueries']
+    )
+
+
+def test_password_hash_not_logged(app, client, admin, monkeypatch):
+    monkeypatch.setattr(slow_queries, '_threshold_seconds', 0.0)
+
+    create_user(client, admin, 'hashed')
+
+    inserts = [
+        entry for entry in read_log(app)
+        if entry['endpoint'] == '/api/users'
+        and entry['statement'].lstrip().startswith('INSERT INTO')
+    ]
+    assert inserts
+    text = json.dumps(read_log(app))
+    assert '<password hash>' in text
+    assert 'member-password' not in text
+    assert 'pbkdf2:' not in text and 'scrypt:' not in text
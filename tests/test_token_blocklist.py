@@ -0,0 +1,57 @@
+# Revoked tokens are checked against an in-memory copy of TokenBlocklist,
+# tokens revoked by another process (only written to the table) are picked
+# up by the periodic reload.
+
+from datetime import datetime
+from datetime import timezone
+from flask_jwt_extended import decode_token
+from app.models import TokenBlocklist
+import app.cache.token_blocklist_cache as token_blocklist_cache
+
+
+def valid(client, headers):
+    return client.get('/api/auth/valid', headers=headers).status_code
+
+
+def revoke_elsewhere(app, database, headers):
+    token = headers['Authorization'].split(' ', 1)[1]
+    with app.app_context():
+        decoded = decode_token(token)
+        database.session.add(TokenBlocklist(
+            jti=decoded['jti'],
+            type=decoded['type'],
+            created_at=datetime.now(timezone.utc)
+        ))
+        database.session.commit()
+
+
+def test_revoked_elsewhere_is_rejected_after_reload(app, database, client,
+                                                    admin, monkeypatch):
+    assert valid(client, admin) == 200
+
+    monkeypatch.setattr(token_blocklist_cache, '_reload_at', float('inf'))
+    revoke_elsewhere(app, database, admin)
+    # the cache isn't due for a reload yet
+    assert valid(client, admin) == 200
+
+    monkeypatch.setattr(token_blocklist_cache, '_reload_at', 0)
+    assert valid(client, admin) == 401
+
+
+def test_logout_is_rejected_right_away(client, admin):
+    response = client.post('/api/auth/logout', json={}, headers=admin)
+    assert response.status_code == 200, response.data
+    assert valid(client, admin) == 401
+
+
+def test_failed_logout_leaves_the_token_valid(database, client, admin,
+                                              monkeypatch):
+    def fail():
+        raise RuntimeError('database is gone')
+
+    monkeypatch.setattr(database.session, 'commit', fail)
+    response = client.post('/api/auth/logout', json={}, headers=admin)
+    assert response.status_code == 500
+    monkeypatch.undo()
+
+    assert valid(client, admin) == 200
@@ -0,0 +1,134 @@
+# Each API request is one database transaction: commit_request() commits it
+# after a successful response and rolls it back after an error response,
+# and the after_commit() callbacks only run once the commit succeeded.
+
+import pytest
+from flask import Response
+from sqlalchemy import event
+from sqlalchemy import select
+from app.models import Device
+from app.unit_of_work import after_commit, commit_request
+import app.api.devices as devices_api
+
+
+@pytest.fixture
+def statements(database):
+    seen = []
+
+    def insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO'):
+            seen.append(statement.split()[2].strip('"'))
+
+    def commit(conn):
+        seen.append('COMMIT')
+
+    event.listen(database.engine, 'before_cursor_execute', insert)
+    event.listen(database.engine, 'commit', commit)
+    yield seen
+    event.remove(database.engine, 'before_cursor_execute', insert)
+    event.remove(database.engine, 'commit', commit)
+
+
+def device_names(database):
+    with database.engine.connect() as conn:
+        return conn.execute(select(Device.name)).scalars().all()
+
+
+def create_device(client, headers, name):
+    return client.post('/api/devices', headers=headers, json={
+        'type': 'machine',
+        'name': name,
+        'status': 'available',
+    })
+
+
+def test_request_is_committed_once_after_the_view(client, admin,
+                                                  statements):
+    del statements[:]
+    response = client.post('/api/users', headers=admin, json={
+        'username': 'maker',
+        'firstName': 'Maker',
+        'lastName': 'Member',
+        'role': 'user',
+        'eMergeAccessLevel': 'full day access',
+        'password': 'member-password',
+        'status': 'active',
+    })
+    assert response.status_code == 200, response.data
+
+    # the user and its edit log are written before the only commit
+    first_commit = statements.index('COMMIT')
+    assert 'user' in statements[:first_commit]
+    assert 'user_edit_log' in statements[:first_commit]
+    assert 'user' not in statements[first_commit:]
+
+
+def test_error_response_is_rolled_back(database, client, admin):
+    assert create_device(client, admin, 'lathe').status_code == 200
+
+    # the insert fails on the unique name, answered with a 409
+    assert create_device(client, admin, 'lathe').status_code == 409
+    assert device_names(database) == ['lathe']
+
+
+def test_exception_after_a_write_is_rolled_back(database, client, admin,
+                                                monkeypatch):
+    def fail(**kwargs):
+        raise RuntimeError('serializing failed')
+
+    # the device is flushed before the response fails
+    monkeypatch.setattr(devices_api, 'jsonify', fail)
+    assert create_device(client, admin, 'lathe').status_code == 500
+    monkeypatch.undo()
+
+    assert device_names(database) == []
+
+
+def test_callbacks_run_after_the_commit(app, database):
+    seen = []
+
+    def saved(name):
+        seen.append((name, device_names(database)))
+
+    with app.test_request_context():
+        database.session.add(Device(type='machine', name='lathe'))
+        after_commit(saved, 'lathe')
+        # queued once however often it's asked for
+        after_commit(saved, 'lathe')
+        response = commit_request(Response(status=200))
+
+    assert response.status_code == 200
+    assert seen == [('lathe', ['lathe'])]
+
+
+def test_callbacks_are_dropped_on_rollback(app, database):
+    seen = []
+
+    with app.test_request_context():
+        database.session.add(Device(type='machine', name='lathe'))
+        after_commit(seen.append, 'lathe')
+        response = commit_request(Response(status=422))
+
+    assert response.status_code == 422
+    assert seen == []
+    assert device_names(database) == []
+
+
+def test_failed_commit_answers_500_without_callbacks(app, database,
+                                                     monkeypatch):
+    seen = []
+
+    def fail():
+        raise RuntimeError('disk full')
+
+    with app.test_request_context():
+        database.session.add(Device(type='machine', name='lathe'))
+        after_commit(seen.append, 'lathe')
+        monkeypatch.setattr(database.session, 'commit', fail)
+        response = commit_request(Response(status=200))
+        monkeypatch.undo()
+
+    assert response.status_code == 500
+    assert response.json['description'] == 'an unknown error occurred'
+    assert seen == []
+    assert device_names(database) == []